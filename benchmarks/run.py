@@ -0,0 +1,407 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# run -- benchmarks of lazytools on synthetic inputs
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lazycopy  # noqa: E402
+import lazydiff  # noqa: E402
+import lazyhttp  # noqa: E402
+import lazyoutput  # noqa: E402
+import lazystats  # noqa: E402
+import lazyup  # noqa: E402
+import lazyvcs  # noqa: E402
+import synthetic  # noqa: E402
+
+SIZES = (100, 1000, 10000, 50000)
+BENCHMARKS = {}
+# Benchmarks taking no input, run once whatever the sizes
+UNSIZED = set()
+
+
+def benchmark(name, sized=True):
+    """Register setup(size, workdir) returning the function to time"""
+    def register(setup):
+        BENCHMARKS[name] = setup
+        if not sized:
+            UNSIZED.add(name)
+        return setup
+    return register
+
+
+def _stream(text):
+    return io.BytesIO(text.encode('utf-8'))
+
+
+@benchmark('stats_parse')
+def stats_parse(size, workdir):
+    # All rows of a stats page: untranslated tables and outdated table
+    text = synthetic.stats_page(size)
+
+    def run():
+        return sum(1 for _ in lazystats.iter_rows(_stream(text),
+                                                  outdated=True))
+    return run
+
+
+@benchmark('lazyup_rows')
+def lazyup_rows(size, workdir):
+    # Table of outdated translations as lazyup reads it
+    text = synthetic.stats_page(size)
+
+    def run():
+        rows = lazystats.iter_rows(_stream(text), (), outdated=True)
+        return sum(1 for _ in lazyup.outdated_rows(rows))
+    return run
+
+
+@benchmark('sort_rows')
+def sort_rows(size, workdir):
+    rows = list(lazystats.iter_rows(_stream(synthetic.stats_page(size))))
+
+    def run():
+        return len(lazystats.sort_rows(rows, lambda e: (e.size, e.path)))
+    return run
+
+
+@benchmark('top_rows')
+def top_rows(size, workdir):
+    rows = list(lazystats.iter_rows(_stream(synthetic.stats_page(size))))
+
+    def run():
+        return len(lazystats.sort_rows(rows, lambda e: (e.size, e.path),
+                                       top=20))
+    return run
+
+
+class _Fetch(object):
+    """Fetch a page from a local stand-in server and read its rows"""
+
+    def __init__(self, size, workdir, cache_mode):
+        self.server = synthetic.StatsServer({
+            'russian': synthetic.stats_page(size)})
+        self.cache = None
+        if cache_mode:
+            max_age = 0 if cache_mode == 'revalidate' else 3600
+            self.cache = lazyhttp.HTTPCache(os.path.join(workdir, 'cache'),
+                                            max_age)
+            self()
+
+    def __call__(self):
+        with lazystats.fetch('russian', self.server.base_url,
+                             self.cache) as page:
+            return sum(1 for _ in lazystats.iter_rows(page, outdated=True))
+
+    def close(self):
+        self.server.close()
+
+
+@benchmark('fetch')
+def fetch(size, workdir):
+    return _Fetch(size, workdir, None)
+
+
+@benchmark('fetch_cached')
+def fetch_cached(size, workdir):
+    return _Fetch(size, workdir, 'fresh')
+
+
+@benchmark('fetch_revalidated')
+def fetch_revalidated(size, workdir):
+    return _Fetch(size, workdir, 'revalidate')
+
+
+def _config(maintainer='Benchmark'):
+    # Just what Page and copy_original look at
+    return types.SimpleNamespace(target_lang='russian', lang_code='ru',
+                                 temp_dir=tempfile.gettempdir(),
+                                 maintainer=maintainer,
+                                 metadata=lazyvcs.CVSMetadata())
+
+
+@benchmark('copy_original')
+def copy_original(size, workdir):
+    # One generated page of size lines
+    os.makedirs(os.path.join('english', 'big', 'CVS'))
+    os.makedirs(os.path.join('russian', 'big'))
+    with open(os.path.join('english', 'big', 'page.wml'), 'w') as page:
+        page.write(synthetic.wml_page(size))
+    with open(os.path.join('english', 'big', 'CVS', 'Entries'),
+              'w') as entries:
+        entries.write('/page.wml/1.42/Mon Jan  1 00:00:00 2024//\n')
+    page = lazycopy.Page(_config(), 'english/big/page.wml')
+
+    def run():
+        lazycopy.copy_original(page)
+    return run
+
+
+@benchmark('revision_number')
+def revision_number(size, workdir):
+    # Revisions of size pages in a CVS checkout, cold metadata index
+    paths = synthetic.make_tree('.', size, page_lines=3)
+
+    def run():
+        config = _config()
+        for path in paths:
+            lazycopy.Page(config, path).revision_number()
+    return run
+
+
+@benchmark('make_pseudolink')
+def make_pseudolink(size, workdir):
+    # List file with half the entries, the other half is added
+    entries = synthetic.list_entries(size)
+    list_file = os.path.join(workdir, 'list')
+    first = str(lazycopy.PseudoURL(entries[:size // 2])) + '\n'
+
+    def run():
+        with open(list_file, 'w') as existing:
+            existing.write(first)
+        with contextlib.redirect_stdout(io.StringIO()):
+            lazycopy.make_pseudolink(list_file, entries[size // 2:])
+    return run
+
+
+@benchmark('unified_diff')
+def unified_diff(size, workdir):
+    # Patch of a page of size lines with 1% of them changed
+    text = synthetic.wml_page(size)
+    with open('old.wml', 'w') as old:
+        old.write(text)
+    with open('new.wml', 'w') as new:
+        new.write(synthetic.edited(text))
+    options = lazydiff.parse_diff_args(['-u'])
+
+    def run():
+        return lazydiff.count(lazydiff.diff_lines('old.wml', 'new.wml',
+                                                  options))
+    return run
+
+
+class _GitDiff(object):
+    """Size of git diff of a page of size lines edited in 2% of them
+
+    The diff is computed in-process from blobs read through git cat-file
+    (as lazyup does with one job, whatever the length of the page) or by
+    running git diff, to show where one beats the other.
+    """
+
+    def __init__(self, size, workdir, in_process):
+        def git(*args):
+            subprocess.run(['git'] + list(args), check=True,
+                           stdout=subprocess.DEVNULL)
+        git('init', '-q')
+        git('config', 'user.email', 'benchmark@example.org')
+        git('config', 'user.name', 'Benchmark')
+        os.makedirs('english')
+        text = synthetic.wml_page(size)
+        for step in (text, synthetic.edited(text, 0.02)):
+            with open(os.path.join('english', 'page.wml'), 'w') as page:
+                page.write(step)
+            git('add', 'english')
+            git('commit', '-q', '-m', 'page')
+        self.command = 'git diff HEAD~1..HEAD -- english/page.wml'
+        self.sizer = lazyup.DiffSizer(in_process)
+        self.in_process = in_process
+
+    def __call__(self):
+        if not self.in_process:
+            return lazyup.diff_size(self.command)
+        sizer = self.sizer
+        blobs = [sizer.blob(revision, 'english/page.wml')
+                 for revision in ('HEAD~1', 'HEAD')]
+        return lazydiff.count(lazydiff.git_diff_lines(
+            'english/page.wml', blobs[0], blobs[1], sizer.abbrev,
+            sizer.shorten))
+
+    def close(self):
+        self.sizer.close()
+
+
+@benchmark('diff_in_process')
+def diff_in_process(size, workdir):
+    return _GitDiff(size, workdir, True)
+
+
+@benchmark('diff_git')
+def diff_git(size, workdir):
+    return _GitDiff(size, workdir, False)
+
+
+def _writer(output_format):
+    # Entries of lazyup written in output_format to /dev/null
+    def setup(size, workdir):
+        rows = lazystats.Rows(lazyup.COLUMNS, (
+            (path, num % 300, num * 37 % 9000,
+             'git diff 1234567890..0987654321 -- english/' + path)
+            for num, path in enumerate(synthetic.page_paths(size))))
+        names = [name for name, _ in lazyup.COLUMNS]
+
+        def run():
+            with open(os.devnull, 'w') as output:
+                writer = lazyoutput.Writer(output, output_format, names,
+                                           sequence=list)
+                writer.write('russian', rows)
+                writer.close()
+        return run
+    return setup
+
+
+for _FORMAT in lazyoutput.FORMATS:
+    benchmark('write_' + _FORMAT)(_writer(_FORMAT))
+
+
+def _command(*args):
+    # Start of a fresh interpreter, the way wrappers run the tools
+    command = [sys.executable] + list(args)
+
+    def run():
+        subprocess.run(command, stdout=subprocess.DEVNULL, check=True)
+    return run
+
+
+@benchmark('startup_todo', sized=False)
+def startup_todo(size, workdir):
+    return _command(os.path.join(ROOT, 'lazytodo.py'), '--help')
+
+
+@benchmark('startup_up', sized=False)
+def startup_up(size, workdir):
+    return _command(os.path.join(ROOT, 'lazyup.py'), '--help')
+
+
+@benchmark('startup_copy', sized=False)
+def startup_copy(size, workdir):
+    return _command(os.path.join(ROOT, 'lazycopy.py'), '--help')
+
+
+@benchmark('startup_lazytools', sized=False)
+def startup_lazytools(size, workdir):
+    return _command(os.path.join(ROOT, 'lazytools.py'), 'up', '--help')
+
+
+@benchmark('import_tools', sized=False)
+def import_tools(size, workdir):
+    # Modules of all tools, as a program using them as a library would
+    return _command('-c', 'import sys; sys.path.insert(0, %r); '
+                    'import lazycopy, lazytodo, lazyup' % ROOT)
+
+
+def measure(name, size, repeat):
+    """Set up and time benchmark name, return its result record"""
+    workdir = tempfile.mkdtemp(prefix='lazybench-')
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        start = time.perf_counter()
+        run = BENCHMARKS[name](size, workdir)
+        setup = time.perf_counter() - start
+        times = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            run()
+            times.append(time.perf_counter() - start)
+        if hasattr(run, 'close'):
+            run.close()
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir)
+    return {'name': name, 'size': size, 'repeat': repeat,
+            'setup': setup, 'min': min(times),
+            'median': statistics.median(times),
+            'mean': statistics.mean(times)}
+
+
+def compare(results, baseline):
+    """Print median times of results next to those of baseline"""
+    old = dict(((result['name'], result['size']), result['median'])
+               for result in baseline['results'])
+    for result in results:
+        before = old.get((result['name'], result['size']))
+        line = '%-18s %6d %10.4fs' % (result['name'], result['size'],
+                                      result['median'])
+        if before:
+            line += ' %10.4fs %6.2fx' % (before, before / result['median'])
+        print(line)
+
+
+if __name__ == '__main__':
+    PARSER = argparse.ArgumentParser(description="Time lazytools on "
+                                     "synthetic stats pages, webwml trees "
+                                     "and list files")
+    PARSER.add_argument('benchmarks', metavar='name', type=str, nargs='*',
+                        help='Run only these benchmarks (default: all of '
+                        'them: ' + ', '.join(BENCHMARKS) + ')')
+    PARSER.add_argument('-s', '--sizes', metavar='N,...', type=str,
+                        default=','.join(str(size) for size in SIZES),
+                        help='Rows, files, lines or entries of inputs '
+                        '(default: %(default)s)')
+    PARSER.add_argument('-r', '--repeat', metavar='N', type=int, default=3,
+                        help='Time each benchmark N times '
+                        '(default: %(default)s)')
+    PARSER.add_argument('-o', '--output', metavar='FILE', type=str,
+                        help='Write results as JSON to FILE')
+    PARSER.add_argument('-c', '--compare', metavar='FILE', type=str,
+                        help='Show speedup against results in FILE')
+
+    ARGS = PARSER.parse_args()
+
+    NAMES = ARGS.benchmarks or list(BENCHMARKS)
+    for NAME in NAMES:
+        if NAME not in BENCHMARKS:
+            PARSER.error('unknown benchmark ' + NAME)
+    SIZES = [int(size) for size in ARGS.sizes.split(',') if size]
+
+    RESULTS = []
+    for NAME in NAMES:
+        for SIZE in ([0] if NAME in UNSIZED else SIZES):
+            RESULT = measure(NAME, SIZE, max(ARGS.repeat, 1))
+            RESULTS.append(RESULT)
+            if not ARGS.compare:
+                print('%-18s %6d %10.4fs' % (NAME, SIZE, RESULT['median']),
+                      flush=True)
+
+    REPORT = {'version': 1,
+              'created': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+              'python': platform.python_version(),
+              'platform': platform.platform(),
+              'results': RESULTS}
+    if ARGS.compare:
+        with open(ARGS.compare) as baseline:
+            compare(RESULTS, json.load(baseline))
+    if ARGS.output:
+        with open(ARGS.output, 'w') as output:
+            json.dump(REPORT, output, indent=2)
+            output.write('\n')
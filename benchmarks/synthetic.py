@@ -0,0 +1,204 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# synthetic -- generated inputs for lazytools benchmarks
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import hashlib
+import http.server
+import os
+import random
+import threading
+
+WORDS = ('debian', 'release', 'security', 'mirror', 'ports', 'news',
+         'events', 'devel', 'website', 'translation', 'intro', 'social',
+         'contract', 'partners', 'vote', 'users', 'consultants', 'l10n')
+SECTIONS = ('untranslated', 'untranslated-news', 'untranslated-user',
+            'untranslated-l10n')
+ORIGINAL_NEWER = 'The original is newer than this translation'
+
+
+def page_paths(count, seed=0):
+    """Return count distinct webwml page paths like 'News/2019/foo.wml'"""
+    rand = random.Random(seed)
+    paths = []
+    for num in range(count):
+        depth = rand.randint(1, 3)
+        dirs = [rand.choice(WORDS) for _ in range(depth - 1)]
+        if rand.random() < 0.3:
+            dirs = ['News', str(1997 + num % 28)]
+        paths.append('/'.join(dirs + ['%s%d.wml' % (rand.choice(WORDS),
+                                                    num)]))
+    return paths
+
+
+def stats_page(rows, seed=0):
+    """Return HTML of a stats page with rows untranslated and outdated rows
+
+    The layout follows the pages at www.debian.org/devel/website/stats:
+    one table per kind of untranslated pages with sizes aligned right
+    and a table of outdated translations with diff commands.
+    """
+    rand = random.Random(seed)
+    paths = page_paths(rows, seed)
+    out = ['<html><head><title>Translation statistics</title></head>\n'
+           '<body><h1>Translation statistics</h1>\n']
+    for num, section in enumerate(SECTIONS):
+        out.append('<h2><a name="%s" id="%s">Untranslated</a></h2>\n'
+                   '<table summary="Untranslated pages">\n'
+                   '<tr><th>File</th><th>Size</th></tr>\n' %
+                   (section, section))
+        for path in paths[num::len(SECTIONS)]:
+            out.append('<tr><td><a title="%s" href="/%s">%s</a></td>'
+                       '<td align="right">%d</td></tr>\n' %
+                       (path, path[:-4], path, rand.randint(100, 90000)))
+        out.append('</table>\n')
+    out.append('<table summary="Outdated translations">\n'
+               '<tr><th>File</th><th>Diff</th><th>Log</th></tr>\n')
+    for path in paths:
+        old = hashlib.sha1(path.encode('utf-8')).hexdigest()[:10]
+        new = hashlib.sha1(old.encode('ascii')).hexdigest()[:10]
+        status = ORIGINAL_NEWER if rand.random() < 0.8 else \
+            'Wrong translation version'
+        out.append('<tr><td>%s</td><td>git diff %s..%s -- english/%s</td>'
+                   '<td><a title="%s" href="#">log</a></td></tr>\n' %
+                   (path, old, new, path, status))
+    out.append('</table>\n</body></html>\n')
+    return ''.join(out)
+
+
+def index_page(languages):
+    """Return HTML of the stats index page linking to languages"""
+    return '<html><body><ul>\n' + ''.join(
+        '<li><a href="%s">%s</a></li>\n' % (language, language)
+        for language in languages) + '</ul></body></html>\n'
+
+
+def wml_page(lines, seed=0):
+    """Return text of a page with lines lines after a short header"""
+    rand = random.Random(seed)
+    out = ['#use wml::debian::template title="Synthetic page"\n',
+           '#use wml::debian::toc\n']
+    for num in range(max(lines - 2, 0)):
+        out.append('<p>%s %s %d</p>\n' % (rand.choice(WORDS),
+                                         rand.choice(WORDS), num))
+    return ''.join(out)
+
+
+def edited(text, ratio=0.01, seed=0):
+    """Return text with about ratio of its lines changed"""
+    rand = random.Random(seed)
+    lines = text.split('\n')
+    for num in range(len(lines)):
+        if rand.random() < ratio:
+            lines[num] = '<p>changed %s</p>' % rand.choice(WORDS)
+    return '\n'.join(lines)
+
+
+def make_tree(root, files, per_directory=100, page_lines=20, seed=0):
+    """Create webwml checkout with files English pages under root
+
+    Every directory gets CVS/Entries, CVS/Root and CVS/Repository as a
+    CVS checkout has. Returns list of paths of pages relative to root.
+    """
+    paths = []
+    for start in range(0, files, per_directory):
+        directory = os.path.join('english', 'dir%d' % (start //
+                                                       per_directory))
+        os.makedirs(os.path.join(root, directory, 'CVS'), exist_ok=True)
+        entries = []
+        for num in range(start, min(start + per_directory, files)):
+            name = 'page%d.wml' % num
+            with open(os.path.join(root, directory, name), 'w') as page:
+                page.write(wml_page(page_lines, seed + num))
+            entries.append('/%s/1.%d/Mon Jan  1 00:00:00 2024//\n' %
+                           (name, num % 97 + 1))
+            paths.append(os.path.join(directory, name))
+        with open(os.path.join(root, directory, 'CVS', 'Entries'),
+                  'w') as entries_file:
+            entries_file.writelines(entries)
+            entries_file.write('D\n')
+        with open(os.path.join(root, directory, 'CVS', 'Root'),
+                  'w') as root_file:
+            root_file.write(':pserver:anonymous@cvs.debian.org:/cvs/webwml\n')
+        with open(os.path.join(root, directory, 'CVS', 'Repository'),
+                  'w') as repository_file:
+            repository_file.write('webwml/' + directory + '\n')
+    return paths
+
+
+def list_entries(count, seed=0):
+    """Return count entries of a list file, paths below the language"""
+    return page_paths(count, seed)
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        body = self.server.pages.get(self.path)
+        if body is None:
+            self.send_response(404)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        if self.headers.get('If-None-Match') == etag:
+            self.send_response(304)
+            self.send_header('ETag', etag)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('ETag', etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class StatsServer(object):
+    """Local HTTP server standing in for www.debian.org stats pages
+
+    Pages are served with ETags and answer conditional requests with
+    304, so the fetch and cache paths can be measured offline.
+    """
+
+    def __init__(self, pages=None):
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                      _Handler)
+        self.server.daemon_threads = True
+        self.server.pages = {}
+        for name, text in (pages or {}).items():
+            self.add(name, text)
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       daemon=True)
+        self.thread.start()
+
+    @property
+    def base_url(self):
+        return 'http://%s:%d/' % self.server.server_address
+
+    def add(self, name, text):
+        self.server.pages['/' + name] = text.encode('utf-8')
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,164 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazyclient -- client of the lazytools serve daemon
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import os
+
+import lazyhttp
+
+# json and socket are imported when a request is sent, tools not finding
+# a daemon running do not load them
+
+# Requests and answers are single lines of JSON, one request per connection
+SOCKET = os.environ.get('LAZYTOOLS_SOCKET') or os.path.join(
+    os.environ.get('XDG_RUNTIME_DIR') or lazyhttp.CACHE_DIR, 'lazytools.sock')
+TIMEOUT = 600
+PING_TIMEOUT = 5
+
+# Options (and their defaults) only a run doing its own work can honour,
+# the daemon keeps its own cache of pages and of diff sizes
+LOCAL_OPTIONS = {
+    'offline': False,
+    'no_http_cache': False,
+    'cache_dir': lazyhttp.CACHE_DIR,
+    'no_cache': False,
+    'rebuild_cache': False,
+    'verbose': False,
+}
+
+
+class DaemonError(OSError):
+    """Raised when the daemon answers a request with an error"""
+
+
+class Client(object):
+    """Client sending requests to lazytools serve over its Unix socket
+
+    Every request is sent over a connection of its own, so a client can
+    be shared by threads working on several languages at once.
+    """
+
+    def __init__(self, path=SOCKET, timeout=TIMEOUT):
+        self.path = path
+        self.timeout = timeout
+
+    def request(self, command, **params):
+        """Send command with params, return result the daemon answers"""
+        import json
+        import socket
+        params['command'] = command
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(self.timeout)
+            sock.connect(self.path)
+            sock.sendall(json.dumps(params).encode('utf-8') + b'\n')
+            with sock.makefile('rb') as answers:
+                answer = answers.readline()
+        if not answer:
+            raise DaemonError('lazytools serve closed the connection')
+        answer = json.loads(answer.decode('utf-8'))
+        if 'error' in answer:
+            raise DaemonError(answer['error'])
+        return answer['result']
+
+    def languages(self, base_url=None):
+        """Return list of languages linked from the stats index page"""
+        return self.request('languages', base_url=base_url)
+
+    def todo(self, language, sections, base_url=None,
+             max_age=lazyhttp.MAX_AGE):
+        """Return list of (page, size) untranslated in sections
+
+        The daemon fetches the stats page again if it is older than
+        max_age seconds.
+        """
+        return [tuple(row) for row in self.request(
+            'todo', language=language, sections=list(sections),
+            base_url=base_url, max_age=max_age)]
+
+    def outdated(self, language, base_url=None, exec_diff=False, cwd=None,
+                 max_age=lazyhttp.MAX_AGE):
+        """Return entries [file, lines, chars, command] of outdated pages
+
+        Entries are not sorted, sizes of diffs are computed in the
+        checkout at cwd (default: current directory). The daemon fetches
+        the stats page again if it is older than max_age seconds.
+        """
+        return self.request('outdated', language=language, base_url=base_url,
+                            exec_diff=exec_diff,
+                            cwd=os.path.abspath(cwd or os.curdir),
+                            max_age=max_age)
+
+    def metadata(self, cwd=None):
+        return RemoteMetadata(self, cwd)
+
+
+class RemoteMetadata(object):
+    """Revision and status lookups answered from the index of the daemon
+
+    Same lookups as lazyvcs.CVSMetadata and GitMetadata, with paths
+    relative to cwd (default: current directory).
+    """
+
+    def __init__(self, client, cwd=None):
+        self.client = client
+        self.cwd = os.path.abspath(cwd or os.curdir)
+
+    def revision(self, path):
+        return self.revisions([path])[path]
+
+    def revisions(self, paths):
+        return self.client.request('revisions', cwd=self.cwd,
+                                   paths=list(paths))
+
+    def status(self, path):
+        return self.statuses([path])[path]
+
+    def statuses(self, paths):
+        return self.client.request('statuses', cwd=self.cwd,
+                                   paths=list(paths))
+
+
+def add_arguments(parser):
+    """Add options for using a running daemon to argparse parser"""
+    parser.add_argument('--socket', metavar='PATH', type=str, default=SOCKET,
+                        help='Ask lazytools serve listening on PATH if it is '
+                        'running (default: %(default)s)')
+    parser.add_argument('--no-daemon', action='store_const', const=True,
+                        default=False,
+                        help='Do not ask lazytools serve, do all the work '
+                        'in this process (implied by options of the caches '
+                        'of pages and diff sizes)')
+
+
+def connect(args):
+    """Return Client of the daemon options of add_arguments point to
+
+    Returns None if the daemon is not to be used or does not answer, or
+    if any of LOCAL_OPTIONS is set.
+    """
+    if args.no_daemon or not os.path.exists(args.socket):
+        return None
+    if any(getattr(args, name, default) != default
+           for name, default in LOCAL_OPTIONS.items()):
+        return None
+    try:
+        Client(args.socket, PING_TIMEOUT).request('ping')
+    except (OSError, ValueError):
+        return None
+    return Client(args.socket)
@@ -28,10 +28,12 @@
 # is not specified, lazycopy will use symlink /usr/bin/editor. You can change
 # it with update-alternatives command. If temp_dir is not specified, then /tmp
 # will be used to store patches. If diff_args is not specified, then lazycopy
-# will produce unified diff (with diff -u command). If maintainer is not
-# specified, then information about maintainer will not be added to translation
-# file. But you have to specify target language either in configuration file,
-# or by argument.
+# will produce unified diff (as diff -u command does). Patches are produced
+# without running diff for the usual diff_args (-u, -U N, -y, -W N, -t, -b, -w,
+# -i, --minimal and a few more), diff is run only for other options. If
+# maintainer is not specified, then information about maintainer will not be
+# added to translation file. But you have to specify target language either in
+# configuration file, or by argument.
 #
 # Example of configuration file:
 #
@@ -48,9 +50,20 @@ _VERSION_ = '0.3.1'
 
 import argparse
 import configparser
+import glob
 import os
-import subprocess
+import shlex
+import shutil
 import sys
+import tempfile
+
+import lazyclient
+import lazytiming
+
+# subprocess and modules diffing pages, reading version control metadata
+# and watching files are imported by the functions using them, so --help
+# and usage errors are not slowed down by what only copying and diffing
+# need
 
 
 class colors(object):
@@ -62,33 +75,38 @@ class colors(object):
 
 class Configuration(object):
     def __init__(self, args):
-        self.path = args.path
-        self.check_target_file()
         self.no_check = args.no_check
         self.no_update = args.no_update
         self.no_edit = args.no_edit
         self.no_diff = args.no_diff
+        self.watch = args.watch
+        self.debounce = max(args.debounce, 0)
 
+        import lazydiff
+        import lazyvcs
+
+        # Options missing from the file (or the whole file) are empty
+        cfg_file = configparser.RawConfigParser()
         if os.path.exists('lazycopy.conf'):
-            cfg_file = configparser.RawConfigParser()
             cfg_file.read('lazycopy.conf')
         else:
             print(colors.info + "Configuration file lazycopy.conf not found.")
 
         self.target_lang = args.language or cfg_file.get(
-            'lazycopy', 'language')
+            'lazycopy', 'language', fallback='')
         if not self.target_lang:
             print(colors.error + "Specify target language in configuration "
                   "file or with argument.")
             sys.exit(1)
 
         self.maintainer = args.maintainer or cfg_file.get(
-            'lazycopy', 'maintainer')
+            'lazycopy', 'maintainer', fallback='')
         if not self.maintainer:
             print(colors.info + "You can specify maintainer in configuration "
                   "file or with argument.")
 
-        self.editor = args.editor or cfg_file.get('lazycopy', 'editor')
+        self.editor = args.editor or cfg_file.get(
+            'lazycopy', 'editor', fallback='')
         if not self.editor:
             if os.path.exists('/usr/bin/editor'):
                 self.editor = '/usr/bin/editor'
@@ -96,203 +114,497 @@ class Configuration(object):
                 print(colors.warning + "Editor is not specified, symlink "
                       "/usr/bin/editor doesn't exits, not running editor.")
 
-        self.temp_dir = args.temp_dir or cfg_file.get('lazycopy', 'temp_dir')
+        self.temp_dir = args.temp_dir or cfg_file.get(
+            'lazycopy', 'temp_dir', fallback='')
         if not self.temp_dir:
             print(colors.info + "Using /tmp as temporary directory.")
             self.temp_dir = '/tmp'
 
         self.diff_args = args.diff_args or cfg_file.get(
-            'lazycopy', 'diff_args')
+            'lazycopy', 'diff_args', fallback='')
         if not self.diff_args:
             print(colors.info + "Will prepare unified diff.")
             self.diff_args = '-u'
+        try:
+            self.diff_options = lazydiff.parse_diff_args(
+                shlex.split(self.diff_args))
+        except ValueError as err:
+            print(colors.info + "Will run diff: " + str(err) + ".")
+            self.diff_options = None
 
         self.list_file = args.list_file or cfg_file.get(
-            'lazycopy', 'list_file')
+            'lazycopy', 'list_file', fallback='')
         if not self.list_file:
             print(colors.info + "Using /tmp/webwml_list.tmp as a list file.")
             self.list_file = '/tmp/webwml_list.tmp'
 
         self.lang_code = self.target_lang[:2]
+        self.bundle_file = args.bundle or cfg_file.get(
+            'lazycopy', 'bundle_file', fallback='')
+        if not self.bundle_file and self.watch and not self.no_diff:
+            self.bundle_file = os.path.join(self.temp_dir, 'webwml_' +
+                                            self.lang_code + '.patch')
+            print(colors.info + "Using " + self.bundle_file +
+                  " as a patch bundle.")
+        client = lazyclient.connect(args)
+        if client is not None:
+            print(colors.info + "Using lazytools serve on " + args.socket +
+                  ".")
+            self.metadata = client.metadata()
+        else:
+            self.metadata = lazyvcs.open_metadata()
+        self.pages = [Page(self, path) for path in expand_paths(args.path)]
+
+    def make_Makefile(self):
+        return 'include $(subst webwml/' + self.target_lang + \
+            ',webwml/english,$(CURDIR))/Makefile\n'
+
+
+class Page(object):
+    def __init__(self, config, path):
+        self.config = config
+        self.path = path
+        self.check_target_file()
+
         self.path_lst = self.path.split('/')
         self.path_lst2 = self.path_lst[1:]
-        self.target_path = self.target_lang + \
+        self.target_path = config.target_lang + \
             '/' + '/'.join(self.path_lst[1:-1])
         self.target_file = self.target_path + '/' + self.path_lst[-1]
-        self.patch_file = '/tmp/' + '_'.join(self.path_lst2) + '.' + \
-                          self.path[:2] + '_' + self.lang_code + '.patch'
+        self.patch_file = os.path.join(config.temp_dir,
+                                       '_'.join(self.path_lst2) + '.' +
+                                       self.path[:2] + '_' +
+                                       config.lang_code + '.patch')
         self.lst_file_entry = '/'.join(self.path_lst2)
         self.source_makefile = '/'.join(self.path_lst[:-1]) + '/Makefile'
-        self.target_makefile = self.target_lang + '/' + \
+        self.target_makefile = config.target_lang + '/' + \
             '/'.join(self.path_lst[1:-1]) + '/Makefile'
 
     def check_target_file(self):
         # Check specified file to be a valid (wml, src) page
-        self.path_lst = self.path.split('/')
-        if 'wml' not in self.path_lst[-1] and 'src' not in self.path_lst[-1]:
-            print(colors.error + "Specified file doesn't seem to be a valid "
-                  "page.")
+        if not is_page(self.path):
+            print(colors.error + "Specified file " + self.path +
+                  " doesn't seem to be a valid page.")
             sys.exit(1)
 
     def revision_number(self):
-        cvs_entries_file = '/'.join(self.path_lst[:-1]) + '/CVS/Entries'
-        cvs_entries = open(cvs_entries_file, 'r')
-        for line in cvs_entries:
-            if self.path_lst[-1] in line:
-                return line.split('/')[2]
+        return self.config.metadata.revision(self.path)
 
-    def make_title(self):
+    def make_title(self, revision=None):
+        if revision is None:
+            revision = self.revision_number()
         title = '#use wml::debian::translation-check translation="' + \
-                self.revision_number() + '"'
-        if self.maintainer:
-            title += ' maintainer="' + self.maintainer + '"'
+                revision + '"'
+        if self.config.maintainer:
+            title += ' maintainer="' + self.config.maintainer + '"'
         return title
 
-    def make_Makefile(self):
-        return 'include $(subst webwml/' + self.target_lang + \
-            ',webwml/english,$(CURDIR))/Makefile\n'
-
     def make_diff(self):
-        return 'diff ' + self.diff_args + ' ' + self.path + ' ' + \
-            self.target_file + ' > ' + self.patch_file
+        return ['diff'] + shlex.split(self.config.diff_args) + \
+            [self.path, self.target_file]
+
+
+def is_page(path):
+    return 'wml' in os.path.basename(path) or 'src' in os.path.basename(path)
+
+
+def expand_paths(paths):
+    # Directories are searched for pages recursively, glob patterns are
+    # expanded, other paths are taken as they are
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            found = []
+            for dirpath, dirnames, filenames in os.walk(path):
+                dirnames[:] = sorted(name for name in dirnames
+                                     if name != 'CVS')
+                found.extend(os.path.join(dirpath, name)
+                             for name in sorted(filenames) if is_page(name))
+        elif not os.path.exists(path) and any(c in path for c in '*?['):
+            found = sorted(name for name in glob.glob(path, recursive=True)
+                           if os.path.isfile(name) and is_page(name))
+        else:
+            found = [path]
+        if not found:
+            print(colors.error + "No pages found in " + path)
+            sys.exit(1)
+        for name in found:
+            name = os.path.normpath(name)
+            if name not in result:
+                result.append(name)
+    return result
+
+
+def cvs_status(target_files):
+    # Run cvs status once for all target files and return the status of
+    # each of them. Files are found by their repository path, or by their
+    # name when the file is unknown to CVS.
+    import subprocess
+    with lazytiming.span('cvs status', files=len(target_files)):
+        cvs = subprocess.Popen(['cvs', 'status'] + target_files,
+                               stdout=subprocess.PIPE,
+                               stderr=subprocess.DEVNULL)
+        out = cvs.communicate()[0].decode('utf-8')
+    blocks = []
+    for line in out.split('\n'):
+        if line.startswith('File:'):
+            blocks.append([line])
+        elif blocks:
+            blocks[-1].append(line)
+    statuses = {}
+    for block in blocks:
+        found = None
+        for line in block:
+            if 'Repository revision' in line and line.split()[-1][:1] == '/':
+                repository = line.split()[-1][:-2].replace('/Attic/', '/')
+                for target in target_files:
+                    if target not in statuses and \
+                            repository.endswith('/' + target):
+                        found = target
+        if found is None:
+            name = block[0].split()[1]
+            if name == 'no' and block[0].split()[2] == 'file':
+                name = block[0].split()[3]
+            for target in target_files:
+                if target not in statuses and \
+                        os.path.basename(target) == name:
+                    found = target
+                    break
+        if found is not None:
+            statuses[found] = block_status(block)
+    return statuses
 
 
-def check_status(target_file):
-    print(colors.info + "Checking status of " + target_file)
-    cvs = subprocess.Popen(['cvs', 'status', target_file],
-                           stdout=subprocess.PIPE)
-    #out, err = cvs.communicate()
-    out = cvs.communicate()
-    if cvs.returncode:
-        return
-    out = out[0].decode('utf-8')
-    cvs_status = out.split('\n')
+def block_status(cvs_status):
     for entry in cvs_status:
         if 'Status' in entry:
             if 'Unknown' in entry.split()[-1]:
-                return
+                return 'unknown'
         if 'Repository revision' in entry:
             if 'Attic' in entry.split()[-1]:
-                print(colors.error + "An old translation exists in the "
-                      "Attic, you should restore it using:")
-                print(colors.info + "cvs update -j DELETED -j PREVIOUS" +
-                      target_file)
-                print(colors.info + "Edit and update the file")
-                print(colors.info + "cvs ci " + target_file)
-                return
-    print(colors.error + "A translation already exists in CVS for this file.")
-    print(colors.error + "Please update your CVS copy using 'cvs update'.")
-    sys.exit(1)
-
-
-def copy_original(config):
-    print(colors.info + "Copying " + config.path)
-    if not os.path.exists(config.path):
-        print(colors.error + "Specified file does not exist.")
-        sys.exit(1)
-    if not config.no_check:
-        check_status(config.target_file)
-    if not os.path.exists(config.target_path):
-        os.makedirs(config.target_path)
-    if not os.path.exists(config.target_makefile):
-        makefile = open(config.target_path + '/Makefile', 'w')
-        makefile.write(config.make_Makefile())
-        makefile.close()
-    if not config.no_update:
-        print(colors.info + "Updating specified file.")
-        subprocess.call(['cvs', 'update', config.path])
-    src_file = open(config.path, 'r')
-    dest_file = open(config.target_file, 'w')
-    src_file_contents = src_file.read().split('\n')
-    inserted_title = False
-    for line in src_file_contents:
-        line += '\n'
-        if line[0] != '#' and not inserted_title:
-            dest_file.write(config.make_title() + '\n')
-            dest_file.write(line)
-            inserted_title = True
-        else:
-            dest_file.write(line)
-    dest_file.close()
-
+                return 'attic'
+    return 'exists'
 
-def run_editor(editor, target_file):
-    print(colors.info + "Running editor to edit " + target_file)
-    subprocess.call([editor, target_file])
 
-
-def run_diff(diff_string):
-    print(colors.info + "Running " + diff_string)
-    subprocess.call(diff_string, shell=True)
+def check_status(target_file, status):
+    print(colors.info + "Checking status of " + target_file)
+    if status == 'attic':
+        print(colors.error + "An old translation exists in the "
+              "Attic, you should restore it using:")
+        print(colors.info + "cvs update -j DELETED -j PREVIOUS" +
+              target_file)
+        print(colors.info + "Edit and update the file")
+        print(colors.info + "cvs ci " + target_file)
+    elif status == 'exists':
+        print(colors.error + "A translation already exists in CVS for " +
+              target_file + ".")
+        return False
+    return True
+
+
+def original_revisions(config):
+    # Revisions of the originals of all pages, looked up at once. Exits
+    # if any original has none (it is not committed, or it is removed),
+    # as its copy would have no translation-check header to write.
+    with lazytiming.span('metadata revisions', files=len(config.pages)):
+        revisions = config.metadata.revisions([page.path
+                                               for page in config.pages])
+    missing = [page.path for page in config.pages
+               if not revisions.get(page.path) or
+               revisions[page.path].startswith('-')]
+    for path in missing:
+        print(colors.error + "Specified file " + path +
+              " has no revision, commit it first.")
+    if missing:
+        sys.exit(1)
+    return revisions
 
 
-def simplify(data):
-    matched = ''
-    nonmatched = []
-    nonmatch_num = -1
-    for num in range(len(data[1]) - 1):
-        simplification = False
-        for item in data[0:]:
-            if len(item) - 1 >= num:
-                if data[1][num] == item[num]:
-                    simplification = True
-                elif data[1][num] != item[num]:
-                    simplification = False
-                    nonmatch_num = num
+def copy_originals(config):
+    import subprocess
+    for page in config.pages:
+        print(colors.info + "Copying " + page.path)
+        if not os.path.exists(page.path):
+            print(colors.error + "Specified file " + page.path +
+                  " does not exist.")
+            sys.exit(1)
+    # Checked before any directory, Makefile or update is made, and again
+    # after cvs update brings newer revisions
+    revisions = original_revisions(config)
+    if not config.no_check:
+        targets = [page.target_file for page in config.pages]
+        with lazytiming.span('metadata statuses', files=len(targets)):
+            statuses = config.metadata.statuses(targets)
+        # Ask the server only about files local metadata can't tell about,
+        # files cvs status does not report on are not known to CVS
+        unsure = [target for target in targets if statuses[target] is None]
+        if unsure:
+            statuses.update(cvs_status(unsure))
+        if not all([check_status(target, statuses.get(target, 'unknown'))
+                    for target in targets]):
+            print(colors.error + "Please update your CVS copy using "
+                  "'cvs update'.")
+            sys.exit(1)
+    for target_path in sorted(set(page.target_path
+                                  for page in config.pages)):
+        if not os.path.exists(target_path):
+            os.makedirs(target_path)
+        if not os.path.exists(target_path + '/Makefile'):
+            makefile = open(target_path + '/Makefile', 'w')
+            makefile.write(config.make_Makefile())
+            makefile.close()
+    if not config.no_update:
+        print(colors.info + "Updating specified files.")
+        with lazytiming.span('cvs update', files=len(config.pages)):
+            subprocess.call(['cvs', 'update'] +
+                            [page.path for page in config.pages])
+        revisions = original_revisions(config)
+    for page in config.pages:
+        with lazytiming.span('copy'):
+            copy_original(page, revisions[page.path])
+
+
+_file_mode = None
+
+
+def new_file_mode():
+    # Mode of new files as open() would create them, 0o666 less the
+    # umask. The umask is read once: from /proc on Linux, elsewhere by
+    # setting it and back, which main() does before any thread starts.
+    global _file_mode
+    if _file_mode is None:
+        umask = None
+        try:
+            with open('/proc/self/status') as status:
+                for line in status:
+                    if line.startswith('Umask:'):
+                        umask = int(line.split()[1], 8)
+        except (OSError, ValueError):
+            pass
+        if umask is None:
+            umask = os.umask(0o022)
+            os.umask(umask)
+        _file_mode = 0o666 & ~umask
+    return _file_mode
+
+
+def copy_original(page, revision=None):
+    # Only the lines before the place of the header are read one by one,
+    # the rest is copied in blocks. The copy is written next to the target
+    # and renamed over it, so the target is never left half written. The
+    # revision of the original is looked up unless given.
+    title = (page.make_title(revision) + '\n').encode('utf-8')
+    fd, tmp_name = tempfile.mkstemp(dir=page.target_path, suffix='.tmp',
+                                    prefix='.' + page.path_lst[-1])
+    try:
+        with open(page.path, 'rb') as src_file, \
+                os.fdopen(fd, 'wb') as dest_file:
+            last = b'\n'
+            while True:
+                line = src_file.readline()
+                if not line.startswith(b'#'):
                     break
-        if simplification:
-            matched = matched + data[1][num]
+                dest_file.write(line)
+                last = line
+            if not last.endswith(b'\n'):
+                # Page is all header lines without a newline at its end
+                dest_file.write(b'\n')
+            dest_file.write(title)
+            dest_file.write(line)
+            shutil.copyfileobj(src_file, dest_file, 1024 * 1024)
+        os.chmod(tmp_name, new_file_mode())
+        os.replace(tmp_name, page.target_file)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def run_editor(editor, target_files):
+    import subprocess
+    print(colors.info + "Running editor to edit " + ' '.join(target_files))
+    with lazytiming.span('editor', files=len(target_files)):
+        subprocess.call([editor] + target_files)
+
+
+def run_diff(page):
+    # Patch is written as diff produces it, line by line
+    import subprocess
+
+    import lazydiff
+    with open(page.patch_file, 'w', encoding='utf-8',
+              errors='surrogateescape', newline='') as patch:
+        if page.config.diff_options is None:
+            print(colors.info + "Running " + shlex.join(page.make_diff()) +
+                  " > " + page.patch_file)
+            with lazytiming.span('diff command'):
+                subprocess.call(page.make_diff(), stdout=patch)
         else:
-            break
-    for item in data:
-        nonmatched.append(item[nonmatch_num:])
-    return matched, nonmatched
-
-
-def reverse(list_str):
-    pre_output = []
-    for entry in list_str[1]:
-        pre_output.append(entry[::-1])
-    reverse_simplified = simplify(pre_output)
-    output_str = ''
-    for entry in reverse_simplified:
-        if isinstance(entry, str):
-            output_str = output_str + entry[::-1]
-        elif isinstance(entry, list):
-            output_lst = []
-            for item in entry:
-                output_lst.append(item[::-1])
-    return output_lst, output_str
-
-
-def make_pseudolink(list_file, lst_file_entry):
+            print(colors.info + "Writing " + page.patch_file)
+            with lazytiming.span('diff'):
+                patch.writelines(lazydiff.diff_lines(
+                    page.path, page.target_file, page.config.diff_options))
+
+
+def _common_prefix_len(first, second):
+    length = min(len(first), len(second))
+    for num in range(length):
+        if first[num] != second[num]:
+            return num
+    return length
+
+
+class PseudoURL(object):
+    # Set of pages written as one wml://prefix{middle,...}suffix line.
+    # Common prefix and suffix are narrowed as entries are added, so
+    # adding an entry costs only its length whatever the size of the set.
+
+    SCHEME = 'wml://'
+
+    def __init__(self, entries=()):
+        self.entries = []
+        self.known = set()
+        self.prefix = None
+        self.suffix = None
+        self.shortest = None
+        for entry in entries:
+            self.add(entry)
+
+    @classmethod
+    def parse(cls, line):
+        line = line.strip()
+        if line.startswith(cls.SCHEME):
+            line = line[len(cls.SCHEME):]
+        if not line:
+            return cls()
+        start = line.find('{')
+        end = line.rfind('}')
+        if start < 0 or end < start:
+            return cls([line])
+        prefix, suffix = line[:start], line[end + 1:]
+        return cls(prefix + middle + suffix
+                   for middle in line[start + 1:end].split(','))
+
+    def add(self, entry):
+        if entry in self.known:
+            return False
+        self.known.add(entry)
+        self.entries.append(entry)
+        if self.prefix is None:
+            self.prefix = self.suffix = entry
+            self.shortest = len(entry)
+        else:
+            self.prefix = self.prefix[:_common_prefix_len(self.prefix,
+                                                          entry)]
+            self.suffix = self.suffix[len(self.suffix) - _common_prefix_len(
+                self.suffix[::-1], entry[::-1]):]
+            self.shortest = min(self.shortest, len(entry))
+        return True
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __str__(self):
+        if len(self.entries) < 2:
+            return self.SCHEME + '{' + ''.join(self.entries) + '}'
+        prefix = self.prefix
+        # Suffix may not reach into the prefix of the shortest entry
+        suffix = self.suffix[len(self.suffix) -
+                             min(len(self.suffix),
+                                 self.shortest - len(prefix)):]
+        end = len(suffix)
+        return self.SCHEME + prefix + '{' + ','.join(
+            entry[len(prefix):len(entry) - end]
+            for entry in self.entries) + '}' + suffix
+
+
+def make_bundle(bundle_file, pages):
+    # Patches of all pages one after another, written next to the bundle
+    # and renamed over it, so readers never see it half written
+    directory, name = os.path.split(os.path.abspath(bundle_file))
+    fd, tmp_name = tempfile.mkstemp(dir=directory, suffix='.tmp',
+                                    prefix='.' + name)
+    try:
+        with os.fdopen(fd, 'wb') as bundle:
+            for page in pages:
+                if os.path.exists(page.patch_file):
+                    with open(page.patch_file, 'rb') as patch:
+                        shutil.copyfileobj(patch, bundle, 1024 * 1024)
+        os.chmod(tmp_name, new_file_mode())
+        os.replace(tmp_name, bundle_file)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+
+def missing_entries(list_file, lst_file_entries):
+    # Entries not (or no longer) in the pseudo-URL of the list file
+    try:
+        with open(list_file, 'r') as tmp_list_file:
+            known = PseudoURL.parse(tmp_list_file.readline()).known
+    except OSError:
+        known = ()
+    return [entry for entry in lst_file_entries if entry not in known]
+
+
+def watch_pages(config):
+    # Patches of pages whose original or translation is saved are made
+    # again, then the bundle; entries dropped from the list file are put
+    # back. Bursts of saves are handled once, until ^C stops watching.
+    import lazywatch
+    entries = [page.lst_file_entry for page in config.pages]
+    list_file = os.path.abspath(config.list_file)
+    watched = set(os.path.abspath(path) for page in config.pages
+                  for path in (page.path, page.target_file))
+    watched.add(list_file)
+    print(colors.info + "Watching " + str(len(config.pages)) + " pages, "
+          "press Ctrl-C to stop.")
+    try:
+        for changed in lazywatch.watch(sorted(watched), config.debounce):
+            pages = [page for page in config.pages
+                     if os.path.abspath(page.path) in changed or
+                     os.path.abspath(page.target_file) in changed]
+            if pages and not config.no_diff:
+                with lazytiming.span('watch diffs', files=len(pages)):
+                    for page in pages:
+                        if os.path.exists(page.target_file):
+                            run_diff(page)
+                        else:
+                            print(colors.error + "Translation " +
+                                  page.target_file + " is gone.")
+                if config.bundle_file:
+                    make_bundle(config.bundle_file, config.pages)
+                    print(colors.success + "Updated " + config.bundle_file)
+            if list_file in changed and missing_entries(config.list_file,
+                                                        entries):
+                make_pseudolink(config.list_file, entries)
+    except KeyboardInterrupt:
+        print(colors.info + "Stopped watching.")
+
+
+def make_pseudolink(list_file, lst_file_entries):
     if os.path.exists(list_file):
-        print(colors.info + "Adding new entry to list file.")
-        tmp_list_file = open(list_file, 'r')
-        raw_data = tmp_list_file.read()[6:].split('{')
-        tmp_list_file.close()
-        raw_data[1] = raw_data[1][:-1]
-        raw_data[1] = raw_data[1].split('}')
-        raw_data.append(raw_data[1].pop(1))
-        expanded_data = []
-        for entry in raw_data[1][0].split(','):
-            expanded_data.append(raw_data[0] + entry + raw_data[2])
-        expanded_data.append(lst_file_entry)
-        result = 'wml://' + simplify(expanded_data)[0] + '{' + \
-                 ','.join(reverse(simplify(expanded_data))[0]) + '}' + \
-                 reverse(simplify(expanded_data))[1] + '\n'
+        print(colors.info + "Adding new entries to list file.")
+        with open(list_file, 'r') as tmp_list_file:
+            pseudo_url = PseudoURL.parse(tmp_list_file.readline())
     else:
         print(colors.info + "Creating a new list file.")
-        result = 'wml://{' + lst_file_entry + '}\n'
+        pseudo_url = PseudoURL()
+    for entry in lst_file_entries:
+        pseudo_url.add(entry)
+    result = str(pseudo_url) + '\n'
     tmp_list_file = open(list_file, 'w')
     tmp_list_file.write(result)
     tmp_list_file.close()
     print(colors.success + result)
 
 
-if __name__ == '__main__':
+def main(argv=None, prog=None):
     # Command-line arguments parser
-    parser = argparse.ArgumentParser(description="Copies the specified page "
+    parser = argparse.ArgumentParser(prog=prog,
+                                     description="Copies the specified page "
                                      "to the corresponding directory of the "
                                      "specified language and adds the "
                                      "translation-check header with the "
@@ -307,8 +619,9 @@ if __name__ == '__main__':
                                      "locally the program will abort and "
                                      "warn the user (unless '-nu' is used)")
 
-    parser.add_argument('path', metavar='path', type=str,
-                        help="Sets file for the translation")
+    parser.add_argument('path', metavar='path', type=str, nargs='+',
+                        help="Sets files for the translation, directories "
+                        "and glob patterns select all pages in them")
     parser.add_argument('-l', '--language', metavar='language', type=str,
                         help="Sets language for the translation.")
     parser.add_argument('-m', '--maintainer', metavar='maintainer', type=str,
@@ -333,14 +646,44 @@ if __name__ == '__main__':
     parser.add_argument('-nd', '--no-diff', action='store_const', const=True,
                         default=False,
                         help="Does not produce patch")
-
-    config = Configuration(parser.parse_args())
-
-    copy_original(config)
+    parser.add_argument('-b', '--bundle', metavar='bundle_file', type=str,
+                        help="Sets file collecting the patches of all pages")
+    parser.add_argument('-w', '--watch', action='store_const', const=True,
+                        default=False,
+                        help="Keeps watching the pages, makes their patches "
+                        "and the bundle again when they are saved and keeps "
+                        "them in the list file, until interrupted")
+    parser.add_argument('--debounce', metavar='seconds', type=float,
+                        default=0.5,
+                        help="Waits for saves to stop this long before "
+                        "making patches when watching (default: "
+                        "%(default)s)")
+    lazyclient.add_arguments(parser)
+    lazytiming.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    new_file_mode()
+    lazytiming.start(args)
+    config = Configuration(args)
+
+    copy_originals(config)
 
     if not config.no_edit:
-        run_editor(config.editor, config.target_file)
+        run_editor(config.editor, [page.target_file for page in config.pages])
     if not config.no_diff:
-        run_diff(config.make_diff())
+        for page in config.pages:
+            run_diff(page)
+        if config.bundle_file:
+            with lazytiming.span('bundle', files=len(config.pages)):
+                make_bundle(config.bundle_file, config.pages)
+
+    with lazytiming.span('list file'):
+        make_pseudolink(config.list_file,
+                        [page.lst_file_entry for page in config.pages])
+    if config.watch:
+        watch_pages(config)
+    return 0
 
-    make_pseudolink(config.list_file, config.lst_file_entry)
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1212 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazydiff -- in-process diff engine for lazytools
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import os
+import re
+import sys
+import time
+import unicodedata
+
+NO_NEWLINE = '\\ No newline at end of file\n'
+_FUNCNAME_START = frozenset('abcdefghijklmnopqrstuvwxyz'
+                            'ABCDEFGHIJKLMNOPQRSTUVWXYZ_$')
+
+
+def _opcodes_from_changes(old, new):
+    """Return opcodes from change flags of both sides
+
+    Flags lists have a sentinel slot on each end, line i is at i + 1.
+    """
+    result = []
+    i = j = 0
+    n, m = len(old) - 2, len(new) - 2
+    while i < n or j < m:
+        i1, j1 = i, j
+        while i < n and old[i + 1]:
+            i += 1
+        while j < m and new[j + 1]:
+            j += 1
+        if i > i1 or j > j1:
+            tag = 'replace' if i > i1 and j > j1 else \
+                'delete' if i > i1 else 'insert'
+            result.append((tag, i1, i, j1, j))
+        i1, j1 = i, j
+        while i < n and j < m and not old[i + 1] and not new[j + 1]:
+            i += 1
+            j += 1
+        if i > i1:
+            result.append(('equal', i1, i, j1, j))
+    return result
+
+
+def _bogosqrt(n):
+    """Return the rough square root xdiff uses for its limits"""
+    root = 1
+    while n > 0:
+        n >>= 2
+        root <<= 1
+    return root
+
+
+def _is_lonely(dis, i, start, end):
+    """Tell whether multimatch line i sits among lines without match
+
+    Port of xdl_clean_mmatch: such lines are discarded together with
+    the lines around them.
+    """
+    start = max(start, i - 100)
+    end = min(end, i + 100)
+    no_match_before, multi_before = 0, 1
+    r = 1
+    while i - r >= start:
+        if not dis[i - r]:
+            no_match_before += 1
+        elif dis[i - r] == 2:
+            multi_before += 1
+        else:
+            break
+        r += 1
+    if not no_match_before:
+        return False
+    no_match_after, multi_after = 0, 1
+    r = 1
+    while i + r <= end:
+        if not dis[i + r]:
+            no_match_after += 1
+        elif dis[i + r] == 2:
+            multi_after += 1
+        else:
+            break
+        r += 1
+    if not no_match_after:
+        return False
+    multi = multi_before + multi_after
+    return multi * 4 < multi + no_match_before + no_match_after
+
+
+def _reduce(lines, other_count, changed, start, end):
+    """Return lines taking part in the diff and their indexes
+
+    Lines between start and end without a match in the other file are
+    marked as changed right away, as xdl_cleanup_records does.
+    """
+    limit = min(_bogosqrt(len(lines)), 1024)
+    dis = {}
+    for i in range(start, end + 1):
+        matches = other_count.get(lines[i], 0)
+        dis[i] = 0 if not matches else 2 if matches >= limit else 1
+    reduced, index = [], []
+    for i in range(start, end + 1):
+        if dis[i] == 1 or (dis[i] == 2 and
+                           not _is_lonely(dis, i, start, end)):
+            reduced.append(lines[i])
+            index.append(i)
+        else:
+            changed[i + 1] = True
+    return reduced, index
+
+
+def _split(a, off1, lim1, b, off2, lim2, kvdf, kvdb, base, need_min, mxcost):
+    """Port of xdl_split, return (i1, i2, min_lo, min_hi) of a split"""
+    dmin, dmax = off1 - lim2, lim1 - off2
+    fmid, bmid = off1 - off2, lim1 - lim2
+    odd = (fmid - bmid) & 1
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    kvdf[base + fmid] = off1
+    kvdb[base + bmid] = lim1
+    ec = 0
+    while True:
+        ec += 1
+        got_snake = False
+        if fmin > dmin:
+            fmin -= 1
+            kvdf[base + fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            kvdf[base + fmax + 1] = -1
+        else:
+            fmax -= 1
+        for d in range(fmax, fmin - 1, -2):
+            if kvdf[base + d - 1] >= kvdf[base + d + 1]:
+                i1 = kvdf[base + d - 1] + 1
+            else:
+                i1 = kvdf[base + d + 1]
+            prev1 = i1
+            i2 = i1 - d
+            while i1 < lim1 and i2 < lim2 and a[i1] == b[i2]:
+                i1 += 1
+                i2 += 1
+            if i1 - prev1 > 20:
+                got_snake = True
+            kvdf[base + d] = i1
+            if odd and bmin <= d <= bmax and kvdb[base + d] <= i1:
+                return i1, i2, True, True
+        if bmin > dmin:
+            bmin -= 1
+            kvdb[base + bmin - 1] = sys.maxsize
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            kvdb[base + bmax + 1] = sys.maxsize
+        else:
+            bmax -= 1
+        for d in range(bmax, bmin - 1, -2):
+            if kvdb[base + d - 1] < kvdb[base + d + 1]:
+                i1 = kvdb[base + d - 1]
+            else:
+                i1 = kvdb[base + d + 1] - 1
+            prev1 = i1
+            i2 = i1 - d
+            while i1 > off1 and i2 > off2 and a[i1 - 1] == b[i2 - 1]:
+                i1 -= 1
+                i2 -= 1
+            if prev1 - i1 > 20:
+                got_snake = True
+            kvdb[base + d] = i1
+            if not odd and fmin <= d <= fmax and i1 <= kvdf[base + d]:
+                return i1, i2, True, True
+        if need_min:
+            continue
+        if got_snake and ec > 256:
+            best = 0
+            for d in range(fmax, fmin - 1, -2):
+                dd = abs(d - fmid)
+                i1 = kvdf[base + d]
+                i2 = i1 - d
+                v = (i1 - off1) + (i2 - off2) - dd
+                if v > 4 * ec and v > best and \
+                        off1 + 20 <= i1 < lim1 and off2 + 20 <= i2 < lim2:
+                    if all(a[i1 - k] == b[i2 - k] for k in range(1, 21)):
+                        best, split = v, (i1, i2)
+            if best > 0:
+                return split[0], split[1], True, False
+            for d in range(bmax, bmin - 1, -2):
+                dd = abs(d - bmid)
+                i1 = kvdb[base + d]
+                i2 = i1 - d
+                v = (lim1 - i1) + (lim2 - i2) - dd
+                if v > 4 * ec and v > best and \
+                        off1 < i1 <= lim1 - 20 and off2 < i2 <= lim2 - 20:
+                    if all(a[i1 + k] == b[i2 + k] for k in range(20)):
+                        best, split = v, (i1, i2)
+            if best > 0:
+                return split[0], split[1], False, True
+        if ec >= mxcost:
+            fbest = fbest1 = -1
+            for d in range(fmax, fmin - 1, -2):
+                i1 = min(kvdf[base + d], lim1)
+                i2 = i1 - d
+                if lim2 < i2:
+                    i1, i2 = lim2 + d, lim2
+                if fbest < i1 + i2:
+                    fbest, fbest1 = i1 + i2, i1
+            bbest = bbest1 = sys.maxsize
+            for d in range(bmax, bmin - 1, -2):
+                i1 = max(off1, kvdb[base + d])
+                i2 = i1 - d
+                if i2 < off2:
+                    i1, i2 = off2 + d, off2
+                if i1 + i2 < bbest:
+                    bbest, bbest1 = i1 + i2, i1
+            if (lim1 + lim2) - bbest < fbest - (off1 + off2):
+                return fbest1, fbest - fbest1, True, False
+            return bbest1, bbest - bbest1, False, True
+
+
+def _git_changes(a, b):
+    """Return change flags of a and b as computed by git's xdiff
+
+    This follows xdl_do_diff: equal ends are trimmed, lines without a
+    match are discarded and the rest is split with Myers' algorithm
+    including the heuristics git uses for expensive diffs.
+    """
+    old = [False] * (len(a) + 2)
+    new = [False] * (len(b) + 2)
+    limit = min(len(a), len(b))
+    start = 0
+    while start < limit and a[start] == b[start]:
+        start += 1
+    end = 0
+    while end < limit - start and a[-1 - end] == b[-1 - end]:
+        end += 1
+    count_a, count_b = {}, {}
+    for line in a:
+        count_a[line] = count_a.get(line, 0) + 1
+    for line in b:
+        count_b[line] = count_b.get(line, 0) + 1
+    ra, index_a = _reduce(a, count_b, old, start, len(a) - end - 1)
+    rb, index_b = _reduce(b, count_a, new, start, len(b) - end - 1)
+    base = len(rb) + 1
+    kvdf = [0] * (len(ra) + len(rb) + 3)
+    kvdb = [0] * (len(ra) + len(rb) + 3)
+    mxcost = max(_bogosqrt(len(ra) + len(rb) + 3), 256)
+    todo = [(0, len(ra), 0, len(rb), False)]
+    while todo:
+        off1, lim1, off2, lim2, need_min = todo.pop()
+        while off1 < lim1 and off2 < lim2 and ra[off1] == rb[off2]:
+            off1 += 1
+            off2 += 1
+        while off1 < lim1 and off2 < lim2 and ra[lim1 - 1] == rb[lim2 - 1]:
+            lim1 -= 1
+            lim2 -= 1
+        if off1 == lim1:
+            for i in range(off2, lim2):
+                new[index_b[i] + 1] = True
+        elif off2 == lim2:
+            for i in range(off1, lim1):
+                old[index_a[i] + 1] = True
+        else:
+            i1, i2, min_lo, min_hi = _split(ra, off1, lim1, rb, off2, lim2,
+                                            kvdf, kvdb, base, need_min,
+                                            mxcost)
+            todo.append((i1, lim1, i2, lim2, min_hi))
+            todo.append((off1, i1, off2, i2, min_lo))
+    return old, new
+
+
+def _indent(line):
+    """Return indentation width of line or -1 if it is blank (git)"""
+    width = 0
+    for char in line:
+        if char == ' ':
+            width += 1
+        elif char == '\t':
+            width += 8 - width % 8
+        elif not char.isspace():
+            return width
+        if width >= 200:
+            return 200
+    return -1
+
+
+def _split_score(lines, split, score):
+    """Add git indent heuristic penalty of splitting lines before split"""
+    end_of_file = split >= len(lines)
+    indent = -1 if end_of_file else _indent(lines[split])
+    pre_blank, pre_indent = 0, -1
+    for i in range(split - 1, -1, -1):
+        pre_indent = _indent(lines[i])
+        if pre_indent != -1:
+            break
+        pre_blank += 1
+        if pre_blank == 20:
+            pre_indent = 0
+            break
+    post_blank, post_indent = 0, -1
+    for i in range(split + 1, len(lines)):
+        post_indent = _indent(lines[i])
+        if post_indent != -1:
+            break
+        post_blank += 1
+        if post_blank == 20:
+            post_indent = 0
+            break
+    penalty, effective_indent = score
+    if pre_indent == -1 and pre_blank == 0:
+        penalty += 1
+    if end_of_file:
+        penalty += 21
+    post_blank = 1 + post_blank if indent == -1 else 0
+    total_blank = pre_blank + post_blank
+    penalty += -30 * total_blank + 6 * post_blank
+    if indent == -1:
+        indent = post_indent
+    effective_indent += indent
+    if indent == -1 or pre_indent == -1 or indent == pre_indent:
+        pass
+    elif indent > pre_indent:
+        penalty += 10 if total_blank else -4
+    elif post_indent != -1 and post_indent > indent:
+        penalty += 17 if total_blank else 24
+    else:
+        penalty += 17 if total_blank else 23
+    return penalty, effective_indent
+
+
+def _score_cmp(score, other):
+    """Compare two indent heuristic scores the way git does"""
+    indents = (score[1] > other[1]) - (score[1] < other[1])
+    return 60 * indents + score[0] - other[0]
+
+
+class _Group(object):
+    """Run of changed lines in a change flags list, as in git xdiff"""
+
+    def __init__(self, lines, changed):
+        self.lines = lines
+        self.changed = changed
+        self.start = self.end = 0
+        while changed[self.end + 1]:
+            self.end += 1
+
+    def next(self):
+        if self.end == len(self.lines):
+            return False
+        self.start = self.end + 1
+        self.end = self.start
+        while self.changed[self.end + 1]:
+            self.end += 1
+        return True
+
+    def previous(self):
+        if self.start == 0:
+            return False
+        self.end = self.start - 1
+        self.start = self.end
+        while self.changed[self.start]:
+            self.start -= 1
+        return True
+
+    def slide_down(self):
+        if self.end < len(self.lines) and \
+                self.lines[self.start] == self.lines[self.end]:
+            self.changed[self.start + 1] = False
+            self.changed[self.end + 1] = True
+            self.start += 1
+            self.end += 1
+            while self.changed[self.end + 1]:
+                self.end += 1
+            return True
+        return False
+
+    def slide_up(self):
+        if self.start > 0 and \
+                self.lines[self.start - 1] == self.lines[self.end - 1]:
+            self.start -= 1
+            self.end -= 1
+            self.changed[self.start + 1] = True
+            self.changed[self.end + 1] = False
+            while self.changed[self.start]:
+                self.start -= 1
+            return True
+        return False
+
+
+def _compact(lines, changed, other_lines, other_changed,
+             indent_heuristic=True):
+    """Slide groups of changed lines the way git xdl_change_compact does
+
+    Without indent_heuristic groups are left as low as they can slide,
+    which is what shift_boundaries of GNU diff does as well.
+    """
+    group = _Group(lines, changed)
+    other = _Group(other_lines, other_changed)
+    while True:
+        if group.end != group.start:
+            while True:
+                size = group.end - group.start
+                end_matching_other = -1
+                while group.slide_up():
+                    other.previous()
+                earliest_end = group.end
+                if other.end > other.start:
+                    end_matching_other = group.end
+                while group.slide_down():
+                    other.next()
+                    if other.end > other.start:
+                        end_matching_other = group.end
+                if size == group.end - group.start:
+                    break
+            if group.end == earliest_end:
+                pass
+            elif end_matching_other != -1:
+                while other.end == other.start:
+                    group.slide_up()
+                    other.previous()
+            elif indent_heuristic:
+                shift = max(earliest_end, group.end - size - 1,
+                            group.end - 100)
+                best_shift, best_score = -1, None
+                while shift <= group.end:
+                    score = _split_score(lines, shift, (0, 0))
+                    score = _split_score(lines, shift - size, score)
+                    if best_shift == -1 or \
+                            _score_cmp(score, best_score) <= 0:
+                        best_shift, best_score = shift, score
+                    shift += 1
+                while group.end > best_shift:
+                    group.slide_up()
+                    other.previous()
+        if not group.next():
+            break
+        other.next()
+
+
+def git_opcodes(a, b):
+    """Return opcodes turning a into b with changes placed as git does
+
+    Changes are found with git's variant of Myers' algorithm, then
+    groups of changed lines are slid over equal lines and placed by the
+    indent heuristic which git diff uses by default.
+    """
+    old, new = _git_changes(a, b)
+    _compact(a, old, b, new)
+    _compact(b, new, a, old)
+    return _opcodes_from_changes(old, new)
+
+
+def _discard_confusing(equivs, counts, minimal):
+    """Return flags of lines to leave out of the search, as GNU diff does
+
+    Lines without a match in the other file are left out, and so are
+    lines with very many matches when they sit in a run of left out
+    lines. Nothing is left out when a minimal diff is wanted.
+    """
+    end = len(equivs)
+    discards = [0] * end
+    if minimal:
+        return discards
+    many = 5
+    tem = end // 64
+    while tem >> 2 > 0:
+        tem >>= 2
+        many *= 2
+    for i, equiv in enumerate(equivs):
+        matches = counts.get(equiv, 0)
+        if matches == 0:
+            discards[i] = 1
+        elif matches > many:
+            discards[i] = 2
+    i = 0
+    while i < end:
+        if discards[i] == 2:
+            discards[i] = 0
+        elif discards[i]:
+            provisional = 0
+            j = i
+            while j < end and discards[j]:
+                if discards[j] == 2:
+                    provisional += 1
+                j += 1
+            while j > i and discards[j - 1] == 2:
+                j -= 1
+                discards[j] = 0
+                provisional -= 1
+            length = j - i
+            if provisional * 4 > length:
+                while j > i:
+                    j -= 1
+                    if discards[j] == 2:
+                        discards[j] = 0
+            else:
+                minimum = 1
+                tem = length >> 2
+                while tem >> 2 > 0:
+                    tem >>= 2
+                    minimum <<= 1
+                minimum += 1
+                j = consec = 0
+                while j < length:
+                    if discards[i + j] != 2:
+                        consec = 0
+                    else:
+                        consec += 1
+                        if consec == minimum:
+                            j -= consec
+                        elif consec > minimum:
+                            discards[i + j] = 0
+                    j += 1
+                for step in (1, -1):
+                    consec = 0
+                    for j in range(length):
+                        line = i + step * j
+                        if j >= 8 and discards[line] == 1:
+                            break
+                        if discards[line] == 2:
+                            consec = 0
+                            discards[line] = 0
+                        elif discards[line] == 0:
+                            consec = 0
+                        else:
+                            consec += 1
+                        if consec == 3:
+                            break
+                    if step == 1:
+                        i += length - 1
+        i += 1
+    return discards
+
+
+def _diag(xv, xoff, xlim, yv, yoff, ylim, minimal, fd, bd, base,
+          too_expensive):
+    """Find the midpoint of the shortest edit script (diag of GNU diff)
+
+    Returns (x, y, lo_minimal, hi_minimal). Unless minimal is set, the
+    search gives up after too_expensive steps and takes the best point
+    found so far.
+    """
+    dmin, dmax = xoff - ylim, xlim - yoff
+    fmid, bmid = xoff - yoff, xlim - ylim
+    fmin = fmax = fmid
+    bmin = bmax = bmid
+    odd = (fmid - bmid) & 1
+    fd[base + fmid] = xoff
+    bd[base + bmid] = xlim
+    far = xlim + ylim + 1
+    cost = 1
+    while True:
+        if fmin > dmin:
+            fmin -= 1
+            fd[base + fmin - 1] = -1
+        else:
+            fmin += 1
+        if fmax < dmax:
+            fmax += 1
+            fd[base + fmax + 1] = -1
+        else:
+            fmax -= 1
+        for d in range(fmax, fmin - 1, -2):
+            low, high = fd[base + d - 1], fd[base + d + 1]
+            x = high if low < high else low + 1
+            y = x - d
+            while x < xlim and y < ylim and xv[x] == yv[y]:
+                x += 1
+                y += 1
+            fd[base + d] = x
+            if odd and bmin <= d <= bmax and bd[base + d] <= x:
+                return x, y, True, True
+        if bmin > dmin:
+            bmin -= 1
+            bd[base + bmin - 1] = far
+        else:
+            bmin += 1
+        if bmax < dmax:
+            bmax += 1
+            bd[base + bmax + 1] = far
+        else:
+            bmax -= 1
+        for d in range(bmax, bmin - 1, -2):
+            low, high = bd[base + d - 1], bd[base + d + 1]
+            x = low if low < high else high - 1
+            y = x - d
+            while xoff < x and yoff < y and xv[x - 1] == yv[y - 1]:
+                x -= 1
+                y -= 1
+            bd[base + d] = x
+            if not odd and fmin <= d <= fmax and x <= fd[base + d]:
+                return x, y, True, True
+        if not minimal and cost >= too_expensive:
+            fxy_best, fx_best = -1, 0
+            for d in range(fmax, fmin - 1, -2):
+                x = min(fd[base + d], xlim)
+                y = x - d
+                if ylim < y:
+                    x, y = ylim + d, ylim
+                if fxy_best < x + y:
+                    fxy_best, fx_best = x + y, x
+            bxy_best, bx_best = far + xlim + ylim, 0
+            for d in range(bmax, bmin - 1, -2):
+                x = max(xoff, bd[base + d])
+                y = x - d
+                if y < yoff:
+                    x, y = yoff + d, yoff
+                if x + y < bxy_best:
+                    bxy_best, bx_best = x + y, x
+            if (xlim + ylim) - bxy_best < fxy_best - (xoff + yoff):
+                return fx_best, fxy_best - fx_best, True, False
+            return bx_best, bxy_best - bx_best, False, True
+        cost += 1
+
+
+def diff_opcodes(a, b, minimal=False, horizon=0, key=None):
+    """Return opcodes turning a into b with changes placed as GNU diff does
+
+    This follows GNU diff: equal ends are trimmed but for horizon lines,
+    confusing lines are discarded (unless minimal is set), the rest is
+    compared with Myers' linear space algorithm and groups of changed
+    lines are slid over equal lines as far down as they go. Lines are
+    compared by what key returns for them, if given, except for the
+    equal ends which must be the same text.
+    """
+    n, m = len(a), len(b)
+    prefix = 0
+    while prefix < n and prefix < m and a[prefix] == b[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < min(n, m) - prefix and a[-1 - suffix] == b[-1 - suffix]:
+        suffix += 1
+    start = max(prefix - horizon, 0)
+    suffix = max(suffix - horizon, 0)
+    classes = {}
+    key = key or (lambda line: line)
+    equivs = ([classes.setdefault(key(line), len(classes) + 1)
+               for line in a[start:n - suffix]],
+              [classes.setdefault(key(line), len(classes) + 1)
+               for line in b[start:m - suffix]])
+    counts = ({}, {})
+    for side in (0, 1):
+        for equiv in equivs[side]:
+            counts[side][equiv] = counts[side].get(equiv, 0) + 1
+    changed = ([False] * (len(equivs[0]) + 2), [False] * (len(equivs[1]) + 2))
+    kept = ([], [])
+    indexes = ([], [])
+    for side in (0, 1):
+        discards = _discard_confusing(equivs[side], counts[1 - side], minimal)
+        for i, equiv in enumerate(equivs[side]):
+            if discards[i]:
+                changed[side][i + 1] = True
+            else:
+                kept[side].append(equiv)
+                indexes[side].append(i)
+    xv, yv = kept
+    diagonals = len(xv) + len(yv) + 3
+    too_expensive = 1
+    while diagonals:
+        diagonals >>= 2
+        too_expensive <<= 1
+    too_expensive = max(4096, too_expensive)
+    base = len(yv) + 1
+    fd = [0] * (len(xv) + len(yv) + 3)
+    bd = [0] * (len(xv) + len(yv) + 3)
+    todo = [(0, len(xv), 0, len(yv), minimal)]
+    while todo:
+        xoff, xlim, yoff, ylim, find_minimal = todo.pop()
+        while xoff < xlim and yoff < ylim and xv[xoff] == yv[yoff]:
+            xoff += 1
+            yoff += 1
+        while xoff < xlim and yoff < ylim and \
+                xv[xlim - 1] == yv[ylim - 1]:
+            xlim -= 1
+            ylim -= 1
+        if xoff == xlim:
+            for y in range(yoff, ylim):
+                changed[1][indexes[1][y] + 1] = True
+        elif yoff == ylim:
+            for x in range(xoff, xlim):
+                changed[0][indexes[0][x] + 1] = True
+        else:
+            x, y, lo_minimal, hi_minimal = _diag(xv, xoff, xlim, yv, yoff,
+                                                 ylim, find_minimal, fd, bd,
+                                                 base, too_expensive)
+            todo.append((x, xlim, y, ylim, hi_minimal))
+            todo.append((xoff, x, yoff, y, lo_minimal))
+    _compact(equivs[0], changed[0], equivs[1], changed[1], False)
+    _compact(equivs[1], changed[1], equivs[0], changed[0], False)
+    old = [False] * (start + 1) + changed[0][1:-1] + [False] * (suffix + 1)
+    new = [False] * (start + 1) + changed[1][1:-1] + [False] * (suffix + 1)
+    return _opcodes_from_changes(old, new)
+
+
+def grouped_opcodes(codes, context=3):
+    """Yield groups of opcodes, one group per hunk with context lines
+
+    Changes separated by no more than 2 * context unchanged lines are
+    put into the same hunk, as diff -u and git diff do.
+    """
+    codes = list(codes)
+    if not codes or all(c[0] == 'equal' for c in codes):
+        return
+    if codes[0][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[0]
+        codes[0] = tag, max(i1, i2 - context), i2, max(j1, j2 - context), j2
+    if codes[-1][0] == 'equal':
+        tag, i1, i2, j1, j2 = codes[-1]
+        codes[-1] = tag, i1, min(i2, i1 + context), j1, min(j2, j1 + context)
+    group = []
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal' and i2 - i1 > 2 * context:
+            group.append((tag, i1, i1 + context, j1, j1 + context))
+            yield group
+            group = []
+            i1, j1 = i2 - context, j2 - context
+        group.append((tag, i1, i2, j1, j2))
+    if group and not (len(group) == 1 and group[0][0] == 'equal'):
+        yield group
+
+
+def _range(start, count):
+    """Format a hunk range the way diff -u and git diff do"""
+    if count == 1:
+        return str(start + 1)
+    if count == 0:
+        return str(start) + ',0'
+    return str(start + 1) + ',' + str(count)
+
+
+def _line(prefix, line):
+    """Yield a hunk line, followed by the no-newline marker if needed"""
+    if line.endswith('\n'):
+        yield prefix + line
+    else:
+        yield prefix + line + '\n'
+        yield NO_NEWLINE
+
+
+def hunk_lines(a, b, codes, context=3, funcname=None):
+    """Yield lines of unified diff hunks turning list of lines a into b
+
+    codes are the opcodes of the change, from git_opcodes() or
+    diff_opcodes(). Lines are yielded one by one, the whole diff text is
+    never built. If funcname is given, it is called with the list of
+    lines and the index of the line before the hunk and its result is
+    appended to the hunk header.
+    """
+    for group in grouped_opcodes(codes, context):
+        i1, i2 = group[0][1], group[-1][2]
+        j1, j2 = group[0][3], group[-1][4]
+        header = '@@ -' + _range(i1, i2 - i1) + ' +' + \
+            _range(j1, j2 - j1) + ' @@'
+        if funcname:
+            func = funcname(a, i1 - 1)
+            if func:
+                header += ' ' + func
+        yield header + '\n'
+        for tag, i1, i2, j1, j2 in group:
+            if tag == 'equal':
+                for line in a[i1:i2]:
+                    yield from _line(' ', line)
+                continue
+            if tag in ('replace', 'delete'):
+                for line in a[i1:i2]:
+                    yield from _line('-', line)
+            if tag in ('replace', 'insert'):
+                for line in b[j1:j2]:
+                    yield from _line('+', line)
+
+
+def git_funcname(lines, index):
+    """Return the default git hunk header function line before index
+
+    Like git, look backwards for a line starting with a letter, '_' or
+    '$' and cut it to 80 bytes without trailing whitespace.
+    """
+    while index >= 0:
+        line = lines[index]
+        if line and line[0] in _FUNCNAME_START:
+            return line.encode('utf-8')[:80].decode(
+                'utf-8', 'ignore').rstrip()
+        index -= 1
+    return ''
+
+
+def git_diff_lines(path, old, new, abbrev=7, shorten=None):
+    """Yield lines of git diff output for path between two blobs
+
+    Blobs are (object name, text, mode) triples or None if path is
+    missing in that revision. Object names are abbreviated by shorten,
+    if given, else cut to abbrev characters.
+    """
+    if old == new or (old is None and new is None):
+        return
+    if shorten is None:
+        def shorten(name):
+            return name[:abbrev]
+    null = '0' * abbrev
+    yield 'diff --git a/' + path + ' b/' + path + '\n'
+    if old is None:
+        yield 'new file mode ' + new[2] + '\n'
+        yield 'index ' + null + '..' + shorten(new[0]) + '\n'
+    elif new is None:
+        yield 'deleted file mode ' + old[2] + '\n'
+        yield 'index ' + shorten(old[0]) + '..' + null + '\n'
+    elif old[2] != new[2]:
+        yield 'old mode ' + old[2] + '\n'
+        yield 'new mode ' + new[2] + '\n'
+        if old[0] == new[0]:
+            return
+        yield 'index ' + shorten(old[0]) + '..' + shorten(new[0]) + '\n'
+    else:
+        yield 'index ' + shorten(old[0]) + '..' + shorten(new[0]) + ' ' + \
+            old[2] + '\n'
+    old_lines = split_lines(old[1]) if old else []
+    new_lines = split_lines(new[1]) if new else []
+    if not old_lines and not new_lines:
+        # Empty file added or removed, git shows no patch
+        return
+    yield '--- ' + ('a/' + path if old else '/dev/null') + '\n'
+    yield '+++ ' + ('b/' + path if new else '/dev/null') + '\n'
+    yield from hunk_lines(old_lines, new_lines,
+                          git_opcodes(old_lines, new_lines),
+                          funcname=git_funcname)
+
+
+class DiffOptions(object):
+    """Output format and comparison options of GNU diff
+
+    style is 'normal', 'unified' or 'side-by-side', ignore is None,
+    'trailing-space' (-Z), 'space-change' (-b) or 'all-space' (-w).
+    """
+
+    def __init__(self, style='normal', context=3, width=130, ignore=None,
+                 ignore_case=False, expand_tabs=False, tab_size=8,
+                 left_column=False, suppress_common=False, minimal=False,
+                 horizon=0):
+        self.style = style
+        self.context = context
+        self.width = width
+        self.ignore = ignore
+        self.ignore_case = ignore_case
+        self.expand_tabs = expand_tabs
+        self.tab_size = tab_size
+        self.left_column = left_column
+        self.suppress_common = suppress_common
+        self.minimal = minimal
+        self.horizon = horizon
+
+    def key(self, line):
+        """Return what line is compared by, None if compared as it is"""
+        if self.ignore == 'all-space':
+            line = _SPACES.sub('', line)
+        elif self.ignore == 'space-change':
+            line = _SPACES.sub(' ', line).rstrip(_SPACE_CHARS)
+        elif self.ignore == 'trailing-space':
+            line = line.rstrip(_SPACE_CHARS)
+        if self.ignore_case:
+            line = line.lower()
+        return line
+
+    def compares_lines(self):
+        return self.ignore is None and not self.ignore_case
+
+
+_SPACE_CHARS = ' \t\n\v\f\r'
+_SPACES = re.compile('[' + _SPACE_CHARS + ']+')
+
+# Options taking no value: short name, long name and what they set
+_FLAGS = (('u', 'unified', 'style', 'unified'),
+          ('y', 'side-by-side', 'style', 'side-by-side'),
+          ('Z', 'ignore-trailing-space', 'ignore', 'trailing-space'),
+          ('b', 'ignore-space-change', 'ignore', 'space-change'),
+          ('w', 'ignore-all-space', 'ignore', 'all-space'),
+          ('i', 'ignore-case', 'ignore_case', True),
+          ('t', 'expand-tabs', 'expand_tabs', True),
+          (None, 'left-column', 'left_column', True),
+          (None, 'suppress-common-lines', 'suppress_common', True),
+          ('d', 'minimal', 'minimal', True),
+          # Text is always compared as text
+          ('a', 'text', None, None),
+          (None, 'normal', 'style', 'normal'))
+_IGNORE_LEVELS = (None, 'trailing-space', 'space-change', 'all-space')
+# Options taking a number
+_NUMBERS = (('U', 'unified', 'context'),
+            ('W', 'width', 'width'),
+            (None, 'tabsize', 'tab_size'),
+            (None, 'horizon-lines', 'horizon'))
+
+
+def _set_flag(options, flag):
+    attribute, value = flag[2:]
+    if attribute is None:
+        return
+    if attribute == 'ignore' and \
+            _IGNORE_LEVELS.index(options.ignore) > _IGNORE_LEVELS.index(value):
+        return
+    setattr(options, attribute, value)
+    if value == 'unified':
+        options.context = 3
+
+
+def _set_number(options, name, attribute, value):
+    try:
+        number = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('invalid number for ' + name + ': ' + str(value))
+    if number < (1 if attribute in ('tab_size', 'width') else 0):
+        raise ValueError('invalid number for ' + name + ': ' + str(value))
+    setattr(options, attribute, number)
+    if attribute == 'context':
+        options.style = 'unified'
+
+
+def parse_diff_args(args):
+    """Return DiffOptions of a list of GNU diff command line options
+
+    Raises ValueError for options which are not understood here, so that
+    the caller can run diff itself instead.
+    """
+    options = DiffOptions()
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg.startswith('--'):
+            name, equals, value = arg[2:].partition('=')
+            numbers = [number for number in _NUMBERS
+                       if number[1].startswith(name)]
+            flags = [flag for flag in _FLAGS if flag[1].startswith(name)]
+            exact = [option for option in numbers + flags
+                     if option[1] == name]
+            if name == 'unified':
+                exact = [_NUMBERS[0]] if equals else [_FLAGS[0]]
+            found = exact or numbers + flags
+            if not name or len(found) != 1:
+                raise ValueError('unsupported diff option ' + arg)
+            if found[0] in _NUMBERS:
+                if not equals:
+                    if not args:
+                        raise ValueError('missing value of ' + arg)
+                    value = args.pop(0)
+                _set_number(options, arg, found[0][2], value)
+            elif equals:
+                raise ValueError('unexpected value of ' + arg)
+            else:
+                _set_flag(options, found[0])
+        elif arg.startswith('-') and len(arg) > 1:
+            letters = arg[1:]
+            while letters:
+                letter, letters = letters[0], letters[1:]
+                numbers = [number for number in _NUMBERS
+                           if number[0] == letter]
+                flags = [flag for flag in _FLAGS if flag[0] == letter]
+                if numbers:
+                    value = letters
+                    if not value:
+                        if not args:
+                            raise ValueError('missing value of -' + letter)
+                        value = args.pop(0)
+                    _set_number(options, '-' + letter, numbers[0][2], value)
+                    letters = ''
+                elif flags:
+                    _set_flag(options, flags[0])
+                else:
+                    raise ValueError('unsupported diff option -' + letter)
+        else:
+            raise ValueError('unexpected diff argument ' + arg)
+    return options
+
+
+_ESCAPES = {'\a': '\\a', '\b': '\\b', '\t': '\\t', '\n': '\\n',
+            '\v': '\\v', '\f': '\\f', '\r': '\\r', '"': '\\"',
+            '\\': '\\\\'}
+
+
+def quote_name(name):
+    """Quote file name the way GNU diff does in file headers
+
+    Names with spaces, quotes, backslashes, control or non-ASCII
+    characters are put in double quotes with C escapes.
+    """
+    if all(' ' < char < '\x80' and char not in '"\\' for char in name):
+        return name
+    quoted = []
+    for char in name:
+        if char in _ESCAPES:
+            quoted.append(_ESCAPES[char])
+        elif char < ' ' or char >= '\x80':
+            quoted.extend('\\%03o' % byte for byte in char.encode(
+                'utf-8', 'surrogateescape'))
+        else:
+            quoted.append(char)
+    return '"' + ''.join(quoted) + '"'
+
+
+def _label(path):
+    """Return file header label of path with time as GNU diff shows it"""
+    mtime = os.stat(path).st_mtime_ns
+    local = time.localtime(mtime // 1000000000)
+    return quote_name(path) + '\t' + \
+        time.strftime('%Y-%m-%d %H:%M:%S', local) + \
+        '.%09d ' % (mtime % 1000000000) + time.strftime('%z', local)
+
+
+def _number_range(start, end):
+    """Format 0-based line range start:end the way normal diff does"""
+    if end - start > 1:
+        return str(start + 1) + ',' + str(end)
+    return str(end)
+
+
+def normal_lines(a, b, codes):
+    """Yield lines of the normal (default) diff output format"""
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal':
+            continue
+        letter = {'replace': 'c', 'delete': 'd', 'insert': 'a'}[tag]
+        yield _number_range(i1, i2) + letter + _number_range(j1, j2) + '\n'
+        for line in a[i1:i2]:
+            yield from _line('< ', line)
+        if tag == 'replace':
+            yield '---\n'
+        for line in b[j1:j2]:
+            yield from _line('> ', line)
+
+
+def _char_width(char):
+    if unicodedata.combining(char):
+        return 0
+    if unicodedata.east_asian_width(char) in 'WF':
+        return 2
+    return 1
+
+
+def _tab_from_to(out, column, to, options):
+    """Append tabs and spaces moving from column to to, as GNU diff does"""
+    if not options.expand_tabs:
+        tab = column + options.tab_size - column % options.tab_size
+        while tab <= to:
+            out.append('\t')
+            column = tab
+            tab += options.tab_size
+    out.append(' ' * (to - column))
+    return to
+
+
+def _half_line(out, line, indent, bound, options):
+    """Append what fits into bound columns of line, return its width
+
+    This is print_half_line of GNU diff: tabs are kept unless they
+    would cross bound, characters over bound are cut off.
+    """
+    in_position = out_position = 0
+    for char in line:
+        if char == '\n':
+            break
+        if char == '\t':
+            spaces = options.tab_size - in_position % options.tab_size
+            if in_position == out_position:
+                tab_stop = out_position + spaces
+                if options.expand_tabs:
+                    tab_stop = min(tab_stop, bound)
+                    out.append(' ' * (tab_stop - out_position))
+                    out_position = max(out_position, tab_stop)
+                elif tab_stop < bound:
+                    out_position = tab_stop
+                    out.append(char)
+            in_position += spaces
+        elif char == '\r':
+            out.append(char)
+            _tab_from_to(out, 0, indent, options)
+            in_position = out_position = 0
+        elif char == '\b':
+            if in_position:
+                in_position -= 1
+                if in_position < bound:
+                    if out_position <= in_position:
+                        out.append(' ' * (in_position - out_position))
+                        out_position = in_position
+                    else:
+                        out_position = in_position
+                        out.append(char)
+        elif char < ' ' or char == '\x7f':
+            if in_position < bound:
+                out.append(char)
+        else:
+            in_position += _char_width(char)
+            if in_position <= bound:
+                out_position = in_position
+                out.append(char)
+    return out_position
+
+
+def _side_line(left, separator, right, options, half_width, offset):
+    """Return one line of side by side output (print_1sdline of diff)"""
+    out = []
+    column = 0
+    newline = False
+    if left is not None:
+        newline = left.endswith('\n')
+        column = _half_line(out, left, 0, half_width, options)
+    if separator != ' ':
+        column = _tab_from_to(out, column, (half_width + offset - 1) // 2,
+                              options) + 1
+        if separator == '|' and newline != right.endswith('\n'):
+            separator = '/' if newline else '\\'
+        out.append(separator)
+    if right is not None:
+        newline = newline or right.endswith('\n')
+        if not right.startswith('\n'):
+            column = _tab_from_to(out, column, offset, options)
+            _half_line(out, right, column, half_width, options)
+    if newline:
+        out.append('\n')
+    return ''.join(out)
+
+
+def side_by_side_lines(a, b, codes, options):
+    """Yield lines of side by side diff output (diff -y)"""
+    step = 1 if options.expand_tabs else options.tab_size
+    offset = (options.width + step + 3) // (2 * step) * step
+    half_width = max(0, min(offset - 3, options.width - offset))
+    if not half_width:
+        offset = options.width
+    for tag, i1, i2, j1, j2 in codes:
+        if tag == 'equal':
+            if options.suppress_common:
+                continue
+            for i, j in zip(range(i1, i2), range(j1, j2)):
+                if options.left_column:
+                    yield _side_line(a[i], '(', None, options, half_width,
+                                     offset)
+                else:
+                    yield _side_line(a[i], ' ', b[j], options, half_width,
+                                     offset)
+            continue
+        pairs = min(i2 - i1, j2 - j1)
+        for i in range(pairs):
+            yield _side_line(a[i1 + i], '|', b[j1 + i], options, half_width,
+                             offset)
+        for i in range(i1 + pairs, i2):
+            yield _side_line(a[i], '<', None, options, half_width, offset)
+        for j in range(j1 + pairs, j2):
+            yield _side_line(None, '>', b[j], options, half_width, offset)
+
+
+def read_lines(path):
+    """Return list of lines of file at path, undecodable bytes are kept"""
+    with open(path, encoding='utf-8', errors='surrogateescape',
+              newline='') as lines_file:
+        return split_lines(lines_file.read())
+
+
+def diff_lines(old_path, new_path, options=None):
+    """Yield lines of the output of GNU diff comparing two files
+
+    Output is produced line by line as the hunks are walked, so it can
+    be written out without building the whole diff text.
+    """
+    options = options or DiffOptions()
+    a = read_lines(old_path)
+    b = read_lines(new_path)
+    horizon = options.horizon
+    if options.style == 'unified':
+        horizon = max(horizon, options.context)
+    codes = diff_opcodes(a, b, options.minimal, horizon,
+                         None if options.compares_lines() else options.key)
+    if options.style == 'side-by-side':
+        yield from side_by_side_lines(a, b, codes, options)
+    elif options.style == 'unified':
+        if any(code[0] != 'equal' for code in codes):
+            yield '--- ' + _label(old_path) + '\n'
+            yield '+++ ' + _label(new_path) + '\n'
+            yield from hunk_lines(a, b, codes, options.context)
+    else:
+        yield from normal_lines(a, b, codes)
+
+
+def split_lines(text):
+    """Return list of lines of text keeping line ends, split on '\\n' only"""
+    lines = text.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+
+def count(lines):
+    """Return number of lines and characters of iterable of lines"""
+    out_len = out_chars = 0
+    for line in lines:
+        out_len += 1
+        out_chars += len(line)
+    return out_len, out_chars
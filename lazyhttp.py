@@ -0,0 +1,427 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazyhttp -- cached HTTP access for lazytools
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import os
+import sys
+import threading
+import time
+
+import lazytiming
+
+# http.client, urllib, json, hashlib and tempfile are imported where they
+# are used, so that tools only showing --help or not fetching anything
+# start quickly
+
+CACHE_DIR = os.path.join(os.environ.get('XDG_CACHE_HOME') or
+                         os.path.expanduser('~/.cache'), 'lazytools')
+MAX_AGE = 600
+MAX_SIZE = 64 * 1024 * 1024
+MAX_KEEP = 30 * 24 * 3600
+USER_AGENT = 'lazytools/' + _VERSION_
+
+
+class CacheMiss(OSError):
+    """Raised when a page is not in the cache in offline mode"""
+
+
+class _PooledResponse(object):
+    """HTTP response giving its connection back to the pool once read"""
+
+    def __init__(self, pool, key, connection, response):
+        self.pool = pool
+        self.key = key
+        self.connection = connection
+        self.response = response
+        self.status = response.status
+        self.headers = response.headers
+
+    def read(self, size=-1):
+        chunk = self.response.read(None if size < 0 else size)
+        if (size < 0 or (size and not chunk)) and self.connection:
+            self.pool.release(self.key, self.connection)
+            self.connection = None
+        return chunk
+
+    def close(self):
+        if self.connection:
+            # Unread body makes the connection unusable for the next request
+            self.connection.close()
+            self.connection = None
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ConnectionPool(object):
+    """Keep-alive HTTP(S) connections shared between threads
+
+    Each connection is used by one request at a time and is put back to
+    the pool when its response has been read to the end, so requests to
+    the same host reuse connections instead of opening new ones. Proxies
+    are taken from the environment as urllib does (http_proxy,
+    https_proxy, no_proxy): https is tunnelled through CONNECT, http is
+    asked for with absolute URLs.
+    """
+
+    def __init__(self, timeout=60, max_redirects=5):
+        self.timeout = timeout
+        self.max_redirects = max_redirects
+        self.idle = {}
+        self.proxies = {}
+        self.lock = threading.Lock()
+
+    def proxy(self, key):
+        """Return (netloc, Proxy-Authorization or None) of key's proxy
+
+        Returns None when connections to key are direct.
+        """
+        with self.lock:
+            if key in self.proxies:
+                return self.proxies[key]
+        import base64
+        import urllib.request
+        from urllib.parse import unquote, urlsplit
+        scheme, netloc = key
+        url = urllib.request.getproxies().get(scheme)
+        found = None
+        if url and not urllib.request.proxy_bypass(netloc):
+            parts = urlsplit(url if '://' in url else 'http://' + url)
+            auth = None
+            if parts.username is not None:
+                credentials = unquote(parts.username) + ':' + \
+                    unquote(parts.password or '')
+                auth = 'Basic ' + base64.b64encode(
+                    credentials.encode('utf-8')).decode('ascii')
+            found = parts.netloc.rpartition('@')[2], auth
+        with self.lock:
+            self.proxies[key] = found
+        return found
+
+    def acquire(self, key):
+        import http.client
+        with self.lock:
+            if self.idle.get(key):
+                return self.idle[key].pop(), True
+        scheme, netloc = key
+        proxy = self.proxy(key)
+        host = netloc if proxy is None else proxy[0]
+        if scheme == 'https':
+            connection = http.client.HTTPSConnection(host,
+                                                     timeout=self.timeout)
+            if proxy is not None:
+                connection.set_tunnel(netloc, headers=proxy[1] and {
+                    'Proxy-Authorization': proxy[1]})
+            return connection, False
+        return http.client.HTTPConnection(host, timeout=self.timeout), False
+
+    def release(self, key, connection):
+        with self.lock:
+            self.idle.setdefault(key, []).append(connection)
+
+    def _send(self, key, target, headers):
+        import http.client
+        connection, reused = self.acquire(key)
+        try:
+            connection.request('GET', target, headers=headers)
+            return connection, connection.getresponse()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            if not reused:
+                raise
+        # The server may have closed an idle connection, try a fresh one
+        return self._send(key, target, headers)
+
+    def request(self, url, headers=None):
+        """Send GET request for url, return response with status and read()
+
+        Redirections are followed, responses with status 400 and above
+        raise HTTPError. Status 304 is returned like 200.
+        """
+        from urllib.error import HTTPError
+        from urllib.parse import urljoin, urlsplit
+        headers = dict(headers or {})
+        headers.setdefault('User-Agent', USER_AGENT)
+        for _ in range(self.max_redirects + 1):
+            parts = urlsplit(url)
+            key = (parts.scheme, parts.netloc)
+            target = parts.path or '/'
+            if parts.query:
+                target += '?' + parts.query
+            sent = headers
+            proxy = self.proxy(key)
+            if proxy is not None and parts.scheme == 'http':
+                # Proxies are asked for absolute URLs of plain http
+                target = parts.scheme + '://' + parts.netloc + target
+                if proxy[1]:
+                    sent = dict(headers, **{'Proxy-Authorization': proxy[1]})
+            connection, response = self._send(key, target, sent)
+            if response.status in (301, 302, 303, 307, 308) and \
+                    response.getheader('Location'):
+                response.read()
+                self.release(key, connection)
+                url = urljoin(url, response.getheader('Location'))
+                continue
+            pooled = _PooledResponse(self, key, connection, response)
+            if response.status >= 400:
+                pooled.close()
+                raise HTTPError(url, response.status, response.reason,
+                                response.headers, None)
+            return pooled
+        raise HTTPError(url, response.status, 'Too many redirections',
+                        response.headers, None)
+
+
+POOL = ConnectionPool()
+
+
+class _CachingReader(object):
+    """File-like HTTP response storing the body in the cache as it is read
+
+    The entry is written only when the body has been read to the end.
+    """
+
+    def __init__(self, cache, url, response):
+        import tempfile
+        self.cache = cache
+        self.url = url
+        self.response = response
+        self.size = 0
+        fd, self.tmp_name = tempfile.mkstemp(dir=cache.directory,
+                                             suffix='.tmp')
+        self.tmp_file = os.fdopen(fd, 'wb')
+
+    def read(self, size=-1):
+        chunk = self.response.read(size)
+        if self.tmp_file:
+            if chunk:
+                self.tmp_file.write(chunk)
+                self.size += len(chunk)
+            if size < 0 or (size and not chunk):
+                self.tmp_file.close()
+                self.tmp_file = None
+                self.cache.store(self.url, self.tmp_name, self.size,
+                                 self.response.headers)
+        return chunk
+
+    def close(self):
+        if self.tmp_file:
+            self.tmp_file.close()
+            self.tmp_file = None
+            os.unlink(self.tmp_name)
+        self.response.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class HTTPCache(object):
+    """On-disk cache of HTTP responses keyed by URL
+
+    Entries younger than max_age seconds are served without asking the
+    server, older ones are revalidated with If-None-Match and
+    If-Modified-Since. In offline mode only the cache is used. Entries
+    are evicted when the cache grows over max_size bytes or when they
+    were not used for max_keep seconds.
+    """
+
+    def __init__(self, directory=CACHE_DIR, max_age=MAX_AGE, offline=False,
+                 max_size=MAX_SIZE, max_keep=MAX_KEEP, pool=POOL):
+        self.directory = os.path.join(directory, 'http')
+        self.pool = pool
+        self.max_age = max_age
+        self.offline = offline
+        self.max_size = max_size
+        self.max_keep = max_keep
+        os.makedirs(self.directory, exist_ok=True)
+
+    def paths(self, url):
+        """Return paths of metadata and body files of url"""
+        import hashlib
+        key = hashlib.sha1(url.encode('utf-8')).hexdigest()
+        base = os.path.join(self.directory, key)
+        return base + '.json', base + '.body'
+
+    def lookup(self, url):
+        """Return metadata of cached url or None
+
+        Entries which cannot be read back are removed.
+        """
+        import json
+        meta_path, body_path = self.paths(url)
+        try:
+            with open(meta_path) as meta_file:
+                meta = json.load(meta_file)
+            if meta['url'] != url or \
+                    os.path.getsize(body_path) != meta['size']:
+                raise ValueError('cache entry does not match')
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError, KeyError, TypeError):
+            self.remove(url)
+            return None
+        return meta
+
+    def remove(self, url):
+        for path in self.paths(url):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def _write_meta(self, url, meta):
+        import json
+        import tempfile
+        meta_path = self.paths(url)[0]
+        fd, tmp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as meta_file:
+            json.dump(meta, meta_file)
+        os.replace(tmp_name, meta_path)
+
+    def store(self, url, body_name, size, headers):
+        """Move downloaded body_name into the cache as the entry of url"""
+        meta = {'url': url, 'size': size, 'stored': time.time(),
+                'etag': headers.get('ETag'),
+                'last_modified': headers.get('Last-Modified')}
+        os.replace(body_name, self.paths(url)[1])
+        self._write_meta(url, meta)
+        self.evict()
+
+    def _open_body(self, url):
+        body_path = self.paths(url)[1]
+        # Modification time of the body tells eviction when it was used
+        os.utime(body_path)
+        return open(body_path, 'rb')
+
+    def open(self, url, max_age=None):
+        """Return file-like object with the body of url
+
+        max_age, if given, overrides the max_age of the cache.
+        """
+        import http.client
+        from urllib.error import HTTPError
+        if max_age is None:
+            max_age = self.max_age
+        meta = self.lookup(url)
+        if meta and (self.offline or
+                     time.time() - meta['stored'] < max_age):
+            lazytiming.count('http.cache.fresh')
+            return self._open_body(url)
+        if self.offline:
+            raise CacheMiss('not in cache: ' + url)
+        headers = {}
+        if meta and meta['etag']:
+            headers['If-None-Match'] = meta['etag']
+        if meta and meta['last_modified']:
+            headers['If-Modified-Since'] = meta['last_modified']
+        try:
+            response = self.pool.request(url, headers)
+        except HTTPError:
+            raise
+        except (OSError, http.client.HTTPException) as err:
+            if not meta:
+                raise
+            print('Using stale cached ' + url + ': ' + str(err),
+                  file=sys.stderr)
+            lazytiming.count('http.cache.stale')
+            return self._open_body(url)
+        if response.status == 304 and meta:
+            response.read()
+            meta['stored'] = time.time()
+            self._write_meta(url, meta)
+            lazytiming.count('http.cache.revalidated')
+            return self._open_body(url)
+        lazytiming.count('http.cache.miss')
+        return _CachingReader(self, url, response)
+
+    def evict(self):
+        """Remove entries unused for max_keep and the oldest over max_size"""
+        entries = []
+        now = time.time()
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            if name.endswith('.tmp'):
+                # Leftovers of interrupted downloads
+                if now - stat.st_mtime > 24 * 3600:
+                    os.unlink(path)
+            elif name.endswith('.body'):
+                entries.append((stat.st_mtime, stat.st_size, path[:-5]))
+        entries.sort(reverse=True)
+        total = 0
+        for mtime, size, base in entries:
+            total += size
+            if total > self.max_size or now - mtime > self.max_keep:
+                for path in (base + '.json', base + '.body'):
+                    try:
+                        os.unlink(path)
+                    except FileNotFoundError:
+                        pass
+
+
+def open_url(url, cache=None, max_age=None):
+    """Return file-like response of url, read through cache if given
+
+    Time until the response can be read is recorded as span fetch.
+    """
+    with lazytiming.span('fetch'):
+        if cache:
+            return cache.open(url, max_age)
+        return POOL.request(url)
+
+
+def add_arguments(parser):
+    """Add options for fetching stats pages to argparse parser"""
+    parser.add_argument('-w', '--workers', metavar='N', type=int, default=4,
+                        help='Fetch up to N pages at once (default: '
+                        '%(default)s)')
+    parser.add_argument('--base-url', metavar='URL', type=str,
+                        help='Fetch stats pages from URL instead of '
+                        'www.debian.org')
+    parser.add_argument('--cache-dir', metavar='DIR', type=str,
+                        default=CACHE_DIR,
+                        help='Keep cached pages in DIR '
+                        '(default: %(default)s)')
+    parser.add_argument('--max-age', metavar='SECONDS', type=int,
+                        default=MAX_AGE,
+                        help='Revalidate cached pages older than SECONDS '
+                        '(default: %(default)s)')
+    parser.add_argument('--offline', action='store_const', const=True,
+                        default=False,
+                        help='Only use cached pages, do not connect')
+    parser.add_argument('--no-http-cache', action='store_const', const=True,
+                        default=False,
+                        help='Do not use the cache of pages')
+
+
+def from_args(args):
+    """Return HTTPCache configured by options of add_arguments or None"""
+    if args.no_http_cache and not args.offline:
+        return None
+    return HTTPCache(args.cache_dir, args.max_age, args.offline)
@@ -0,0 +1,420 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazyindex -- local index of translation status of all languages
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import argparse
+import os
+import sys
+import time
+
+import lazyhttp
+import lazyoutput
+import lazytiming
+import lazyup
+
+# sqlite3, hashlib and the modules fetching and parsing stats pages are
+# imported by the command using them
+
+INDEX = os.path.join(lazyhttp.CACHE_DIR, 'index.sqlite')
+
+# Columns of rows of pages and of pages summed up over languages
+PAGE_COLUMNS = ('language', 'path', 'status', 'section', 'size', 'lines',
+                'chars', 'old', 'new')
+SUMMARY_COLUMNS = ('path', 'languages', 'size', 'lines', 'chars')
+
+
+class Index(object):
+    """SQLite index of untranslated and outdated pages of all languages
+
+    Pages are keyed by language and path. Untranslated pages have status
+    'untranslated', their section and size, outdated ones 'outdated' (or
+    the status the stats page gives when it is not simply outdated), the
+    revisions of the translation and of the original and the lines and
+    characters of the diff between them. Each language keeps the digest
+    of the stats page (or of the pages of the checkout) it was indexed
+    from and whether diff sizes were computed then.
+    """
+
+    SCHEMA = 2
+
+    def __init__(self, path=INDEX):
+        import sqlite3
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30)
+        with self.connection:
+            version = self.connection.execute(
+                'PRAGMA user_version').fetchone()[0]
+            if version != self.SCHEMA:
+                self.connection.execute('DROP TABLE IF EXISTS pages')
+                self.connection.execute('DROP TABLE IF EXISTS languages')
+                self.connection.execute('PRAGMA user_version = %d' %
+                                        self.SCHEMA)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS languages (language TEXT '
+                'PRIMARY KEY, digest TEXT, indexed INTEGER, '
+                'sizes INTEGER)')
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS pages (language TEXT, '
+                'path TEXT, status TEXT, section TEXT, size INTEGER, '
+                'lines INTEGER, chars INTEGER, old TEXT, new TEXT, '
+                'command TEXT, PRIMARY KEY (language, path))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS pages_path '
+                                    'ON pages (path)')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS '
+                                    'pages_status ON pages (status, size)')
+
+    def digests(self):
+        """Return {language: (digest, whether diff sizes were computed)}"""
+        return dict((language, (digest, bool(sizes)))
+                    for language, digest, sizes in self.connection.execute(
+                        'SELECT language, digest, sizes FROM languages'))
+
+    def replace(self, language, digest, pages, sizes=True):
+        """Replace pages of language, tuples of the columns of pages
+
+        sizes tells whether diff sizes of outdated pages were computed.
+        """
+        with self.connection:
+            self.connection.execute('DELETE FROM pages WHERE language = ?',
+                                    (language,))
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO pages VALUES '
+                '(?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', pages)
+            self.connection.execute(
+                'INSERT OR REPLACE INTO languages VALUES (?, ?, ?, ?)',
+                (language, digest, int(time.time()), int(sizes)))
+
+    def touch(self, language):
+        """Record that language was found unchanged"""
+        with self.connection:
+            self.connection.execute('UPDATE languages SET indexed = ? WHERE '
+                                    'language = ?', (int(time.time()),
+                                                     language))
+
+    def execute(self, sql, params=()):
+        return self.connection.execute(sql, params)
+
+    def close(self):
+        self.connection.close()
+
+
+class _DigestReader(object):
+    """File-like object hashing what is read through it"""
+
+    def __init__(self, stream):
+        import hashlib
+        self.stream = stream
+        self.hash = hashlib.sha1()
+
+    def read(self, size=-1):
+        chunk = self.stream.read(size)
+        self.hash.update(chunk)
+        return chunk
+
+
+def _diff_revisions(command):
+    """Return (old, new) revisions of git or cvs diff command
+
+    Returns (None, None) for other commands.
+    """
+    found = lazyup.parse_git_diff(command)
+    if found is not None:
+        return found[:2]
+    words = command.split()
+    if words[:2] == ['cvs', 'diff']:
+        revisions = [words[num + 1] for num, word in enumerate(words[:-1])
+                     if word == '-r']
+        if len(revisions) == 2:
+            return tuple(revisions)
+    return None, None
+
+
+def scan(language, indexed, cache, sizer, executor, args, metadata=None):
+    """Return (digest, pages) of language
+
+    Pages come from the stats page of language or, given metadata, from
+    the originals and translation-check headers of the checkout in the
+    current directory (see lazyscan). indexed is (digest, sizes) of the
+    language in the index or None. pages is None when the digest did not
+    change and diff sizes were computed then or are not asked for now.
+    Diff sizes of outdated pages are computed by sizer, if given.
+    """
+    import hashlib
+
+    import lazystats
+    # (old, new) revisions of outdated pages by path, looked up in their
+    # diff commands unless known
+    revisions = {}
+    if metadata is None:
+        with lazystats.fetch(language, args.base_url, cache) as page:
+            reader = _DigestReader(page)
+            rows = list(lazystats.iter_rows(reader, outdated=True))
+        found = reader.hash.hexdigest()
+    else:
+        import lazyscan
+        rows = lazyscan.untranslated_rows(language)
+        for path, translation, revision, original in \
+                lazyscan.outdated_pages(language, metadata, executor):
+            rows.append(lazyscan.outdated_row(path, translation, revision,
+                                              original))
+            revisions[path] = (translation, revision)
+        found = 'local:' + hashlib.sha1(
+            repr(rows).encode('utf-8')).hexdigest()
+    if indexed is not None and found == indexed[0] and not args.force and \
+            (indexed[1] or sizer is None):
+        return found, None
+    outdated = [row for row in rows if isinstance(row, lazystats.Outdated)]
+    sizes = {}
+    if sizer is not None:
+        for path, lines, chars, command in lazyup.iter_entries(
+                lazyup.outdated_rows(outdated), max(args.jobs, 1),
+                sizer.size, executor):
+            sizes[path, command] = (lines, chars)
+    pages = []
+    for row in rows:
+        if isinstance(row, lazystats.Untranslated):
+            pages.append((language, row.path, 'untranslated', row.section,
+                          row.size, None, None, None, None, None))
+            continue
+        old, new = revisions.get(row.path) or _diff_revisions(row.command)
+        lines, chars = sizes.get((row.path, row.command), (None, None))
+        status = 'outdated' if row.status == lazystats.ORIGINAL_NEWER \
+            else row.status
+        pages.append((language, row.path, status, None, None, lines, chars,
+                      old, new, row.command))
+    return found, pages
+
+
+def main(argv=None, prog=None):
+    """Run lazytools index with arguments argv, return exit status"""
+    parser = argparse.ArgumentParser(prog=prog, description="Index "
+                                     "untranslated and outdated pages of "
+                                     "languages for lazytools query, only "
+                                     "pages changed since the last run are "
+                                     "indexed again")
+    parser.add_argument('languages', metavar='language', type=str, nargs='*',
+                        help='Index these languages (default: those '
+                        'indexed before)')
+    parser.add_argument('-a', '--all', action='store_const', const=True,
+                        default=False,
+                        help='Index all languages listed on the stats page '
+                        '(with --local, all language directories)')
+    parser.add_argument('-l', '--local', action='store_const', const=True,
+                        default=False,
+                        help='Index originals and translation-check headers '
+                        'of the checkout instead of the stats page, run at '
+                        'the top of webwml')
+    parser.add_argument('-i', '--index', metavar='FILE', type=str,
+                        default=INDEX,
+                        help='Keep the index in FILE (default: %(default)s)')
+    parser.add_argument('-f', '--force', action='store_const', const=True,
+                        default=False,
+                        help='Index languages again even if their stats pages '
+                        'did not change')
+    parser.add_argument('-n', '--no-sizes', action='store_const', const=True,
+                        default=False,
+                        help='Do not compute diff sizes of outdated pages')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int,
+                        default=os.cpu_count() or 1,
+                        help='Compute up to N diff sizes at once '
+                        '(default: number of CPUs)')
+    parser.add_argument('-x', '--exec-diff', action='store_const', const=True,
+                        default=False,
+                        help='Run diff commands instead of computing diff '
+                        'sizes of short pages in-process')
+
+    lazyup.add_cache_arguments(parser)
+    lazyhttp.add_arguments(parser)
+    lazytiming.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    lazytiming.start(args)
+
+    import lazystats
+    from concurrent.futures import ThreadPoolExecutor
+
+    index = Index(args.index)
+    digests = index.digests()
+    cache = lazyhttp.from_args(args)
+    metadata = None
+    if args.local:
+        import lazyscan
+        import lazyvcs
+        metadata = lazyvcs.open_metadata()
+        languages = lazyscan.languages() if args.all else args.languages
+    else:
+        languages = lazystats.select_languages(args.languages, args.all,
+                                               args.base_url, cache)
+    if not languages:
+        languages = sorted(digests)
+    if not languages:
+        parser.error('specify at least one language or --all')
+
+    sizer = executor = size_cache = None
+    if not args.no_sizes:
+        size_cache = lazyup.open_size_cache(args)
+        sizer = lazyup.DiffSizer(not args.exec_diff, cache=size_cache)
+        executor = ThreadPoolExecutor(max_workers=max(args.jobs, 1))
+    status = 0
+    for language, found, error in lazystats.run_languages(
+            languages, lambda l: scan(l, digests.get(l), cache, sizer,
+                                      executor, args, metadata),
+            args.workers):
+        if error:
+            print(language + ': ' + str(error), file=sys.stderr)
+            status = 1
+            continue
+        digest, pages = found
+        if pages is None:
+            index.touch(language)
+            print(language + ': unchanged', file=sys.stderr)
+            continue
+        with lazytiming.span('index', rows=len(pages)):
+            index.replace(language, digest, pages, sizer is not None)
+        print(language + ': %d pages' % len(pages), file=sys.stderr)
+    index.close()
+    if executor is not None:
+        executor.shutdown()
+        sizer.close()
+    if size_cache is not None:
+        size_cache.close()
+        if args.verbose:
+            print(size_cache.statistics(), file=sys.stderr)
+    return status
+
+
+def select(args):
+    """Return (SQL, parameters, column names) of query args ask for"""
+    where = []
+    params = []
+    if args.language:
+        where.append('language IN (%s)' % ', '.join('?' * len(args.language)))
+        params.extend(args.language)
+    if args.status:
+        where.append('status = ?')
+        params.append(args.status)
+    if args.section:
+        where.append('section = ?')
+        params.append(args.section)
+    if args.path:
+        where.append('path GLOB ?')
+        params.append(args.path)
+    for column, operator, value in (('size', '>=', args.min_size),
+                                    ('size', '<=', args.max_size),
+                                    ('lines', '>=', args.min_lines),
+                                    ('lines', '<=', args.max_lines)):
+        if value is not None:
+            where.append('%s %s ?' % (column, operator))
+            params.append(value)
+    sql = ' WHERE ' + ' AND '.join(where) if where else ''
+    order = ' DESC' if args.reverse else ''
+    if args.by_page:
+        columns = SUMMARY_COLUMNS
+        sql = 'SELECT path, count(*) AS languages, sum(size) AS size, ' \
+            'sum(lines) AS lines, sum(chars) AS chars FROM pages' + sql + \
+            ' GROUP BY path'
+        sort_by = args.sort_by or 'languages'
+        if not args.sort_by:
+            # Pages of most languages first unless asked otherwise
+            order = '' if args.reverse else ' DESC'
+        sql += ' ORDER BY %s%s, path' % (sort_by, order)
+    else:
+        columns = PAGE_COLUMNS
+        sql = 'SELECT ' + ', '.join(columns) + ' FROM pages' + sql
+        if args.sort_by:
+            sql += ' ORDER BY %s%s, language, path' % (args.sort_by, order)
+        else:
+            sql += ' ORDER BY language%s, path' % order
+    if args.top is not None:
+        sql += ' LIMIT ?'
+        params.append(args.top)
+    return sql, params, columns
+
+
+def query_main(argv=None, prog=None):
+    """Run lazytools query with arguments argv, return exit status"""
+    parser = argparse.ArgumentParser(prog=prog, description="Show pages "
+                                     "of the index built by lazytools index, "
+                                     "or pages summed up over languages")
+    parser.add_argument('-l', '--language', metavar='language', type=str,
+                        action='append',
+                        help='Show only pages of language, may be given '
+                        'several times')
+    parser.add_argument('--status', metavar='STATUS', type=str,
+                        help="Show only pages of STATUS ('untranslated', "
+                        "'outdated' or another status of the stats page)")
+    parser.add_argument('--section', metavar='SECTION', type=str,
+                        help='Show only untranslated pages of SECTION')
+    parser.add_argument('--path', metavar='GLOB', type=str,
+                        help='Show only pages with paths matching GLOB')
+    parser.add_argument('--min-size', metavar='N', type=int,
+                        help='Show only pages of at least N bytes')
+    parser.add_argument('--max-size', metavar='N', type=int,
+                        help='Show only pages of at most N bytes')
+    parser.add_argument('--min-lines', metavar='N', type=int,
+                        help='Show only pages with diffs of at least N lines')
+    parser.add_argument('--max-lines', metavar='N', type=int,
+                        help='Show only pages with diffs of at most N lines')
+    parser.add_argument('-p', '--by-page', action='store_const', const=True,
+                        default=False,
+                        help='Show pages with the number of languages they '
+                        'match and their sizes summed up, pages of most '
+                        'languages first')
+    parser.add_argument('-s', '--sort-by', choices=sorted(
+                        set(PAGE_COLUMNS + SUMMARY_COLUMNS)),
+                        help='Sort on this column (default: language and '
+                        'path, languages with --by-page)')
+    parser.add_argument('-r', '--reverse', action='store_const', const=True,
+                        default=False,
+                        help='Reverse the order')
+    parser.add_argument('-t', '--top', metavar='K', type=int,
+                        help='Show only the first K pages')
+    parser.add_argument('-i', '--index', metavar='FILE', type=str,
+                        default=INDEX,
+                        help='Read the index from FILE (default: %(default)s)')
+
+    lazyoutput.add_arguments(parser)
+    lazytiming.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    lazytiming.start(args)
+
+    columns = SUMMARY_COLUMNS if args.by_page else PAGE_COLUMNS
+    if args.sort_by and args.sort_by not in columns:
+        parser.error('cannot sort on ' + args.sort_by +
+                     (' with --by-page' if args.by_page else
+                      ' without --by-page'))
+    if not os.path.exists(args.index):
+        print(parser.prog + ': no index at ' + args.index + ', run '
+              'lazytools index first', file=sys.stderr)
+        return 1
+    sql, params, columns = select(args)
+    index = Index(args.index)
+    output = lazyoutput.from_args(args, columns, language=False)
+    with lazytiming.span('query'):
+        output.write(None, index.execute(sql, params))
+    output.close()
+    index.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,118 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazyoutput -- output formats of results of lazytools
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import csv
+import json
+import sys
+from json.encoder import encode_basestring
+
+FORMATS = ('repr', 'json', 'jsonl', 'csv', 'tsv')
+
+
+class Writer(object):
+    """Write rows of results of languages to stream as they come
+
+    repr writes every row as a Python tuple (or sequence) on a line of
+    its own, under '# language' when grouped, as the tools always did.
+    json writes one array of objects, jsonl one object per line and csv
+    and tsv a header line and one line per row; all of these have the
+    language as their first field. Rows are written one by one, nothing
+    but the current row is built in memory. Without language, rows are
+    written as they are and write() takes None for the language.
+    """
+
+    def __init__(self, stream, format, names, grouped=False,
+                 sequence=tuple, language=True):
+        self.stream = stream
+        self.format = format
+        self.names = (('language',) if language else ()) + tuple(names)
+        self.language = language
+        self.grouped = grouped
+        self.sequence = sequence
+        self.rows = 0
+        if format in ('csv', 'tsv'):
+            self.csv = csv.writer(stream, 'excel-tab' if format == 'tsv'
+                                  else 'excel', lineterminator='\n')
+            self.csv.writerow(self.names)
+        elif format in ('json', 'jsonl'):
+            self.encode = json.JSONEncoder(ensure_ascii=False).encode
+            self.quote = encode_basestring
+            # Names are encoded once, each row only fills in its values
+            self.template = '{' + ', '.join(
+                encode_basestring(name).replace('%', '%%') + ': %s'
+                for name in self.names) + '}'
+            if format == 'json':
+                stream.write('[')
+        elif format != 'repr':
+            raise ValueError('unknown format ' + format)
+
+    def value(self, value):
+        """Return JSON of value of a field"""
+        if value.__class__ is str:
+            return self.quote(value)
+        if value.__class__ is int:
+            return repr(value)
+        return self.encode(value)
+
+    def write(self, language, rows):
+        """Write rows (sequences of fields in names) of language"""
+        write = self.stream.write
+        if self.format == 'repr':
+            if self.grouped:
+                write('# ' + language + '\n')
+            for row in rows:
+                write(repr(self.sequence(row)))
+                write('\n')
+        elif self.format in ('json', 'jsonl'):
+            template = self.template
+            value = self.value
+            language = (self.quote(language),) if self.language else ()
+            array = self.format == 'json'
+            for row in rows:
+                if array:
+                    write(',\n' if self.rows else '\n')
+                write(template % (language + tuple(map(value, row))))
+                if not array:
+                    write('\n')
+                self.rows += 1
+        else:
+            writerow = self.csv.writerow
+            language = (language,) if self.language else ()
+            for row in rows:
+                writerow(language + row)
+
+    def close(self):
+        if self.format == 'json':
+            self.stream.write('\n]\n' if self.rows else ']\n')
+        self.stream.flush()
+
+
+def add_arguments(parser):
+    """Add option choosing the output format to argparse parser"""
+    parser.add_argument('--format', choices=FORMATS, default='repr',
+                        help='Write results as Python tuples (default), a '
+                        'JSON array, JSON lines, CSV or TSV with the '
+                        'language in the first field')
+
+
+def from_args(args, names, grouped=False, sequence=tuple, language=True):
+    """Return Writer to standard output of format option of add_arguments"""
+    return Writer(sys.stdout, args.format, names, grouped, sequence,
+                  language)
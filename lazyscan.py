@@ -0,0 +1,432 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazyscan -- translation-check headers of pages in a local checkout
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import argparse
+import os
+import re
+import shutil
+import sys
+import tempfile
+import threading
+
+import lazyclient
+import lazytiming
+
+# lazystats (with html.parser) and modules rewriting pages and looking
+# up revisions are imported by the functions and commands using them
+
+ORIGINAL = 'english'
+PAGE_SUFFIXES = ('.wml', '.src')
+SKIP_DIRECTORIES = frozenset(['CVS', '.git'])
+TRANSLATION_CHECK = b'#use wml::debian::translation-check'
+# Sections of the stats page listing untranslated pages of these top
+# directories, other pages are in 'untranslated'
+SECTION_DIRECTORIES = {
+    'News': 'untranslated-news',
+    'consultants': 'untranslated-user',
+    'users': 'untranslated-user',
+    'international': 'untranslated-l10n',
+}
+_ATTRIBUTE = re.compile(r'(\w+)="([^"]*)"')
+_TRANSLATION = re.compile(rb'(\stranslation=")[^"]*(")')
+_GIT_NAME = re.compile(r'[0-9a-f]{4,40}\Z')
+# Languages scanned at once share one metadata index
+_metadata_lock = threading.Lock()
+
+
+def read_header(path):
+    """Return attributes of translation-check header of page at path
+
+    Only the leading '#' lines of the page are read, None is returned if
+    none of them is a translation-check header.
+    """
+    with open(path, 'rb') as page:
+        for line in page:
+            if not line.startswith(b'#'):
+                break
+            if line.startswith(TRANSLATION_CHECK):
+                return dict(_ATTRIBUTE.findall(
+                    line[len(TRANSLATION_CHECK):].decode('utf-8',
+                                                         'replace')))
+    return None
+
+
+def _scan_directory(directory, names):
+    headers = []
+    for name in names:
+        try:
+            header = read_header(os.path.join(directory, name))
+        except OSError:
+            continue
+        if header is not None:
+            headers.append((name, header))
+    return directory, headers
+
+
+def iter_headers(language, top='.', executor=None):
+    """Yield (path, header attributes) of translated pages of language
+
+    Paths are relative to the directory of language under top. The tree
+    is walked once and the headers of the pages of each directory are
+    read on executor, if given.
+    """
+    root = os.path.join(top, language)
+    directories = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames
+                             if name not in SKIP_DIRECTORIES)
+        pages = [name for name in sorted(filenames)
+                 if name.endswith(PAGE_SUFFIXES)]
+        if pages:
+            directories.append((dirpath, pages))
+    with lazytiming.span('scan', rows=sum(len(pages) for _, pages
+                                          in directories)):
+        if executor is None:
+            scanned = (_scan_directory(*found) for found in directories)
+        else:
+            scanned = executor.map(_scan_directory,
+                                   *zip(*directories)) if directories else ()
+        for directory, headers in scanned:
+            prefix = os.path.relpath(directory, root)
+            for name, header in headers:
+                yield os.path.normpath(os.path.join(prefix, name)), header
+
+
+def languages(top='.'):
+    """Return names of language directories of the checkout at top"""
+    return sorted(name for name in os.listdir(top)
+                  if name != ORIGINAL and name.islower() and
+                  os.path.isfile(os.path.join(top, name, 'index.wml')))
+
+
+def is_newer(revision, translation):
+    """Tell whether revision of original is newer than translation's one
+
+    Git revisions are newer unless one is a prefix of the other (headers
+    may hold abbreviated names), CVS ones are compared number by number.
+    """
+    if revision.startswith(translation) or translation.startswith(revision):
+        return False
+    try:
+        return tuple(map(int, revision.split('.'))) > \
+            tuple(map(int, translation.split('.')))
+    except ValueError:
+        return True
+
+
+def _is_ancestor(revision, translation):
+    # Whether git knows translation as the commit revision or a later one
+    import subprocess
+    try:
+        result = subprocess.run(['git', 'merge-base', '--is-ancestor',
+                                 revision, translation],
+                                stdout=subprocess.DEVNULL,
+                                stderr=subprocess.DEVNULL)
+    except OSError:
+        return False
+    return result.returncode == 0
+
+
+def newer_originals(pairs, executor=None):
+    """Return set of (revision, translation) pairs with the original newer
+
+    Pairs are compared with is_newer() first. Git commits left are then
+    looked up in the repository of the current directory: translations
+    naming the commit of the original or a later one are up to date,
+    names git does not know count as older. Lookups run on executor, if
+    given.
+    """
+    newer = set(pair for pair in set(pairs) if is_newer(*pair))
+    commits = [pair for pair in newer
+               if all(_GIT_NAME.match(name) for name in pair)]
+    with lazytiming.span('git ancestry', pairs=len(commits)):
+        if executor is None or not commits:
+            known = [_is_ancestor(*pair) for pair in commits]
+        else:
+            known = executor.map(_is_ancestor, *zip(*commits))
+        return newer - set(pair for pair, ancestor in zip(commits, known)
+                           if ancestor)
+
+
+def diff_command(old, new, original):
+    """Return command showing changes of original between old and new"""
+    if '.' in old:
+        return 'cvs diff -u -r ' + old + ' -r ' + new + ' ' + original
+    return 'git diff ' + old + '..' + new[:max(len(old), 7)] + ' -- ' + \
+        original
+
+
+def _page_paths(root):
+    # Paths of pages under root relative to it, '/' separated
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = sorted(name for name in dirnames
+                             if name not in SKIP_DIRECTORIES)
+        prefix = os.path.relpath(dirpath, root).replace(os.sep, '/')
+        for name in sorted(filenames):
+            if name.endswith(PAGE_SUFFIXES):
+                yield (name if prefix == '.' else prefix + '/' + name,
+                       os.path.join(dirpath, name))
+
+
+def untranslated_rows(language, top='.'):
+    """Return lazystats.Untranslated rows of originals not in language
+
+    Sizes are those of the originals in bytes, sections are taken from
+    the top directory of the page as SECTION_DIRECTORIES tells.
+    """
+    import lazystats
+    translated = set(path for path, _ in
+                     _page_paths(os.path.join(top, language)))
+    rows = []
+    with lazytiming.span('scan originals'):
+        for path, full in _page_paths(os.path.join(top, ORIGINAL)):
+            if path in translated:
+                continue
+            try:
+                size = os.path.getsize(full)
+            except OSError:
+                continue
+            rows.append(lazystats.Untranslated(
+                path, size, SECTION_DIRECTORIES.get(path.split('/')[0],
+                                                    'untranslated')))
+    return rows
+
+
+def outdated_pages(language, metadata, executor=None):
+    """Return (path, translation, revision, original) of outdated pages
+
+    Translation revisions of the headers of pages of language are
+    compared with revisions of the originals looked up in metadata (a
+    lazyvcs or lazyclient metadata index) all at once. Pages without
+    header or whose original is gone are left out, as are translations
+    of the current original or a later commit (see newer_originals()).
+    Language and originals are looked up in the
+    current directory, paths are relative to the language directory.
+    """
+    pages = []
+    for path, header in iter_headers(language, executor=executor):
+        translation = header.get('translation')
+        if translation:
+            original = (header.get('original') or ORIGINAL) + '/' + \
+                path.replace(os.sep, '/')
+            pages.append((path, translation.strip(), original))
+    with _metadata_lock:
+        revisions = metadata.revisions([original for _, _, original
+                                        in pages])
+    outdated = []
+    for path, translation, original in pages:
+        revision = revisions.get(original)
+        if revision and not revision.startswith('-'):
+            outdated.append((path, translation, revision, original))
+    newer = newer_originals([(revision, translation) for _, translation,
+                             revision, _ in outdated], executor)
+    return [page for page in outdated if (page[2], page[1]) in newer]
+
+
+def outdated_row(path, translation, revision, original):
+    """Return lazystats.Outdated row of a page of outdated_pages()"""
+    import lazystats
+    return lazystats.Outdated(path, diff_command(translation, revision,
+                                                 original),
+                              lazystats.ORIGINAL_NEWER)
+
+
+def outdated_rows(language, metadata, executor=None):
+    """Return lazystats.Outdated rows of pages of language found locally
+
+    Pages are those of outdated_pages().
+    """
+    return [outdated_row(*page)
+            for page in outdated_pages(language, metadata, executor)]
+
+
+def original_path(target, header, top='.'):
+    """Return path of the original of target, a page under its language
+
+    ValueError is raised if target is not a page under a language
+    directory of the checkout at top.
+    """
+    relative = os.path.relpath(os.path.abspath(target),
+                               os.path.abspath(top))
+    parts = relative.replace(os.sep, '/').split('/')
+    if len(parts) < 2 or parts[0] in ('..', '.'):
+        raise ValueError('not under a language directory of ' +
+                         os.path.abspath(top))
+    return (header.get('original') or ORIGINAL) + '/' + '/'.join(parts[1:])
+
+
+def update_header(path, revision):
+    """Set translation revision of translation-check header of page
+
+    Only the leading '#' lines are read one by one, the rest is copied in
+    blocks to a file next to the page, which is renamed over it. Returns
+    False, leaving the page alone, if it has no translation-check header.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp_name = tempfile.mkstemp(dir=directory or '.', suffix='.tmp',
+                                    prefix='.' + name)
+    try:
+        with open(path, 'rb') as src_file, \
+                os.fdopen(fd, 'wb') as dest_file:
+            found = False
+            while True:
+                line = src_file.readline()
+                if not line.startswith(b'#'):
+                    break
+                if not found and line.startswith(TRANSLATION_CHECK):
+                    line, found = _TRANSLATION.subn(
+                        lambda match: match.group(1) +
+                        revision.encode('ascii') + match.group(2), line, 1)
+                dest_file.write(line)
+            if found:
+                dest_file.write(line)
+                shutil.copyfileobj(src_file, dest_file, 1024 * 1024)
+            mode = os.fstat(src_file.fileno()).st_mode
+        if not found:
+            os.unlink(tmp_name)
+            return False
+        os.chmod(tmp_name, mode & 0o7777)
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+    return True
+
+
+def _update_headers(updates):
+    # Runs in worker processes, takes and returns plain tuples
+    return [(path, update_header(path, revision))
+            for path, _, revision in updates]
+
+
+def header_updates(targets, metadata):
+    """Return (updates, problems) of translation-check headers of targets
+
+    updates are (target, translation revision, current revision of the
+    original) of targets whose original changed since, problems (target,
+    reason) of those which cannot be updated. Revisions of all originals
+    are looked up in metadata at once.
+    """
+    found = []
+    problems = []
+    for target in targets:
+        try:
+            header = read_header(target)
+        except OSError as err:
+            problems.append((target, err.strerror or str(err)))
+            continue
+        if header is None or 'translation' not in header:
+            problems.append((target, 'no translation-check header'))
+            continue
+        try:
+            original = original_path(target, header)
+        except ValueError as err:
+            problems.append((target, str(err)))
+            continue
+        found.append((target, header['translation'].strip(), original))
+    with lazytiming.span('metadata revisions', files=len(found)):
+        revisions = metadata.revisions([original for _, _, original
+                                        in found])
+    updates = []
+    for target, translation, original in found:
+        revision = revisions.get(original)
+        if not revision or revision.startswith('-'):
+            problems.append((target, 'no revision of ' + original))
+        else:
+            updates.append((target, translation, revision))
+    newer = newer_originals([(revision, translation) for _, translation,
+                             revision in updates])
+    return [update for update in updates
+            if (update[2], update[1]) in newer], problems
+
+
+def update_main(argv=None, prog=None):
+    """Run lazytools update-header with arguments argv, return exit status"""
+    parser = argparse.ArgumentParser(prog=prog, description="Set the "
+                                     "translation revision of translation-"
+                                     "check headers of translated pages to "
+                                     "the current revision of their "
+                                     "originals, run at the top of webwml")
+    parser.add_argument('path', metavar='path', type=str, nargs='*',
+                        help="Update these translated pages, directories "
+                        "and glob patterns select all pages in them")
+    parser.add_argument('-o', '--outdated', metavar='language', type=str,
+                        action='append', default=[],
+                        help='Update all pages of language whose originals '
+                        'are newer, may be given several times')
+    parser.add_argument('-n', '--dry-run', action='store_const', const=True,
+                        default=False,
+                        help='Only show which headers would change')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int,
+                        default=os.cpu_count() or 1,
+                        help='Rewrite pages in up to N processes at once '
+                        '(default: number of CPUs)')
+
+    lazyclient.add_arguments(parser)
+    lazytiming.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    lazytiming.start(args)
+
+    if not args.path and not args.outdated:
+        parser.error('specify pages or --outdated')
+
+    import lazycopy
+    import lazyvcs
+    client = lazyclient.connect(args)
+    metadata = client.metadata() if client is not None \
+        else lazyvcs.open_metadata()
+    targets = lazycopy.expand_paths(args.path) if args.path else []
+    updates, problems = header_updates(targets, metadata)
+    # Outdated pages come with both revisions, their headers are not read
+    # again
+    seen = set(os.path.abspath(target) for target, _, _ in updates)
+    for language in args.outdated:
+        for path, translation, revision, _ in outdated_pages(language,
+                                                             metadata):
+            target = os.path.join(language, path)
+            if os.path.abspath(target) not in seen:
+                seen.add(os.path.abspath(target))
+                updates.append((target, translation, revision))
+    for target, reason in problems:
+        print(target + ': ' + reason, file=sys.stderr)
+    for target, translation, revision in updates:
+        print(target + ': ' + translation + ' -> ' + revision)
+    if args.dry_run or not updates:
+        return 1 if problems else 0
+
+    jobs = min(max(args.jobs, 1), len(updates))
+    # Pages are handed to the processes in batches, not one by one
+    batches = [updates[num::jobs] for num in range(jobs)]
+    with lazytiming.span('update', files=len(updates)):
+        if jobs == 1:
+            results = [_update_headers(updates)]
+        else:
+            from concurrent.futures import ProcessPoolExecutor
+            with ProcessPoolExecutor(max_workers=jobs) as executor:
+                results = list(executor.map(_update_headers, batches))
+    status = 1 if problems else 0
+    for path, updated in (found for batch in results for found in batch):
+        if not updated:
+            print(path + ': no translation revision in header',
+                  file=sys.stderr)
+            status = 1
+    return status
@@ -0,0 +1,317 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazyserve -- daemon keeping stats pages and VCS metadata warm
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import argparse
+import json
+import os
+import signal
+import socketserver
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import lazyclient
+import lazyhttp
+import lazystats
+import lazytiming
+import lazyup
+import lazyvcs
+
+REFRESH = 300
+UNTRANSLATED = (('path', str), ('size', int), ('section', str))
+OUTDATED = (('path', str), ('command', str), ('status', str))
+
+
+class Daemon(object):
+    """Parsed stats pages, metadata indexes and diff sizes kept in memory
+
+    Rows of the stats page of each language asked for are kept and
+    fetched again every refresh seconds in the background (through
+    cache, so unchanged pages are only revalidated), or when a request
+    finds them older than it allows. Metadata indexes are kept per
+    checkout and parse CVS/Entries again only when they change, git ones
+    when the index or HEAD changes. Diff sizes are kept by command,
+    which names the revisions it compares, up to max_sizes of them, the
+    least recently used are forgotten first.
+    """
+
+    def __init__(self, base_url=None, cache=None, jobs=1, refresh=REFRESH,
+                 max_sizes=lazyup.MAX_SIZES):
+        self.base_url = base_url or lazystats.BASE_URL
+        self.cache = cache
+        self.jobs = max(jobs, 1)
+        self.refresh = refresh
+        self.max_sizes = max_sizes
+        self.lock = threading.Lock()
+        self.tables = {}
+        self.loaded = {}
+        self.indexes = {}
+        self.sizers = {}
+        self.sizes = OrderedDict()
+        self.executor = ThreadPoolExecutor(max_workers=self.jobs)
+        self.stopped = threading.Event()
+
+    def load(self, base_url, language, max_age=None):
+        """Fetch and parse stats page of language
+
+        Returns Rows of untranslated pages and Rows of outdated ones.
+        Cached page is revalidated if older than max_age.
+        """
+        untranslated = lazystats.Rows(UNTRANSLATED)
+        outdated = lazystats.Rows(OUTDATED)
+        loaded = time.time()
+        with lazystats.fetch(language, base_url, self.cache,
+                             max_age) as page:
+            for row in lazystats.iter_rows(page, outdated=True):
+                if isinstance(row, lazystats.Outdated):
+                    outdated.append(row)
+                else:
+                    untranslated.append(row)
+        rows = (untranslated, outdated)
+        with self.lock:
+            self.tables[base_url, language] = rows
+            self.loaded[base_url, language] = loaded
+        return rows
+
+    def table(self, base_url, language, max_age=None):
+        """Return (untranslated, outdated) Rows of language
+
+        The stats page is fetched if it is new or was loaded more than
+        max_age seconds ago.
+        """
+        base_url = base_url or self.base_url
+        with self.lock:
+            rows = self.tables.get((base_url, language))
+            loaded = self.loaded.get((base_url, language))
+        if rows is None or (max_age is not None and
+                            time.time() - loaded >= max_age):
+            rows = self.load(base_url, language, max_age)
+        return rows
+
+    def refresher(self, preload=()):
+        """Load languages of preload, then refresh known pages until stop"""
+        for language in preload:
+            self._reload(self.base_url, language)
+        while not self.stopped.wait(self.refresh):
+            with self.lock:
+                keys = list(self.tables)
+            for base_url, language in keys:
+                self._reload(base_url, language)
+
+    def _reload(self, base_url, language):
+        try:
+            with lazytiming.span('refresh'):
+                self.load(base_url, language)
+        except Exception as err:
+            print('Failed to refresh ' + language + ': ' + str(err),
+                  file=sys.stderr)
+
+    def index(self, cwd):
+        """Return (lock, metadata index) of checkout at cwd"""
+        with self.lock:
+            found = self.indexes.get(cwd)
+            if found is None:
+                found = self.indexes[cwd] = (threading.Lock(),
+                                             lazyvcs.open_metadata(cwd))
+        return found
+
+    def lookup(self, cwd, paths, statuses):
+        """Return {path: revision or status} of paths relative to cwd"""
+        lock, metadata = self.index(cwd)
+        if isinstance(metadata, lazyvcs.CVSMetadata):
+            # CVS index takes paths relative to the daemon, not to cwd
+            full = dict((os.path.join(cwd, path), path) for path in paths)
+        else:
+            full = dict((path, path) for path in paths)
+        with lock:
+            if statuses:
+                found = metadata.statuses(list(full))
+            else:
+                found = metadata.revisions(list(full))
+        return dict((full[path], value) for path, value in found.items())
+
+    def sizer(self, cwd, exec_diff):
+        with self.lock:
+            sizer = self.sizers.get((cwd, exec_diff))
+            if sizer is None:
+                sizer = self.sizers[cwd, exec_diff] = lazyup.DiffSizer(
+                    not exec_diff, cwd)
+        return sizer
+
+    def size(self, sizer, key, command):
+        """Return size of command by sizer, kept under key"""
+        with self.lock:
+            found = self.sizes.get(key)
+            if found is not None:
+                self.sizes.move_to_end(key)
+                return found
+        found = sizer.size(command)
+        with self.lock:
+            self.sizes[key] = found
+            while len(self.sizes) > self.max_sizes:
+                self.sizes.popitem(last=False)
+        return found
+
+    def outdated(self, base_url, language, cwd, exec_diff, max_age=None):
+        """Return entries [file, lines, chars, command] of outdated pages"""
+        rows = self.table(base_url, language, max_age)[1]
+        sizer = self.sizer(cwd, exec_diff)
+        return list(lazyup.iter_entries(
+            lazyup.outdated_rows(rows), self.jobs,
+            lambda command: self.size(sizer, (cwd, exec_diff, command),
+                                      command), self.executor))
+
+    def answer(self, request):
+        """Return result of request, a dictionary with its command"""
+        command = request.get('command')
+        base_url = request.get('base_url')
+        if command == 'ping':
+            return _VERSION_
+        if command == 'languages':
+            return lazystats.languages(base_url or self.base_url,
+                                       self.cache)
+        if command == 'todo':
+            sections = frozenset(request['sections'])
+            return [(path, size) for path, size, section in
+                    self.table(base_url, request['language'],
+                               request.get('max_age'))[0]
+                    if section in sections]
+        if command == 'outdated':
+            return self.outdated(base_url, request['language'],
+                                 request['cwd'], bool(request['exec_diff']),
+                                 request.get('max_age'))
+        if command in ('revisions', 'statuses'):
+            return self.lookup(request['cwd'], request['paths'],
+                               command == 'statuses')
+        raise ValueError('unknown command ' + str(command))
+
+    def close(self):
+        self.stopped.set()
+        self.executor.shutdown()
+        for sizer in self.sizers.values():
+            sizer.close()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        request = self.rfile.readline()
+        if not request:
+            return
+        try:
+            with lazytiming.span('request'):
+                answer = {'result': self.server.daemon.answer(
+                    json.loads(request.decode('utf-8')))}
+        except Exception as err:
+            answer = {'error': str(err) or type(err).__name__}
+        self.wfile.write(json.dumps(answer).encode('utf-8') + b'\n')
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """Server answering requests of lazyclient with daemon"""
+
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        self.daemon = daemon
+        socketserver.UnixStreamServer.__init__(self, path, _Handler)
+
+
+def listen(path, daemon):
+    """Return Server of daemon bound to Unix socket at path
+
+    Socket left by a daemon which is gone is replaced, OSError is raised
+    if another daemon answers on path.
+    """
+    if os.path.exists(path):
+        try:
+            lazyclient.Client(path, lazyclient.PING_TIMEOUT).request('ping')
+        except (OSError, ValueError):
+            os.unlink(path)
+        else:
+            raise OSError('a daemon is already running on ' + path)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    umask = os.umask(0o077)
+    try:
+        return Server(path, daemon)
+    finally:
+        os.umask(umask)
+
+
+def main(argv=None, prog=None):
+    """Run lazytools serve with arguments argv, return exit status"""
+    parser = argparse.ArgumentParser(prog=prog, description="Keep stats "
+                                     "pages and metadata of checkouts in "
+                                     "memory and answer lazytodo, lazyup "
+                                     "and lazycopy from them")
+    parser.add_argument('languages', metavar='language', type=str, nargs='*',
+                        help='Load stats pages of these languages at start')
+    parser.add_argument('-a', '--all', action='store_const', const=True,
+                        default=False,
+                        help='Load all languages listed on the stats page')
+    parser.add_argument('--refresh', metavar='SECONDS', type=int,
+                        default=REFRESH,
+                        help='Fetch known stats pages again every SECONDS '
+                        '(default: %(default)s)')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int,
+                        default=os.cpu_count() or 1,
+                        help='Compute up to N diff sizes at once '
+                        '(default: number of CPUs)')
+    parser.add_argument('--socket', metavar='PATH', type=str,
+                        default=lazyclient.SOCKET,
+                        help='Listen on Unix socket PATH '
+                        '(default: %(default)s)')
+
+    lazyhttp.add_arguments(parser)
+    lazytiming.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    lazytiming.start(args)
+
+    cache = lazyhttp.from_args(args)
+    daemon = Daemon(args.base_url, cache, args.jobs, max(args.refresh, 1))
+    try:
+        preload = lazystats.select_languages(args.languages, args.all,
+                                             args.base_url, cache)
+        server = listen(args.socket, daemon)
+    except OSError as err:
+        print(parser.prog + ': ' + str(err), file=sys.stderr)
+        return 1
+    # Stopping with SIGTERM cleans up like ^C does
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    threading.Thread(target=daemon.refresher, args=(preload,),
+                     daemon=True).start()
+    print('Listening on ' + args.socket, file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        os.unlink(args.socket)
+        server.server_close()
+        daemon.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
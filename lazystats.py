@@ -0,0 +1,288 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazystats -- streaming parser of Debian website translation stats
+#
+# Copyright (C) 2015-2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import codecs
+import heapq
+import re
+import sys
+import time
+from array import array
+from collections import namedtuple
+from html.parser import HTMLParser
+
+import lazyhttp
+import lazytiming
+
+BASE_URL = 'https://www.debian.org/devel/website/stats/'
+
+# Anchors of the tables of untranslated pages: general pages, news items,
+# consultant/user pages and international pages
+SECTIONS = ('untranslated', 'untranslated-news', 'untranslated-user',
+            'untranslated-l10n')
+OUTDATED_SUMMARY = 'Outdated translations'
+ORIGINAL_NEWER = 'The original is newer than this translation'
+
+Untranslated = namedtuple('Untranslated', 'path size section')
+Outdated = namedtuple('Outdated', 'path command status')
+
+
+class StatsParser(HTMLParser):
+    """Incremental parser of a stats page
+
+    Rows of the tables of untranslated pages in sections and, if
+    outdated is set, of the table of outdated translations are
+    collected as soon as they are fed and handed out by pop_rows().
+    """
+
+    def __init__(self, sections=SECTIONS, outdated=False):
+        HTMLParser.__init__(self)
+        self.sections = frozenset(sections)
+        self.outdated = outdated
+        self.rows = []
+        self.section = None
+        self.current_link = None
+        self.size = None
+        self.in_outdated = False
+        self.cells = None
+        self.cell = None
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'a':
+            for name, value in attrs:
+                if name == 'name' and value in self.sections:
+                    self.section = value
+        if self.section:
+            self.get_link(tag, attrs)
+        if self.outdated:
+            self.get_cell(tag, attrs)
+
+    def handle_endtag(self, tag):
+        # Size may come in several pieces when split between chunks or
+        # tags, cells without a number in them are skipped
+        if tag == 'td' and self.size is not None:
+            try:
+                size = int(''.join(self.size))
+            except ValueError:
+                size = None
+            if size is not None:
+                self.rows.append(Untranslated(self.current_link, size,
+                                              self.section))
+            self.size = None
+        if tag == 'table':
+            self.section = None
+            self.in_outdated = False
+        elif tag == 'td' and self.cell is not None:
+            self.cells.append(self.cell)
+            self.cell = None
+        elif tag == 'tr' and self.cells is not None:
+            if len(self.cells) > 2:
+                self.rows.append(Outdated(''.join(self.cells[0][0]),
+                                          ''.join(self.cells[1][0]),
+                                          self.cells[2][1]))
+            self.cells = None
+
+    def handle_data(self, data):
+        if self.size is not None:
+            self.size.append(data)
+        if self.cell is not None:
+            self.cell[0].append(data)
+
+    def get_link(self, tag, attrs):
+        if tag == 'a' and len(attrs) > 1:
+            self.current_link = attrs[1][1][1:]
+        if tag == 'td' and ('align', 'right') in attrs:
+            self.size = []
+
+    def get_cell(self, tag, attrs):
+        if tag == 'table':
+            self.in_outdated = ('summary', OUTDATED_SUMMARY) in attrs
+        elif not self.in_outdated:
+            return
+        elif tag == 'tr':
+            self.cells = []
+        elif tag == 'td' and self.cells is not None:
+            self.cell = ([], None)
+        elif tag == 'a' and self.cell is not None and self.cell[1] is None:
+            self.cell = (self.cell[0], dict(attrs).get('title'))
+
+    def pop_rows(self):
+        """Return rows parsed so far and forget them"""
+        rows = self.rows
+        self.rows = []
+        return rows
+
+
+class LanguagesParser(HTMLParser):
+    """Parser of the stats index page collecting links to language pages"""
+
+    LINK = re.compile(r'^([a-z][a-z_-]*)(\.[a-z-]+)?(\.html)?$')
+
+    def __init__(self):
+        HTMLParser.__init__(self)
+        self.languages = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag != 'a':
+            return
+        match = self.LINK.match(dict(attrs).get('href') or '')
+        if match and match.group(1) != 'index' and \
+                match.group(1) not in self.languages:
+            self.languages.append(match.group(1))
+
+
+def fetch(language, base_url=None, cache=None, max_age=None):
+    """Open stats page of language, return file-like HTTP response
+
+    The page is read through cache, a lazyhttp.HTTPCache, if given,
+    revalidated if older than max_age (default: max_age of cache).
+    """
+    return lazyhttp.open_url((base_url or BASE_URL) + language, cache,
+                             max_age)
+
+
+def languages(base_url=None, cache=None):
+    """Return list of languages linked from the stats index page"""
+    parser = LanguagesParser()
+    with fetch('', base_url, cache) as page:
+        parser.feed(page.read().decode('utf-8'))
+    parser.close()
+    return parser.languages
+
+
+def select_languages(names, every, base_url=None, cache=None):
+    """Return languages named on the command line or all of them"""
+    if every:
+        return languages(base_url, cache)
+    return list(names)
+
+
+def run_languages(names, work, workers):
+    """Run work(language) for each language on a pool of workers
+
+    Yields (language, result, error) in the order of names as soon as
+    the work for a language and those before it is done. A failing
+    language gives its exception as error and does not stop the others.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+        work = lazytiming.profiled(work)
+        futures = [(name, executor.submit(work, name)) for name in names]
+        for name, future in futures:
+            try:
+                yield name, future.result(), None
+            except Exception as err:
+                yield name, None, err
+
+
+def iter_rows(stream, sections=SECTIONS, outdated=False, chunk_size=65536):
+    """Yield rows of stats page read from stream chunk by chunk
+
+    Rows are yielded while the page is still being read, the page is
+    never held in memory as a whole. With timings on, reading and parsing
+    are recorded as spans fetch.read and parse.
+    """
+    parser = StatsParser(sections, outdated)
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    timed = lazytiming.enabled()
+    read_time = parse_time = 0.0
+    size = count = 0
+    while True:
+        if timed:
+            start = time.perf_counter()
+        chunk = stream.read(chunk_size)
+        if timed:
+            parsed = time.perf_counter()
+            read_time += parsed - start
+        parser.feed(decoder.decode(chunk, final=not chunk))
+        if not chunk:
+            parser.close()
+        rows = parser.pop_rows()
+        if timed:
+            parse_time += time.perf_counter() - parsed
+            size += len(chunk)
+            count += len(rows)
+        yield from rows
+        if not chunk:
+            break
+    lazytiming.record('fetch.read', read_time, bytes=size)
+    lazytiming.record('parse', parse_time, rows=count)
+
+
+def top_rows(rows, count, key, largest=False):
+    """Return count smallest (or largest) rows sorted on key
+
+    Rows are consumed one by one by heapq.nsmallest (or nlargest), which
+    keeps only count of them, rows with equal keys keep the order they
+    came in.
+    """
+    if count <= 0:
+        return []
+    if largest:
+        return heapq.nlargest(count, rows, key)
+    return heapq.nsmallest(count, rows, key)
+
+
+def sort_rows(rows, key, reverse=False, top=None):
+    """Return rows sorted on key, only top ones of them if top is given
+
+    The sort is stable, so rows with equal keys keep the order they
+    came in, with reverse as well.
+    """
+    if top is not None:
+        return top_rows(rows, top, key, reverse)
+    return sorted(rows, key=key, reverse=reverse)
+
+
+class Rows(object):
+    """Rows of results kept column by column
+
+    columns is a sequence of (name, int or str). Integer columns are
+    arrays of machine integers and string columns lists of interned
+    strings, so paths seen in several languages or tables are stored
+    once. Rows are appended and handed out as plain tuples.
+    """
+
+    __slots__ = ('names', 'types', 'columns')
+
+    def __init__(self, columns, rows=()):
+        self.names = tuple(name for name, _ in columns)
+        self.types = tuple(kind for _, kind in columns)
+        self.columns = tuple(array('q') if kind is int else []
+                             for kind in self.types)
+        self.extend(rows)
+
+    def append(self, row):
+        for column, kind, value in zip(self.columns, self.types, row):
+            if kind is str and value is not None:
+                value = sys.intern(value)
+            column.append(value)
+
+    def extend(self, rows):
+        for row in rows:
+            self.append(row)
+
+    def __len__(self):
+        return len(self.columns[0])
+
+    def __getitem__(self, index):
+        return tuple(column[index] for column in self.columns)
+
+    def __iter__(self):
+        return zip(*self.columns)
@@ -0,0 +1,284 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazytiming -- timings of run phases of lazytools
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import atexit
+import cProfile
+import json
+import sys
+import threading
+import time
+
+_ENABLED = False
+_LOCK = threading.Lock()
+_SPANS = {}
+_STARTED = None
+_PROFILER = None
+_THREAD_PROFILES = []
+# From Python 3.12 cProfile is built on sys.monitoring: one profiler sees
+# every thread and no other can be enabled while it runs
+_PROFILES_ALL_THREADS = sys.version_info >= (3, 12)
+
+# Counters shown as a rate per second of the span
+RATES = {'bytes': 'bytes/s', 'rows': 'rows/s'}
+
+
+class _NullSpan(object):
+    """Span doing nothing, handed out while timings are off"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def add(self, **counters):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class _Span(object):
+    """Timed span recorded under its name when it ends"""
+
+    __slots__ = ('name', 'counters', 'start')
+
+    def __init__(self, name, counters):
+        self.name = name
+        self.counters = counters
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.name, time.perf_counter() - self.start, **self.counters)
+        return False
+
+    def add(self, **counters):
+        """Add to counters (bytes, rows, ...) of the span"""
+        for name, value in counters.items():
+            self.counters[name] = self.counters.get(name, 0) + value
+
+
+class _TimedIterator(object):
+    """Iterator keeping the time spent producing the items"""
+
+    __slots__ = ('iterator', 'seconds', 'items')
+
+    def __init__(self, iterable):
+        self.iterator = iter(iterable)
+        self.seconds = 0.0
+        self.items = 0
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self.iterator)
+        finally:
+            self.seconds += time.perf_counter() - start
+        self.items += 1
+        return item
+
+
+def enabled():
+    return _ENABLED
+
+
+def enable():
+    """Start recording spans"""
+    global _ENABLED, _STARTED
+    _ENABLED = True
+    _STARTED = time.perf_counter()
+
+
+def span(name, **counters):
+    """Return context manager timing a span of the run under name
+
+    Spans with the same name add up. While timings are off the same
+    do-nothing object is returned, so spans cost next to nothing.
+    """
+    if not _ENABLED:
+        return _NULL_SPAN
+    return _Span(name, counters)
+
+
+def record(name, seconds, **counters):
+    """Add a span of seconds (None if not timed) and counters to name"""
+    if not _ENABLED:
+        return
+    with _LOCK:
+        entry = _SPANS.get(name)
+        if entry is None:
+            entry = _SPANS[name] = {'count': 0, 'seconds': None}
+        entry['count'] += 1
+        if seconds is not None:
+            entry['seconds'] = (entry['seconds'] or 0.0) + seconds
+        for counter, value in counters.items():
+            entry[counter] = entry.get(counter, 0) + value
+
+
+def count(name, **counters):
+    """Count an event under name without timing it"""
+    record(name, None, **counters)
+
+
+def consume(name, function, iterable, *args, **kwargs):
+    """Return function(iterable, ...) timed as span name
+
+    Time spent producing the items of iterable (reading, parsing or
+    waiting for them) is left out of the span.
+    """
+    if not _ENABLED:
+        return function(iterable, *args, **kwargs)
+    items = _TimedIterator(iterable)
+    start = time.perf_counter()
+    result = function(items, *args, **kwargs)
+    record(name, time.perf_counter() - start - items.seconds,
+           rows=items.items)
+    return result
+
+
+def profiled(function):
+    """Return function profiled when it runs, for work done by threads
+
+    Before Python 3.12 cProfile only sees the thread it was enabled in,
+    so work handed to a pool is wrapped with this to show up in the
+    profile as well. Later versions profile all threads at once and
+    function is returned as it is, as it is when profiling is off.
+    """
+    if _PROFILER is None or _PROFILES_ALL_THREADS:
+        return function
+
+    def run(*args, **kwargs):
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler is active and sees this thread already
+            return function(*args, **kwargs)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            profile.disable()
+            with _LOCK:
+                _THREAD_PROFILES.append(profile)
+    return run
+
+
+def snapshot():
+    """Return wall time of the run and a copy of the recorded spans"""
+    with _LOCK:
+        spans = dict((name, dict(entry)) for name, entry in _SPANS.items())
+    wall = time.perf_counter() - _STARTED if _STARTED is not None else 0.0
+    return wall, spans
+
+
+def summary():
+    """Return lines of a human readable table of the recorded spans"""
+    wall, spans = snapshot()
+    lines = ['Timings (wall %.3fs, spans of concurrent work add up):' % wall,
+             '  %-24s %7s %10s %10s  %s' % ('span', 'count', 'total',
+                                           'mean', 'counters')]
+    for name in sorted(spans, key=lambda name: -(spans[name]['seconds'] or
+                                                  0.0)):
+        entry = spans[name]
+        seconds = entry['seconds']
+        details = []
+        for counter in sorted(entry):
+            if counter in ('count', 'seconds'):
+                continue
+            detail = '%s %d' % (counter, entry[counter])
+            if counter in RATES and seconds:
+                detail += ' (%.0f %s)' % (entry[counter] / seconds,
+                                          RATES[counter])
+            details.append(detail)
+        if seconds is None:
+            total = mean = '-'
+        else:
+            total = '%.3fs' % seconds
+            mean = '%.4fs' % (seconds / entry['count'])
+        lines.append('  %-24s %7d %10s %10s  %s' % (name, entry['count'],
+                                                   total, mean,
+                                                   ', '.join(details)))
+    return lines
+
+
+def add_arguments(parser):
+    """Add options for timings and profiling to argparse parser"""
+    parser.add_argument('--timings', action='store_const', const=True,
+                        default=False,
+                        help='Show how long the phases of the run took')
+    parser.add_argument('--timings-json', metavar='FILE', type=str,
+                        help='Write timings of the phases of the run as JSON '
+                        'to FILE')
+    parser.add_argument('--profile', metavar='FILE', type=str, nargs='?',
+                        const='-',
+                        help='Profile the run with cProfile, show the top '
+                        'functions or save the statistics to FILE')
+
+
+def start(args):
+    """Turn on what options of add_arguments ask for
+
+    Timings and the profile are reported when the program exits.
+    """
+    global _PROFILER
+    if not (args.timings or args.timings_json or args.profile):
+        return
+    if args.timings or args.timings_json:
+        enable()
+    if args.profile:
+        _PROFILER = cProfile.Profile()
+        _PROFILER.enable()
+    atexit.register(finish, args)
+
+
+def finish(args):
+    """Stop profiling, report timings and profile as args ask for"""
+    if _PROFILER:
+        _PROFILER.disable()
+    if args.timings:
+        print('\n'.join(summary()), file=sys.stderr)
+    if args.timings_json:
+        wall, spans = snapshot()
+        with open(args.timings_json, 'w') as timings_file:
+            json.dump({'wall': wall, 'spans': spans}, timings_file,
+                      indent=2, sort_keys=True)
+            timings_file.write('\n')
+    if _PROFILER:
+        # pstats brings in dataclasses and inspect, only --profile needs it
+        import pstats
+        stats = pstats.Stats(_PROFILER, stream=sys.stderr)
+        with _LOCK:
+            for profile in _THREAD_PROFILES:
+                # pstats refuses profiles which saw no call at all
+                profile.create_stats()
+                if profile.stats:
+                    stats.add(profile)
+        if args.profile == '-':
+            stats.sort_stats('cumulative').print_stats(30)
+        else:
+            stats.dump_stats(args.profile)
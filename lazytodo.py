@@ -19,93 +19,110 @@
 _VERSION_ = '0.0.4'
 
 import argparse
-from urllib.request import urlopen
-from html.parser import HTMLParser
-
-
-class MyHTMLParser(HTMLParser):
-    def __init__(self):
-        HTMLParser.__init__(self)
-        self.content = []
-        self.pick_data = False
-        self.to_get = False
-
-    def handle_starttag(self, tag, attrs):
-        if tag == 'a':
-            if ('name', 'untranslated') in attrs and not ARGS.no_general:
-                self.to_get = True
-            if ('name', 'untranslated-news') in attrs and not ARGS.no_news:
-                self.to_get = True
-            if ('name', 'untranslated-user') in attrs and not ARGS.no_users:
-                self.to_get = True
-            if ('name', 'untranslated-l10n') in attrs and not ARGS.no_l10n:
-                self.to_get = True
-        if self.to_get:
-            self.get_link(tag, attrs)
-
-    def handle_endtag(self, tag):
-        if tag == 'table':
-            self.to_get = False
-
-    def handle_data(self, data):
-        if self.pick_data:
-            self.content.append((self.current_link, int(data)))
-            self.pick_data = False
-
-    def get_link(self, tag, attrs):
-        if tag == 'a':
-            self.current_link = attrs[1][1][1:]
-            self.passed_a = True
-        if tag == 'td' and ('align', 'right') in attrs:
-            self.pick_data = True
-
-    def get_contents(self):
-        return self.content
-
-
-def quicksort(lst):
-    """Quicksort using list comprehensions"""
-    if lst == []:
-        return []
-    else:
-        pivot = lst[0]
-        lesser = quicksort([x for x in lst[1:] if x[1] < pivot[1]])
-        greater = quicksort([x for x in lst[1:] if x[1] >= pivot[1]])
-        return lesser + [pivot] + greater
+import sys
 
+import lazyclient
+import lazyhttp
+import lazyoutput
+import lazytiming
 
-if __name__ == '__main__':
-    PARSER = argparse.ArgumentParser(description="Show sorted list of\
-                                     untranslated pages for specified language")
-    PARSER.add_argument('language', metavar='language', type=str,
-                        help='''Set language''')
-    PARSER.add_argument('-ng', '--no-general', action='store_const', const=True,
+# lazystats (and with it the HTML parser) is imported once the arguments
+# are parsed, so --help and usage errors do not wait for it
+
+
+COLUMNS = (('path', str), ('size', int))
+
+
+def sort_pages(contents, args):
+    """Return Rows of (page, size) of contents sorted as args ask for"""
+    import lazystats
+    return lazystats.Rows(COLUMNS, lazytiming.consume(
+        'sort', lazystats.sort_rows, contents, lambda e: (e[1], e[0]),
+        args.reverse, args.top))
+
+
+def todo(language, sections, cache, args, client=None):
+    """Return sorted Rows of (page, size) untranslated in language
+
+    Pages are asked from the daemon client is connected to, if given.
+    """
+    import lazystats
+    if client is not None:
+        return sort_pages(client.todo(language, sections, args.base_url,
+                                      args.max_age), args)
+    with lazystats.fetch(language, args.base_url, cache) as page:
+        return sort_pages(((row.path, row.size)
+                           for row in lazystats.iter_rows(page, sections)),
+                          args)
+
+
+def main(argv=None, prog=None):
+    """Run lazytodo with arguments argv, return exit status"""
+    parser = argparse.ArgumentParser(prog=prog, description="Show sorted "
+                                     "list of untranslated pages for "
+                                     "specified languages")
+    parser.add_argument('languages', metavar='language', type=str, nargs='*',
+                        help='''Set languages''')
+    parser.add_argument('-a', '--all', action='store_const', const=True,
+                        default=False,
+                        help='Process all languages listed on the stats page')
+    parser.add_argument('-ng', '--no-general', action='store_const', const=True,
                         default=False,
                         help='Do not include general pages')
-    PARSER.add_argument('-nn', '--no-news', action='store_const', const=True,
+    parser.add_argument('-nn', '--no-news', action='store_const', const=True,
                         default=False,
                         help='Do not include news items')
-    PARSER.add_argument('-nu', '--no-users', action='store_const', const=True,
+    parser.add_argument('-nu', '--no-users', action='store_const', const=True,
                         default=False,
                         help='Do not include consultant/user pages')
-    PARSER.add_argument('-nl', '--no-l10n', action='store_const', const=True,
+    parser.add_argument('-nl', '--no-l10n', action='store_const', const=True,
                         default=False,
                         help='Do not include international pages')
-    PARSER.add_argument('-r', '--reverse', action='store_const', const=True,
+    parser.add_argument('-r', '--reverse', action='store_const', const=True,
                         default=False,
                         help='Return reverse list of untranslated pages')
+    parser.add_argument('-t', '--top', metavar='K', type=int,
+                        help='Show only K smallest (largest with --reverse) '
+                        'pages')
 
-    ARGS = PARSER.parse_args()
+    lazyoutput.add_arguments(parser)
+    lazyhttp.add_arguments(parser)
+    lazyclient.add_arguments(parser)
+    lazytiming.add_arguments(parser)
 
-    BASE_HTML = 'https://www.debian.org/devel/website/stats/'
-    HTML = urlopen(BASE_HTML + ARGS.language).read().decode('utf-8')
+    args = parser.parse_args(argv)
+    lazytiming.start(args)
 
-    HTML_PARSER = MyHTMLParser()
-    HTML_PARSER.feed(HTML)
+    import lazystats
 
-    if ARGS.reverse:
-        for entity in reversed(quicksort(HTML_PARSER.get_contents())):
-            print(entity)
+    skipped = (args.no_general, args.no_news, args.no_users, args.no_l10n)
+    sections = [name for name, skip in zip(lazystats.SECTIONS, skipped)
+                if not skip]
+
+    cache = lazyhttp.from_args(args)
+    client = lazyclient.connect(args)
+    if client is not None and args.all:
+        languages = client.languages(args.base_url)
     else:
-        for entity in quicksort(HTML_PARSER.get_contents()):
-            print(entity)
+        languages = lazystats.select_languages(args.languages, args.all,
+                                               args.base_url, cache)
+    if not languages:
+        parser.error('specify at least one language or --all')
+
+    output = lazyoutput.from_args(args, [name for name, _ in COLUMNS],
+                                  len(languages) > 1)
+    status = 0
+    for language, contents, error in lazystats.run_languages(
+            languages, lambda l: todo(l, sections, cache, args, client),
+            args.workers):
+        if error:
+            print(language + ': ' + str(error), file=sys.stderr)
+            status = 1
+            continue
+        output.write(language, contents)
+    output.close()
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
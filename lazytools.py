@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazytools -- one entry point for the tools of Debian website translators
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import importlib
+import sys
+
+# Subcommands and the module:function running them. Only the module of the
+# chosen subcommand is imported, and it imports what it needs once its
+# arguments are parsed.
+COMMANDS = {
+    'copy': ('lazycopy:main',
+             'Copy originals to be translated, make patches'),
+    'index': ('lazyindex:main',
+              'Index translation status of languages for query'),
+    'query': ('lazyindex:query_main', 'Show pages of the index'),
+    'serve': ('lazyserve:main',
+              'Keep stats and metadata warm for the others'),
+    'todo': ('lazytodo:main', 'Show sorted list of untranslated pages'),
+    'up': ('lazyup:main', 'Show sorted list of outdated pages'),
+    'update-header': ('lazyscan:update_main',
+                      'Bring translation-check headers up to date'),
+}
+
+
+def usage(prog):
+    lines = ['usage: %s {%s} [arguments]' % (prog, ','.join(COMMANDS)),
+             '', 'commands:']
+    width = max(len(name) for name in COMMANDS)
+    for name, (function, description) in COMMANDS.items():
+        lines.append('  %-*s %s' % (width, name, description))
+    lines.append('')
+    lines.append("Run '%s COMMAND --help' for arguments of a command." %
+                 prog)
+    return '\n'.join(lines)
+
+
+def main(argv=None, prog='lazytools'):
+    """Run subcommand named by argv[0] with the rest of argv"""
+    if argv is None:
+        argv = sys.argv[1:]
+    if not argv or argv[0] in ('-h', '--help'):
+        print(usage(prog), file=sys.stdout if argv else sys.stderr)
+        return 0 if argv else 2
+    if argv[0] == '--version':
+        print(prog + ' ' + _VERSION_)
+        return 0
+    if argv[0] not in COMMANDS:
+        print(usage(prog), file=sys.stderr)
+        print('%s: error: unknown command %s' % (prog, argv[0]),
+              file=sys.stderr)
+        return 2
+    module, function = COMMANDS[argv[0]][0].split(':')
+    function = getattr(importlib.import_module(module), function)
+    return function(argv[1:], prog=prog + ' ' + argv[0])
+
+
+if __name__ == '__main__':
+    sys.exit(main())
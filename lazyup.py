@@ -19,57 +19,471 @@
 _VERSION_ = '0.0.1'
 
 import argparse
-import subprocess
-from urllib.request import urlopen
+import os
+import posixpath
+import sys
+import threading
+import time
 
-from bs4 import BeautifulSoup
+import lazyclient
+import lazyhttp
+import lazyoutput
+import lazytiming
 
+# Modules for fetching and parsing pages, running and computing diffs are
+# imported where they are needed, so --help and usage errors stay quick
 
-def quicksort(lst):
-    """Quicksort using list comprehensions"""
-    if lst == []:
-        return []
-    else:
-        pivot = lst[0]
-        lesser = quicksort([x for x in lst[1:] if x[1] < pivot[1]])
-        greater = quicksort([x for x in lst[1:] if x[1] >= pivot[1]])
-        return lesser + [pivot] + greater
+SIZE_CACHE = os.path.join(lazyhttp.CACHE_DIR, 'diff-sizes.sqlite')
+MAX_SIZES = 100000
+# Longest page diffed in-process, git diff is quicker beyond (see the
+# diff_in_process and diff_git benchmarks)
+IN_PROCESS_LINES = 500
+_HEX_DIGITS = frozenset('0123456789abcdef')
+# Configuration and options making git diff give the output of the
+# in-process diff whatever the configuration of the user, so sizes
+# agree whichever of them computed a row of the size cache
+GIT_DIFF_CONFIG = ('diff.noprefix=false', 'diff.mnemonicPrefix=false',
+                   'diff.srcPrefix=a/', 'diff.dstPrefix=b/',
+                   'diff.algorithm=myers', 'diff.indentHeuristic=true',
+                   'diff.context=3', 'diff.interHunkContext=0',
+                   'diff.suppressBlankEmpty=false', 'diff.relative=false',
+                   'core.quotePath=false')
+GIT_DIFF_OPTIONS = ('--no-ext-diff', '--no-textconv', '--no-color')
 
 
-if __name__ == '__main__':
-    PARSER = argparse.ArgumentParser(description="Show sorted list of\
-                                     outdated pages for specified language")
-    PARSER.add_argument('language', metavar='language', type=str,
-                        help='''Set language''')
-    PARSER.add_argument('-r', '--reverse', action='store_const', const=True,
+def diff_size(command, cwd=None):
+    """Run diff command, return number of lines and characters of its output
+
+    git diff commands are run with GIT_DIFF_CONFIG and GIT_DIFF_OPTIONS.
+    """
+    import subprocess
+    words = command.split()
+    if words[:2] == ['git', 'diff']:
+        words = ['git'] + [option for setting in GIT_DIFF_CONFIG
+                           for option in ('-c', setting)] + \
+            ['diff'] + list(GIT_DIFF_OPTIONS) + words[2:]
+    with lazytiming.span('diff command'):
+        result = subprocess.run(words, stdout=subprocess.PIPE, cwd=cwd)
+    # diff exits with 1 when files differ, git diff and diff use >1 on trouble
+    if result.returncode not in (0, 1):
+        raise subprocess.CalledProcessError(result.returncode, command)
+    output = result.stdout.decode('utf-8')
+    return output.count('\n'), len(output)
+
+
+def parse_git_diff(command):
+    """Return (old revision, new revision, path) of simple git diff command
+
+    Returns None for anything but 'git diff OLD..NEW [--] PATH' or
+    'git diff OLD NEW [--] PATH'.
+    """
+    words = command.split()
+    if words[:2] != ['git', 'diff']:
+        return None
+    words = [word for word in words[2:] if word != '--']
+    if any(word.startswith('-') for word in words):
+        return None
+    if len(words) == 2 and '..' in words[0] and '...' not in words[0]:
+        old, new = words[0].split('..')
+        return old or 'HEAD', new or 'HEAD', words[1]
+    if len(words) == 3:
+        return words[0], words[1], words[2]
+    return None
+
+
+def is_object_name(revision):
+    """Return whether revision is a (possibly abbreviated) object name
+
+    Sizes of diffs between object names never change, unlike those of
+    diffs against HEAD or a branch.
+    """
+    return len(revision) >= 7 and set(revision) <= _HEX_DIGITS
+
+
+class SizeCache(object):
+    """Diff sizes kept across runs in SQLite, keyed by path and revisions
+
+    Stored sizes are looked up one by one. Sizes computed during the run
+    and the times stored entries were used are written in one transaction
+    by close(), which also evicts the least recently used entries above
+    max_entries. Lookups and additions may come from several threads.
+    """
+
+    SCHEMA = 1
+
+    def __init__(self, path=SIZE_CACHE, max_entries=MAX_SIZES,
+                 rebuild=False):
+        import sqlite3
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.max_entries = max_entries
+        self.lock = threading.Lock()
+        self.added = []
+        self.used = []
+        self.hits = self.misses = self.evicted = 0
+        self.connection = sqlite3.connect(path, timeout=30,
+                                          check_same_thread=False)
+        with self.connection:
+            version = self.connection.execute(
+                'PRAGMA user_version').fetchone()[0]
+            if version != self.SCHEMA:
+                self.connection.execute('DROP TABLE IF EXISTS sizes')
+                self.connection.execute('PRAGMA user_version = %d' %
+                                        self.SCHEMA)
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS sizes (path TEXT, old TEXT, '
+                'new TEXT, abbrev INTEGER, lines INTEGER, chars INTEGER, '
+                'used INTEGER, PRIMARY KEY (path, old, new, abbrev))')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS sizes_used '
+                                    'ON sizes (used)')
+            if rebuild:
+                self.connection.execute('DELETE FROM sizes')
+
+    def get(self, key):
+        """Return (lines, chars) stored for key or None"""
+        with self.lock:
+            found = self.connection.execute(
+                'SELECT lines, chars FROM sizes WHERE path = ? AND old = ? '
+                'AND new = ? AND abbrev = ?', key).fetchone()
+            if found is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.used.append(key)
+        lazytiming.count('size cache.hit' if found else 'size cache.miss')
+        return found
+
+    def put(self, key, size):
+        """Store size (lines, chars) of key when the cache is closed"""
+        with self.lock:
+            self.added.append(tuple(key) + tuple(size))
+
+    def close(self):
+        now = int(time.time())
+        with self.lock, self.connection:
+            self.connection.executemany(
+                'INSERT OR REPLACE INTO sizes VALUES (?, ?, ?, ?, ?, ?, ?)',
+                [entry + (now,) for entry in self.added])
+            self.connection.executemany(
+                'UPDATE sizes SET used = ? WHERE path = ? AND old = ? AND '
+                'new = ? AND abbrev = ?', [(now,) + key for key in self.used])
+            count = self.connection.execute(
+                'SELECT count(*) FROM sizes').fetchone()[0]
+            if count > self.max_entries:
+                self.evicted = count - self.max_entries
+                self.connection.execute(
+                    'DELETE FROM sizes WHERE rowid IN (SELECT rowid FROM '
+                    'sizes ORDER BY used LIMIT ?)', (self.evicted,))
+        self.connection.close()
+
+    def statistics(self):
+        """Return line telling hits, misses and evictions of the run"""
+        looked_up = self.hits + self.misses
+        return 'Diff size cache: %d hits, %d misses (%.0f%% hit rate), ' \
+            '%d added, %d evicted' % (self.hits, self.misses,
+                                      100.0 * self.hits / (looked_up or 1),
+                                      len(self.added), self.evicted)
+
+
+def add_cache_arguments(parser):
+    """Add options for the cache of diff sizes to argparse parser"""
+    parser.add_argument('-v', '--verbose', action='store_const', const=True,
                         default=False,
-                        help='Return reverse list of outdated pages')
+                        help='Show hits and misses of the cache of diff sizes')
+    parser.add_argument('--no-cache', action='store_const', const=True,
+                        default=False,
+                        help='Do not use the cache of diff sizes')
+    parser.add_argument('--rebuild-cache', action='store_const', const=True,
+                        default=False,
+                        help='Forget cached diff sizes, cache them again as '
+                        'they are computed')
+    parser.add_argument('--size-cache', metavar='FILE', type=str,
+                        default=SIZE_CACHE,
+                        help='Keep diff sizes in FILE (default: %(default)s)')
+    parser.add_argument('--cache-entries', metavar='N', type=int,
+                        default=MAX_SIZES,
+                        help='Keep at most N diff sizes, forgetting those '
+                        'used least recently (default: %(default)s)')
+
+
+def open_size_cache(args):
+    """Return SizeCache as options ask for, None if off or unusable"""
+    if args.no_cache:
+        return None
+    import sqlite3
+    try:
+        return SizeCache(args.size_cache, max(args.cache_entries, 0),
+                         args.rebuild_cache)
+    except (OSError, sqlite3.Error) as err:
+        print('Not using cache of diff sizes: ' + str(err), file=sys.stderr)
+        return None
+
+
+class DiffSizer(object):
+    """Compute sizes of git diff commands in-process
+
+    Originals are read through one persistent git cat-file process and
+    the lines and characters of the diff are counted while its lines are
+    produced, which saves starting git for each page. The pure-Python
+    diff is slower than git on long pages, so pages of more than
+    IN_PROCESS_LINES lines, commands which are not plain git diff of one
+    path, or all commands when outside of a git work tree, are run as
+    before. Both give the same sizes (see GIT_DIFF_CONFIG). Paths and
+    commands are taken relative to cwd (default: current directory).
+    Sizes of diffs between object names are looked up in and added to
+    cache, a SizeCache, if given.
+    """
 
-    ARGS = PARSER.parse_args()
+    def __init__(self, in_process=True, cwd=None, cache=None):
+        import lazyvcs
+        self.cwd = cwd
+        self.cache = cache
+        self.cat_file = None
+        self.prefix = self.abbrev = None
+        found = lazyvcs.git_prefix(cwd) if in_process or cache else None
+        if found:
+            self.prefix, self.abbrev = found
+            if in_process:
+                self.cat_file = lazyvcs.CatFile(cwd)
 
-    BASE_HTML = 'https://www.debian.org/devel/website/stats/'
-    HTML = urlopen(BASE_HTML + ARGS.language).read().decode('utf-8')
+    def blob(self, revision, path):
+        import subprocess
+        found = self.cat_file.blob(revision, path)
+        if found is None and \
+                self.cat_file.read(revision + '^{commit}') is None:
+            raise subprocess.CalledProcessError(128, 'git diff ' + revision)
+        return found
 
-    soup = BeautifulSoup(HTML, features='lxml')
-    TABLE = ''
+    def shorten(self, name):
+        return self.cat_file.abbrev(name, self.abbrev)
 
-    for i in  soup.find_all('table'):
-        if i['summary'] == 'Outdated translations':
-            TABLE = i.find_all('tr')
+    def size(self, command):
+        """Return number of lines and characters of output of command"""
+        parsed = parse_git_diff(command) if self.prefix is not None else None
+        key = None
+        if parsed and self.cache is not None and \
+                is_object_name(parsed[0]) and is_object_name(parsed[1]):
+            key = (posixpath.normpath(self.prefix + parsed[2]), parsed[0],
+                   parsed[1], self.abbrev)
+            found = self.cache.get(key)
+            if found is not None:
+                return found
+        size = None
+        if parsed is not None and self.cat_file is not None:
+            size = self.diff_size(*parsed)
+        if size is None:
+            size = diff_size(command, self.cwd)
+        if key is not None:
+            self.cache.put(key, size)
+        return size
 
-    ENTRIES = []
+    def diff_size(self, old, new, path):
+        """Return number of lines and characters of git diff of path
 
-    for tr in TABLE[1:]:
-        tds = tr.find_all('td')
-        if tds[2].find('a')['title'] == 'The original is newer than this translation':
-            result = subprocess.run(tds[1].string.split(), stdout=subprocess.PIPE)
-            out_chars = len(result.stdout.decode('utf-8'))
-            out_len = len(result.stdout.decode('utf-8').split('\n')) - 1
-            ENTRIES.append([tds[0].string, out_len, out_chars, tds[1].string])
+        Returns None if either blob is longer than IN_PROCESS_LINES.
+        """
+        import lazydiff
+        path = posixpath.normpath(self.prefix + path)
+        blobs = self.blob(old, path), self.blob(new, path)
+        if max(blob[1].count('\n') if blob else 0
+               for blob in blobs) > IN_PROCESS_LINES:
+            return None
+        with lazytiming.span('diff') as span:
+            lines = lazydiff.git_diff_lines(path, blobs[0], blobs[1],
+                                            self.abbrev, self.shorten)
+            out_len, out_chars = lazydiff.count(lines)
+            span.add(rows=out_len)
+        return out_len, out_chars
 
-    if ARGS.reverse:
-        for e in reversed(quicksort(ENTRIES)):
-            print(e)
+    def close(self):
+        if self.cat_file:
+            self.cat_file.close()
+
+
+def outdated_rows(rows):
+    """Yield (file, diff command) of rows with the original newer
+
+    Rows are lazystats.Outdated or (path, command, status) tuples.
+    """
+    import lazystats
+    for path, command, status in rows:
+        if status == lazystats.ORIGINAL_NEWER:
+            yield path, command
+
+
+def iter_entries(rows, jobs, size=diff_size, executor=None):
+    """Get diff sizes of rows keeping up to jobs of them running at once
+
+    Diffs are started while rows are still being read and entries
+    [file, lines, chars, command] are yielded as soon as their diffs
+    finish, so only a few rows are held at a time. Rows whose diff
+    fails are reported and left out. Diffs run on executor if given,
+    so several languages can share it.
+    """
+    import subprocess
+    from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+    if executor is None:
+        with ThreadPoolExecutor(max_workers=jobs) as executor:
+            yield from iter_entries(rows, jobs, size, executor)
+        return
+    rows = iter(rows)
+    size = lazytiming.profiled(size)
+    pending = {}
+    while True:
+        for name, command in rows:
+            pending[executor.submit(size, command)] = (name, command)
+            if len(pending) >= 2 * jobs:
+                break
+        if not pending:
+            break
+        done = wait(pending, return_when=FIRST_COMPLETED)[0]
+        for future in done:
+            name, command = pending.pop(future)
+            try:
+                out_len, out_chars = future.result()
+            except (OSError, subprocess.CalledProcessError) as err:
+                print('Failed to get diff for ' + str(name) + ': ' +
+                      str(err), file=sys.stderr)
+                continue
+            yield [name, out_len, out_chars, command]
+
+
+def sort_entries(entries, args):
+    """Return Rows of entries sorted as args ask for"""
+    import lazystats
+    return lazystats.Rows(COLUMNS, lazytiming.consume(
+        'sort', lazystats.sort_rows, entries, SORT_KEYS[args.sort_by],
+        args.reverse, args.top))
+
+
+def outdated(language, cache, sizer, executor, args, client=None,
+             metadata=None):
+    """Return sorted Rows of entries of pages outdated in language
+
+    Entries are asked from the daemon client is connected to, if given.
+    Given metadata, outdated pages are found from the translation-check
+    headers of the checkout instead of the stats page.
+    """
+    import lazystats
+    if metadata is not None:
+        import lazyscan
+        rows = lazyscan.outdated_rows(language, metadata, executor)
+        return sort_entries(iter_entries(outdated_rows(rows),
+                                         max(args.jobs, 1), sizer.size,
+                                         executor), args)
+    if client is not None:
+        return sort_entries(client.outdated(language, args.base_url,
+                                            args.exec_diff,
+                                            max_age=args.max_age), args)
+    with lazystats.fetch(language, args.base_url, cache) as page:
+        rows = lazystats.iter_rows(page, (), outdated=True)
+        return sort_entries(iter_entries(outdated_rows(rows),
+                                         max(args.jobs, 1), sizer.size,
+                                         executor), args)
+
+
+COLUMNS = (('path', str), ('lines', int), ('chars', int), ('command', str))
+SORT_KEYS = {
+    'lines': lambda e: (e[1], e[2], e[0], e[3]),
+    'chars': lambda e: (e[2], e[1], e[0], e[3]),
+}
+
+
+def main(argv=None, prog=None):
+    """Run lazyup with arguments argv, return exit status"""
+    parser = argparse.ArgumentParser(prog=prog, description="Show sorted "
+                                     "list of outdated pages for specified "
+                                     "languages")
+    parser.add_argument('languages', metavar='language', type=str, nargs='*',
+                        help='''Set languages''')
+    parser.add_argument('-a', '--all', action='store_const', const=True,
+                        default=False,
+                        help='Process all languages listed on the stats page '
+                        '(with --local, all language directories)')
+    parser.add_argument('-l', '--local', action='store_const', const=True,
+                        default=False,
+                        help='Find outdated pages from translation-check '
+                        'headers of the checkout instead of the stats page, '
+                        'run at the top of webwml')
+    parser.add_argument('-r', '--reverse', action='store_const', const=True,
+                        default=False,
+                        help='Return reverse list of outdated pages')
+    parser.add_argument('-s', '--sort-by', choices=sorted(SORT_KEYS),
+                        default='lines',
+                        help='Sort on lines or characters of the diff, then '
+                        'on the other one and on the file name')
+    parser.add_argument('-t', '--top', metavar='K', type=int,
+                        help='Show only K smallest (largest with --reverse) '
+                        'diffs')
+    parser.add_argument('-j', '--jobs', metavar='N', type=int,
+                        default=os.cpu_count() or 1,
+                        help='Run up to N diff commands at once '
+                        '(default: number of CPUs)')
+    parser.add_argument('-x', '--exec-diff', action='store_const', const=True,
+                        default=False,
+                        help='Run diff commands instead of computing diff '
+                        'sizes of short pages in-process')
+    add_cache_arguments(parser)
+
+    lazyoutput.add_arguments(parser)
+    lazyhttp.add_arguments(parser)
+    lazyclient.add_arguments(parser)
+    lazytiming.add_arguments(parser)
+
+    args = parser.parse_args(argv)
+    lazytiming.start(args)
+
+    import lazystats
+    from concurrent.futures import ThreadPoolExecutor
+
+    cache = lazyhttp.from_args(args)
+    client = lazyclient.connect(args)
+    metadata = None
+    if args.local:
+        import lazyscan
+        import lazyvcs
+        # Only metadata comes from the daemon, diffs are sized here
+        metadata = client.metadata() if client is not None \
+            else lazyvcs.open_metadata()
+        client = None
+        languages = lazyscan.languages() if args.all else args.languages
+    elif client is not None and args.all:
+        languages = client.languages(args.base_url)
     else:
-        for e in quicksort(ENTRIES):
-            print(e)
+        languages = lazystats.select_languages(args.languages, args.all,
+                                               args.base_url, cache)
+    if not languages:
+        parser.error('specify at least one language or --all')
+
+    sizer = executor = size_cache = None
+    if client is None:
+        size_cache = open_size_cache(args)
+        sizer = DiffSizer(not args.exec_diff, cache=size_cache)
+        executor = ThreadPoolExecutor(max_workers=max(args.jobs, 1))
+    output = lazyoutput.from_args(args, [name for name, _ in COLUMNS],
+                                  len(languages) > 1, list)
+    status = 0
+    for language, entries, error in lazystats.run_languages(
+            languages,
+            lambda l: outdated(l, cache, sizer, executor, args, client,
+                               metadata),
+            args.workers):
+        if error:
+            print(language + ': ' + str(error), file=sys.stderr)
+            status = 1
+            continue
+        output.write(language, entries)
+    output.close()
+    if executor is not None:
+        executor.shutdown()
+        sizer.close()
+    if size_cache is not None:
+        size_cache.close()
+        if args.verbose:
+            print(size_cache.statistics(), file=sys.stderr)
+    return status
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,434 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazyvcs -- version control helpers for lazytools
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import os
+import subprocess
+import threading
+
+import lazytiming
+
+
+# Lengths of abbreviated object names as git computes them
+MIN_ABBREV = 4
+DEFAULT_ABBREV = 7
+HEX_LENGTH = 40
+REGULAR_MODE = '100644'
+
+
+class CatFile(object):
+    """Long-lived git cat-file --batch process reading objects by name
+
+    Modes of blobs are read from the trees holding them, which are kept
+    parsed by object name. Unique abbreviations of object names are
+    asked from a second, --batch-check process started when needed.
+    """
+
+    def __init__(self, cwd=None):
+        self.cwd = cwd
+        self.process = subprocess.Popen(['git', 'cat-file', '--batch'],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        cwd=cwd)
+        self.check = None
+        self.lock = threading.Lock()
+        self.trees = {}
+        self.abbrevs = {}
+
+    def read(self, name):
+        """Return (object name, contents) of object or None if missing"""
+        with self.lock:
+            self.process.stdin.write(name.encode('utf-8') + b'\n')
+            self.process.stdin.flush()
+            header = self.process.stdout.readline().split()
+            if len(header) != 3:
+                if not header:
+                    raise OSError('git cat-file exited unexpectedly')
+                return None
+            contents = self.process.stdout.read(int(header[2]))
+            self.process.stdout.read(1)
+        return header[0].decode('ascii'), contents
+
+    def tree(self, revision, directory):
+        """Return {name: mode} of directory in revision or None"""
+        found = self.read(revision + ':' + directory)
+        if found is None:
+            return None
+        modes = self.trees.get(found[0])
+        if modes is None:
+            modes = self.trees[found[0]] = parse_tree(found[1])
+        return modes
+
+    def blob(self, revision, path):
+        """Return (object name, text, mode) of path in revision or None"""
+        found = self.read(revision + ':' + path)
+        if found is None:
+            return None
+        directory, name = path.rpartition('/')[::2]
+        modes = self.tree(revision, directory) or {}
+        return (found[0], found[1].decode('utf-8', 'replace'),
+                modes.get(name, REGULAR_MODE))
+
+    def abbrev(self, name, length=DEFAULT_ABBREV):
+        """Return shortest unique abbreviation of name of at least length"""
+        length = max(length, MIN_ABBREV)
+        with self.lock:
+            found = self.abbrevs.get((name, length))
+            if found is not None:
+                return found
+            if self.check is None:
+                self.check = subprocess.Popen(
+                    ['git', 'cat-file', '--batch-check'],
+                    stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                    stderr=subprocess.DEVNULL, cwd=self.cwd)
+            short = name[:length]
+            while len(short) < len(name):
+                self.check.stdin.write(short.encode('ascii') + b'\n')
+                self.check.stdin.flush()
+                answer = self.check.stdout.readline().split()
+                if not answer:
+                    raise OSError('git cat-file exited unexpectedly')
+                if answer[-1] != b'ambiguous':
+                    break
+                short = name[:len(short) + 1]
+            self.abbrevs[name, length] = short
+        return short
+
+    def close(self):
+        for process in (self.process, self.check):
+            if process is not None:
+                process.stdin.close()
+                process.wait()
+
+
+def parse_tree(data):
+    """Return {name: mode} of entries of raw tree object data"""
+    modes = {}
+    offset = 0
+    while offset < len(data):
+        space = data.index(b' ', offset)
+        end = data.index(b'\0', space)
+        mode = data[offset:space].decode('ascii')
+        modes[data[space + 1:end].decode('utf-8', 'replace')] = \
+            mode.zfill(6)
+        offset = end + 1 + 20
+    return modes
+
+
+def _git_output(command, cwd=None):
+    # Output of git command, None if it fails or git is missing
+    try:
+        result = subprocess.run(['git'] + command, cwd=cwd,
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+    except OSError:
+        return None
+    if result.returncode:
+        return None
+    return result.stdout.decode('utf-8')
+
+
+def abbrev_length(cwd=None):
+    """Return length git abbreviates object names to at least
+
+    That is core.abbrev if set, else the length git derives from the
+    number of packed objects, as git diff does for its index lines.
+    """
+    value = (_git_output(['config', '--get', 'core.abbrev'], cwd) or
+             'auto').strip().lower()
+    if value in ('no', 'false', 'off'):
+        return HEX_LENGTH
+    if value.isdigit():
+        return min(max(int(value), MIN_ABBREV), HEX_LENGTH)
+    count = 0
+    for line in (_git_output(['count-objects', '-v'], cwd) or '').split('\n'):
+        if line.startswith('in-pack:'):
+            count = int(line.split()[1])
+    # git expects a collision among 2 ** bits objects at 2 ** (bits / 2),
+    # with 4 bits to a hex digit
+    return max((count.bit_length() + 1) // 2, DEFAULT_ABBREV)
+
+
+def git_prefix(cwd=None):
+    """Return (path of cwd inside the repository, abbrev length)
+
+    Returns None if cwd is not inside a git work tree.
+    """
+    output = _git_output(['rev-parse', '--show-prefix'], cwd)
+    if output is None:
+        return None
+    return output.split('\n')[0], abbrev_length(cwd)
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+class CVSMetadata(object):
+    """Index of CVS/Entries files answering revision and status lookups
+
+    Entries (and Entries.Log) of a directory are parsed once into a
+    dictionary and parsed again only when their modification time
+    changes. The Attic can be looked at only when the repository is
+    on a local file system, status() answers None when it cannot tell.
+    """
+
+    def __init__(self):
+        self.directories = {}
+        self.attics = {}
+
+    def entries(self, directory):
+        """Return {name: revision} of files in CVS/Entries of directory"""
+        entries_file = os.path.join(directory, 'CVS', 'Entries')
+        log_file = entries_file + '.Log'
+        key = (_mtime(entries_file), _mtime(log_file))
+        cached = self.directories.get(directory)
+        if cached and cached[0] == key:
+            return cached[1]
+        lazytiming.count('cvs entries')
+        entries = {}
+        if key[0] is not None:
+            with open(entries_file) as lines:
+                for line in lines:
+                    self._add_entry(entries, line)
+        if key[1] is not None:
+            with open(log_file) as lines:
+                for line in lines:
+                    if line.startswith('A '):
+                        self._add_entry(entries, line[2:])
+                    elif line.startswith('R '):
+                        fields = line[2:].split('/')
+                        if len(fields) > 2:
+                            entries.pop(fields[1], None)
+        self.directories[directory] = (key, entries)
+        return entries
+
+    @staticmethod
+    def _add_entry(entries, line):
+        # /name/revision/timestamp/options/tagdate, directories start with D
+        fields = line.split('/')
+        if line.startswith('/') and len(fields) > 2:
+            entries[fields[1]] = fields[2]
+
+    def repository(self, directory):
+        """Return local path of the repository directory or None"""
+        try:
+            with open(os.path.join(directory, 'CVS', 'Root')) as root_file:
+                root = root_file.read().strip()
+            with open(os.path.join(directory, 'CVS',
+                                   'Repository')) as repository_file:
+                repository = repository_file.read().strip()
+        except OSError:
+            return None
+        if root.startswith(':local:'):
+            root = root[len(':local:'):]
+        if not root.startswith('/'):
+            return None
+        return os.path.join(root, repository)
+
+    def attic(self, directory):
+        """Return set of names in the Attic or None if it is not local"""
+        repository = self.repository(directory)
+        if repository is None:
+            return None
+        attic = os.path.join(repository, 'Attic')
+        key = _mtime(attic)
+        cached = self.attics.get(attic)
+        if cached and cached[0] == key:
+            return cached[1]
+        names = set()
+        if key is not None:
+            names = set(name[:-2] for name in os.listdir(attic)
+                        if name.endswith(',v'))
+        self.attics[attic] = (key, names)
+        return names
+
+    def revision(self, path):
+        """Return revision of path in its CVS/Entries or None"""
+        directory, name = os.path.split(path)
+        return self.entries(directory or '.').get(name)
+
+    def revisions(self, paths):
+        return dict((path, self.revision(path)) for path in paths)
+
+    def status(self, path):
+        """Return 'exists', 'attic' or 'unknown' for path, None if unsure"""
+        directory, name = os.path.split(path)
+        directory = directory or '.'
+        revision = self.entries(directory).get(name)
+        if revision and not revision.startswith('-'):
+            return 'exists'
+        # A directory which is not checked out yet has no CVS metadata,
+        # ask its parent for the repository
+        parent = directory
+        while parent and not os.path.isdir(os.path.join(parent, 'CVS')):
+            parent = os.path.dirname(parent)
+        if not parent:
+            return 'unknown'
+        attic = self.attic(parent)
+        if attic is None:
+            return None
+        sub = os.path.relpath(directory, parent)
+        if sub == '.':
+            in_attic = name in attic
+        else:
+            in_attic = self._in_attic(self.repository(parent), sub, name)
+        return 'attic' if in_attic else 'unknown'
+
+    @staticmethod
+    def _in_attic(repository, sub, name):
+        return os.path.exists(os.path.join(repository, sub, 'Attic',
+                                           name + ',v')) or \
+            os.path.exists(os.path.join(repository, sub, name + ',v'))
+
+    def statuses(self, paths):
+        return dict((path, self.status(path)) for path in paths)
+
+
+class GitMetadata(object):
+    """Index of git metadata answering revision and status lookups
+
+    Revisions (last commits touching paths) and statuses of many paths
+    are found with one git ls-files and one git log call, answers are
+    kept until the index or HEAD of the repository changes.
+    """
+
+    def __init__(self, cwd=None):
+        self.cwd = cwd
+        result = subprocess.run(['git', 'rev-parse', '--show-prefix',
+                                 '--git-dir'], cwd=cwd,
+                                stdout=subprocess.PIPE, check=True)
+        lines = result.stdout.decode('utf-8').split('\n')
+        self.prefix = lines[0]
+        git_dir = os.path.join(cwd or '.', lines[1])
+        self.stamp_files = (os.path.join(git_dir, 'index'),
+                            os.path.join(git_dir, 'logs', 'HEAD'))
+        self.stamp = None
+        self.tracked = None
+        self.known = {}
+
+    def _check_stamp(self):
+        stamp = tuple(_mtime(path) for path in self.stamp_files)
+        if stamp != self.stamp:
+            self.stamp = stamp
+            self.tracked = None
+            self.known = {}
+
+    def _tracked(self):
+        if self.tracked is None:
+            with lazytiming.span('git ls-files'):
+                result = subprocess.run(['git', 'ls-files', '-z',
+                                         '--full-name', ':(top)'],
+                                        cwd=self.cwd, stdout=subprocess.PIPE,
+                                        check=True)
+            self.tracked = set(result.stdout.decode('utf-8').split('\0'))
+        return self.tracked
+
+    def _log(self, paths):
+        """Return {path: (last commit, deleted)} of paths found in history
+
+        git log is read as it runs and stopped as soon as all paths were
+        seen, so recently changed paths do not walk the whole history.
+        """
+        with lazytiming.span('git log', paths=len(paths)):
+            return self._read_log(paths)
+
+    def _read_log(self, paths):
+        found = {}
+        wanted = set(paths)
+        process = subprocess.Popen(['git', 'log', '--format=%x01%H',
+                                    '--name-status', '--no-renames', '-z',
+                                    '--'] + [':(top,literal)' + path
+                                             for path in sorted(wanted)],
+                                   cwd=self.cwd,
+                                   stdout=subprocess.PIPE)
+        commit = status = None
+        pending = b''
+        try:
+            while wanted:
+                chunk = process.stdout.read1(65536)
+                if not chunk:
+                    break
+                fields = (pending + chunk).split(b'\0')
+                pending = fields.pop()
+                for field in fields:
+                    field = field.decode('utf-8')
+                    if field.startswith('\x01'):
+                        commit = field[1:]
+                    elif status is None:
+                        status = field.lstrip('\n')
+                    else:
+                        if field in wanted:
+                            found[field] = (commit, status == 'D')
+                            wanted.discard(field)
+                        status = None
+        finally:
+            process.stdout.close()
+            process.terminate()
+            process.wait()
+        return found
+
+    def _lookup(self, paths):
+        self._check_stamp()
+        full = dict((path, os.path.normpath(self.prefix + path))
+                    for path in paths)
+        missing = [name for name in set(full.values())
+                   if name not in self.known]
+        if missing:
+            found = self._log(missing)
+            for name in missing:
+                self.known[name] = found.get(name, (None, False))
+        return dict((path, self.known[name]) for path, name in full.items())
+
+    def revision(self, path):
+        """Return last commit changing path or None"""
+        return self.revisions([path])[path]
+
+    def revisions(self, paths):
+        return dict((path, found[0])
+                    for path, found in self._lookup(paths).items())
+
+    def status(self, path):
+        """Return 'exists', 'attic' (deleted) or 'unknown' for path"""
+        return self.statuses([path])[path]
+
+    def statuses(self, paths):
+        self._check_stamp()
+        tracked = self._tracked()
+        result = {}
+        untracked = []
+        for path in paths:
+            if os.path.normpath(self.prefix + path) in tracked:
+                result[path] = 'exists'
+            else:
+                untracked.append(path)
+        for path, found in self._lookup(untracked).items():
+            result[path] = 'attic' if found[1] else 'unknown'
+        return result
+
+
+def open_metadata(directory='.'):
+    """Return CVSMetadata or GitMetadata for the checkout at directory"""
+    if os.path.isdir(os.path.join(directory, 'CVS')) or \
+            _git_output(['rev-parse', '--show-prefix'], directory) is None:
+        return CVSMetadata()
+    return GitMetadata(directory)
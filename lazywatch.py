@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# lazywatch -- change notification of files for lazytools
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+_VERSION_ = '0.0.1'
+
+import os
+import select
+import struct
+import time
+
+DEBOUNCE = 0.5
+INTERVAL = 1.0
+
+# inotify(7) events of a file being written, replaced or removed
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+EVENTS = IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | \
+    IN_CREATE | IN_DELETE
+
+
+class InotifyWatcher(object):
+    """Watch files with inotify through libc, Linux only
+
+    Directories of the files are watched rather than the files, so files
+    editors replace by renaming a new one over them are still seen.
+    OSError is raised if inotify is not available.
+    """
+
+    def __init__(self, paths):
+        import ctypes
+        import ctypes.util
+        self.libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6',
+                                use_errno=True)
+        if not hasattr(self.libc, 'inotify_init1'):
+            raise OSError('inotify is not available')
+        self.fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.paths = frozenset(os.path.abspath(path) for path in paths)
+        self.directories = {}
+        try:
+            for directory in sorted(set(os.path.dirname(path)
+                                        for path in self.paths)):
+                wd = self.libc.inotify_add_watch(
+                    self.fd, os.fsencode(directory), EVENTS)
+                if wd < 0:
+                    raise OSError(ctypes.get_errno(), 'cannot watch ' +
+                                  directory)
+                self.directories[wd] = directory
+        except BaseException:
+            os.close(self.fd)
+            raise
+
+    def wait(self, timeout=None):
+        """Return set of watched paths changed within timeout seconds"""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return set()
+        data = os.read(self.fd, 65536)
+        changed = set()
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = struct.unpack_from('iIII', data,
+                                                          offset)
+            offset += 16
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                # Events were lost, take every file as changed
+                return set(self.paths)
+            directory = self.directories.get(wd)
+            if directory is not None and name:
+                path = os.path.join(directory, os.fsdecode(name))
+                if path in self.paths:
+                    changed.add(path)
+        return changed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingWatcher(object):
+    """Watch files by comparing their modification time, size and inode"""
+
+    def __init__(self, paths, interval=INTERVAL):
+        self.interval = interval
+        self.stats = dict((os.path.abspath(path), None) for path in paths)
+        for path in self.stats:
+            self.stats[path] = self._stat(path)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            found = os.stat(path)
+        except OSError:
+            return None
+        return found.st_mtime_ns, found.st_size, found.st_ino
+
+    def wait(self, timeout=None):
+        """Return set of watched paths changed within timeout seconds"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            changed = set()
+            for path, known in self.stats.items():
+                found = self._stat(path)
+                if found != known:
+                    self.stats[path] = found
+                    changed.add(path)
+            if changed:
+                return changed
+            if deadline is None:
+                time.sleep(self.interval)
+                continue
+            left = deadline - time.monotonic()
+            if left <= 0:
+                return changed
+            time.sleep(min(self.interval, left))
+
+    def close(self):
+        pass
+
+
+def open_watcher(paths, interval=INTERVAL):
+    """Return InotifyWatcher of paths, PollingWatcher where it fails"""
+    try:
+        return InotifyWatcher(paths)
+    except (OSError, AttributeError):
+        return PollingWatcher(paths, interval)
+
+
+def watch(paths, debounce=DEBOUNCE, interval=INTERVAL):
+    """Yield sets of absolute paths of paths changed since the last one
+
+    Changes following each other by less than debounce seconds are
+    gathered and yielded once they stop, so an editor writing a file in
+    several steps or several files saved at once make a single set.
+    """
+    watcher = open_watcher(paths, interval)
+    try:
+        while True:
+            changed = watcher.wait()
+            while True:
+                more = watcher.wait(debounce)
+                if not more:
+                    break
+                changed |= more
+            yield changed
+    finally:
+        watcher.close()
@@ -0,0 +1,157 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazycopy -- tests of pseudo-URLs of the list file
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from lazycopy import PseudoURL  # noqa: E402
+
+
+class PseudoURLTest(unittest.TestCase):
+    def assertRoundTrip(self, entries, expected=None):
+        """Check that entries come back from the line they are written as"""
+        line = str(PseudoURL(entries))
+        if expected is not None:
+            self.assertEqual(line, expected)
+        parsed = PseudoURL.parse(line)
+        unique = list(dict.fromkeys(entries))
+        self.assertEqual(list(parsed), unique)
+        self.assertEqual(str(parsed), line)
+        return line
+
+    def test_empty(self):
+        self.assertEqual(list(PseudoURL.parse('')), [])
+        self.assertEqual(list(PseudoURL.parse('wml://')), [])
+
+    def test_single_entry(self):
+        self.assertRoundTrip(['News/2024/item.wml'],
+                             'wml://{News/2024/item.wml}')
+
+    def test_no_common_prefix_or_suffix(self):
+        self.assertRoundTrip(['about.wml', 'intro/index.src'],
+                             'wml://{about.wml,intro/index.src}')
+
+    def test_common_prefix_and_suffix(self):
+        self.assertRoundTrip(['devel/a.wml', 'devel/b.wml', 'devel/c.wml'],
+                             'wml://devel/{a,b,c}.wml')
+
+    def test_entry_prefix_of_another(self):
+        self.assertRoundTrip(['foo', 'foobar'], 'wml://foo{,bar}')
+        self.assertRoundTrip(['foobar', 'foo'], 'wml://foo{bar,}')
+
+    def test_prefix_and_suffix_overlap(self):
+        # Common prefix 'ab' and suffix 'ab' of 'ab' overlap, the suffix
+        # is clamped so the shortest entry is not counted twice
+        self.assertRoundTrip(['ab', 'abab'], 'wml://ab{,ab}')
+        self.assertRoundTrip(['abc', 'abxbc'], 'wml://ab{,xb}c')
+        self.assertRoundTrip(['aba', 'aba/ba', 'ab'])
+
+    def test_duplicates_are_skipped(self):
+        url = PseudoURL(['a.wml'])
+        self.assertFalse(url.add('a.wml'))
+        self.assertTrue(url.add('b.wml'))
+        self.assertFalse(url.add('b.wml'))
+        self.assertEqual(list(url), ['a.wml', 'b.wml'])
+        self.assertRoundTrip(['a.wml', 'b.wml', 'a.wml'], 'wml://{a,b}.wml')
+
+    def test_adding_to_parsed_line(self):
+        url = PseudoURL.parse('wml://devel/{a,b}.wml\n')
+        url.add('devel/c.wml')
+        url.add('News/d.wml')
+        self.assertEqual(list(PseudoURL.parse(str(url))),
+                         ['devel/a.wml', 'devel/b.wml', 'devel/c.wml',
+                          'News/d.wml'])
+
+    def test_add_keeps_entries_recoverable(self):
+        generator = random.Random(0)
+        words = ['a', 'b', 'ab', 'ba', '/', '.wml', 'x/', '']
+        for _ in range(500):
+            entries = [''.join(generator.choice(words)
+                               for _ in range(generator.randint(1, 4)))
+                       for _ in range(generator.randint(1, 6))]
+            entries = [entry for entry in entries if entry]
+            url = PseudoURL()
+            for num, entry in enumerate(entries):
+                url.add(entry)
+                self.assertEqual(list(PseudoURL.parse(str(url))),
+                                 list(dict.fromkeys(entries[:num + 1])))
+            if entries:
+                self.assertRoundTrip(entries)
+
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class CopyOriginalsTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='lazycopy-test-')
+        os.mkdir(os.path.join(self.directory, 'english'))
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.org')
+        self.git('config', 'user.name', 'Test')
+        self.write('english/committed.wml')
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', 'pages')
+        self.write('english/untracked.wml')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def git(self, *args):
+        subprocess.run(['git'] + list(args), cwd=self.directory, check=True)
+
+    def write(self, path):
+        with open(os.path.join(self.directory, path), 'w') as page:
+            page.write('#use wml::debian::template title="Page"\n\ntext\n')
+
+    def lazycopy(self, *paths):
+        return subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'lazycopy.py'), '--no-daemon',
+             '-l', 'russian', '-nc', '-nu', '-ne', '-nd',
+             '-t', self.directory,
+             '-f', os.path.join(self.directory, 'list.tmp')] + list(paths),
+            cwd=self.directory, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+
+    def test_copies_committed_original(self):
+        result = self.lazycopy('english/committed.wml')
+        self.assertEqual(result.returncode, 0, result.stderr)
+        with open(os.path.join(self.directory,
+                               'russian/committed.wml')) as page:
+            self.assertIn('#use wml::debian::translation-check translation="',
+                          page.read())
+
+    def test_original_without_revision_changes_nothing(self):
+        result = self.lazycopy('english/committed.wml',
+                               'english/untracked.wml')
+        self.assertEqual(result.returncode, 1)
+        self.assertNotIn('Traceback', result.stderr)
+        self.assertIn('english/untracked.wml has no revision', result.stdout)
+        self.assertFalse(os.path.exists(os.path.join(self.directory,
+                                                     'russian')))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazydiff -- tests of the GNU diff compatible output of lazydiff
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lazydiff  # noqa: E402
+
+# Pages compared and the output GNU diff 3.8 gives for them, with old.wml
+# and new.wml given as relative paths, in UTC, with the times below
+DATA = os.path.join(ROOT, 'tests', 'data', 'lazydiff')
+TIMES = (('old.wml', 1704164645123456789), ('new.wml', 1706933106500000000))
+
+
+class ParseDiffArgsTest(unittest.TestCase):
+    def parse(self, *args):
+        options = lazydiff.parse_diff_args(args)
+        return (options.style, options.context, options.width,
+                options.ignore, options.minimal)
+
+    def test_unified(self):
+        self.assertEqual(self.parse('-u'),
+                         ('unified', 3, 130, None, False))
+        self.assertEqual(self.parse('-U', '5'),
+                         ('unified', 5, 130, None, False))
+        self.assertEqual(self.parse('-U1'),
+                         ('unified', 1, 130, None, False))
+        self.assertEqual(self.parse('--unified=2'),
+                         ('unified', 2, 130, None, False))
+        # -u after -U sets the context back to its default
+        self.assertEqual(self.parse('-U1', '-u'),
+                         ('unified', 3, 130, None, False))
+
+    def test_side_by_side(self):
+        self.assertEqual(self.parse('-y'),
+                         ('side-by-side', 3, 130, None, False))
+        self.assertEqual(self.parse('-yw', '--minimal'),
+                         ('side-by-side', 3, 130, 'all-space', True))
+        self.assertEqual(self.parse('-y', '-W', '60'),
+                         ('side-by-side', 3, 60, None, False))
+        self.assertEqual(self.parse('-W60'),
+                         ('normal', 3, 60, None, False))
+        self.assertEqual(self.parse('--side-by-side', '--width=80'),
+                         ('side-by-side', 3, 80, None, False))
+
+    def test_weaker_ignore_does_not_override(self):
+        self.assertEqual(self.parse('-w', '-b')[3], 'all-space')
+        self.assertEqual(self.parse('-Z', '-b')[3], 'space-change')
+
+    def test_unsupported_options(self):
+        for args in (('-q',), ('--brief',), ('-U',), ('-U', 'x'),
+                     ('-W', '0'), ('--minimal=1',), ('old.wml',)):
+            self.assertRaises(ValueError, lazydiff.parse_diff_args, args)
+
+
+class DiffLinesTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.tz = os.environ.get('TZ')
+        self.directory = tempfile.mkdtemp(prefix='lazydiff-test-')
+        for name, mtime in TIMES:
+            shutil.copy(os.path.join(DATA, name), self.directory)
+            os.utime(os.path.join(self.directory, name), ns=(mtime, mtime))
+        os.chdir(self.directory)
+        os.environ['TZ'] = 'UTC'
+        time.tzset()
+
+    def tearDown(self):
+        if self.tz is None:
+            del os.environ['TZ']
+        else:
+            os.environ['TZ'] = self.tz
+        time.tzset()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def assertDiff(self, expected, *args):
+        with open(os.path.join(DATA, expected), newline='') as diff:
+            expected = diff.read()
+        found = ''.join(lazydiff.diff_lines(
+            'old.wml', 'new.wml', lazydiff.parse_diff_args(args)))
+        self.assertEqual(found, expected)
+
+    def test_normal(self):
+        self.assertDiff('normal.diff')
+
+    def test_unified(self):
+        self.assertDiff('u.diff', '-u')
+
+    def test_unified_context(self):
+        self.assertDiff('U1.diff', '-U', '1')
+
+    def test_side_by_side(self):
+        self.assertDiff('y.diff', '-y')
+
+    def test_side_by_side_ignoring_space(self):
+        self.assertDiff('yw-minimal.diff', '-yw', '--minimal')
+
+    def test_side_by_side_width(self):
+        self.assertDiff('yW60.diff', '-y', '-W', '60')
+
+    def test_same_files(self):
+        for args in ((), ('-u',)):
+            self.assertEqual(list(lazydiff.diff_lines(
+                'old.wml', 'old.wml', lazydiff.parse_diff_args(args))), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,230 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazyhttp -- tests of the cache of stats pages
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import http.server
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import lazyhttp  # noqa: E402
+import synthetic  # noqa: E402
+
+
+class _RecordingPool(lazyhttp.ConnectionPool):
+    """Connection pool remembering the status of every response"""
+
+    def __init__(self):
+        lazyhttp.ConnectionPool.__init__(self, timeout=10)
+        self.statuses = []
+
+    def request(self, url, headers=None):
+        response = lazyhttp.ConnectionPool.request(self, url, headers)
+        self.statuses.append(response.status)
+        return response
+
+
+class HTTPCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.server = synthetic.StatsServer({'russian': 'first version',
+                                             'german': 'other page'})
+        self.directory = tempfile.mkdtemp(prefix='lazyhttp-test-')
+        self.pool = _RecordingPool()
+        self.url = self.server.base_url + 'russian'
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def cache(self, **options):
+        return lazyhttp.HTTPCache(self.directory, pool=self.pool, **options)
+
+    @staticmethod
+    def read(cache, url):
+        with cache.open(url) as page:
+            return page.read().decode('utf-8')
+
+    def test_fresh_hit_does_not_ask_server(self):
+        cache = self.cache()
+        self.assertEqual(self.read(cache, self.url), 'first version')
+        self.assertEqual(self.read(cache, self.url), 'first version')
+        self.assertEqual(self.pool.statuses, [200])
+
+    def test_revalidation_with_304_keeps_entry(self):
+        cache = self.cache(max_age=0)
+        self.read(cache, self.url)
+        stored = cache.lookup(self.url)['stored']
+        time.sleep(0.01)
+        self.assertEqual(self.read(cache, self.url), 'first version')
+        self.assertEqual(self.pool.statuses, [200, 304])
+        self.assertGreater(cache.lookup(self.url)['stored'], stored)
+
+    def test_200_replaces_entry(self):
+        cache = self.cache(max_age=0)
+        self.read(cache, self.url)
+        self.server.add('russian', 'second, longer version')
+        self.assertEqual(self.read(cache, self.url),
+                         'second, longer version')
+        self.assertEqual(self.pool.statuses, [200, 200])
+        self.assertEqual(cache.lookup(self.url)['size'],
+                         len('second, longer version'))
+        # The new entry is served from the cache from now on
+        self.assertEqual(self.read(self.cache(), self.url),
+                         'second, longer version')
+        self.assertEqual(self.pool.statuses, [200, 200])
+
+    def test_truncated_body_is_fetched_again(self):
+        cache = self.cache()
+        self.read(cache, self.url)
+        with open(cache.paths(self.url)[1], 'r+b') as body:
+            body.truncate(5)
+        self.assertEqual(self.read(cache, self.url), 'first version')
+        self.assertEqual(self.pool.statuses, [200, 200])
+
+    def test_corrupted_metadata_is_fetched_again(self):
+        cache = self.cache()
+        self.read(cache, self.url)
+        with open(cache.paths(self.url)[0], 'w') as meta:
+            meta.write('{"url": ')
+        self.assertIsNone(cache.lookup(self.url))
+        self.assertFalse(os.path.exists(cache.paths(self.url)[1]))
+        self.assertEqual(self.read(cache, self.url), 'first version')
+        self.assertEqual(self.pool.statuses, [200, 200])
+
+    def test_unfinished_read_is_not_stored(self):
+        cache = self.cache()
+        with cache.open(self.url) as page:
+            page.read(3)
+        self.assertIsNone(cache.lookup(self.url))
+        self.assertEqual([name for name in os.listdir(cache.directory)
+                          if name.endswith('.tmp')], [])
+
+    def test_offline_without_entry_raises_cache_miss(self):
+        cache = self.cache(offline=True)
+        self.assertRaises(lazyhttp.CacheMiss, cache.open, self.url)
+        self.assertEqual(self.pool.statuses, [])
+
+    def test_offline_serves_old_entry(self):
+        self.read(self.cache(), self.url)
+        cache = self.cache(offline=True, max_age=0)
+        self.assertEqual(self.read(cache, self.url), 'first version')
+        self.assertEqual(self.pool.statuses, [200])
+
+    def test_entries_unused_for_max_keep_are_evicted(self):
+        cache = self.cache(max_keep=3600)
+        self.read(cache, self.url)
+        old = time.time() - 7200
+        os.utime(cache.paths(self.url)[1], (old, old))
+        cache.evict()
+        self.assertIsNone(cache.lookup(self.url))
+
+    def test_oldest_entries_over_max_size_are_evicted(self):
+        other = self.server.base_url + 'german'
+        cache = self.cache(max_size=len('first version') + 1)
+        self.read(cache, self.url)
+        old = time.time() - 60
+        os.utime(cache.paths(self.url)[1], (old, old))
+        self.read(cache, other)
+        self.assertIsNone(cache.lookup(self.url))
+        self.assertIsNotNone(cache.lookup(other))
+
+
+
+class _ProxyHandler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        self.server.requests.append((self.command, self.path,
+                                     dict(self.headers)))
+        self.send_response(200)
+        self.send_header('Content-Length', '7')
+        self.end_headers()
+        self.wfile.write(b'proxied')
+
+    def do_CONNECT(self):
+        self.server.requests.append((self.command, self.path,
+                                     dict(self.headers)))
+        self.send_response(403)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ProxyTest(unittest.TestCase):
+    def setUp(self):
+        self.proxy = http.server.ThreadingHTTPServer(('127.0.0.1', 0),
+                                                     _ProxyHandler)
+        self.proxy.daemon_threads = True
+        self.proxy.requests = []
+        threading.Thread(target=self.proxy.serve_forever, daemon=True).start()
+        url = 'http://user:p%%40ss@%s:%d' % self.proxy.server_address
+        environ = dict((name, value) for name, value in os.environ.items()
+                       if not name.lower().endswith('_proxy'))
+        environ.update(http_proxy=url, https_proxy=url)
+        self.environ = mock.patch.dict(os.environ, environ, clear=True)
+        self.environ.start()
+        self.pool = lazyhttp.ConnectionPool(timeout=10)
+
+    def tearDown(self):
+        self.environ.stop()
+        self.proxy.shutdown()
+        self.proxy.server_close()
+
+    def test_http_asks_proxy_for_absolute_url(self):
+        with self.pool.request('http://www.example.org/stats?x=1') as page:
+            self.assertEqual(page.read(), b'proxied')
+        (command, path, headers), = self.proxy.requests
+        self.assertEqual((command, path),
+                         ('GET', 'http://www.example.org/stats?x=1'))
+        self.assertEqual(headers['Host'], 'www.example.org')
+        self.assertEqual(headers['User-Agent'], lazyhttp.USER_AGENT)
+        self.assertEqual(headers['Proxy-Authorization'],
+                         'Basic dXNlcjpwQHNz')
+
+    def test_https_is_tunnelled(self):
+        with self.assertRaises(OSError):
+            self.pool.request('https://www.example.org/stats')
+        (command, path, headers), = self.proxy.requests
+        self.assertEqual((command, path),
+                         ('CONNECT', 'www.example.org:443'))
+        self.assertEqual(headers['Proxy-Authorization'],
+                         'Basic dXNlcjpwQHNz')
+
+    def test_no_proxy_connects_directly(self):
+        server = synthetic.StatsServer({'russian': 'direct'})
+        try:
+            os.environ['no_proxy'] = '127.0.0.1'
+            with self.pool.request(server.base_url + 'russian') as page:
+                self.assertEqual(page.read(), b'direct')
+            self.assertEqual(self.proxy.requests, [])
+        finally:
+            server.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazyindex -- tests of the local index of translation status
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import os
+import shutil
+import sys
+import tempfile
+import types
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lazyindex  # noqa: E402
+
+HEADER = '#use wml::debian::translation-check translation="%s"\n'
+
+
+class _Metadata(object):
+    """Revisions of originals, as lazyvcs metadata indexes answer them"""
+
+    def __init__(self, revisions):
+        self.found = revisions
+
+    def revisions(self, paths):
+        return dict((path, self.found.get(path)) for path in paths)
+
+
+class _Sizer(object):
+    """Diff sizer counting the commands it is asked about"""
+
+    def __init__(self):
+        self.commands = []
+
+    def size(self, command):
+        self.commands.append(command)
+        return 3, 30
+
+
+class LocalScanTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix='lazyindex-test-')
+        os.chdir(self.directory)
+        for path, text in (('english/index.wml', 'index\n'),
+                           ('english/News/item.wml', 'news item\n'),
+                           ('english/about.wml', 'about\n'),
+                           ('russian/index.wml', HEADER % '1.1'),
+                           ('russian/about.wml', HEADER % '1.2')):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as page:
+                page.write(text)
+        self.metadata = _Metadata({'english/index.wml': '1.2',
+                                   'english/about.wml': '1.2'})
+        self.index = lazyindex.Index(os.path.join(self.directory,
+                                                  'index.sqlite'))
+        self.args = types.SimpleNamespace(force=False, jobs=1)
+
+    def tearDown(self):
+        self.index.close()
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def scan(self, sizer):
+        found = lazyindex.scan('russian',
+                               self.index.digests().get('russian'), None,
+                               sizer, None, self.args, self.metadata)
+        if found[1] is not None:
+            self.index.replace('russian', found[0], found[1],
+                               sizer is not None)
+        return found[1]
+
+    def test_pages_of_checkout(self):
+        pages = self.scan(None)
+        self.assertEqual(sorted(page[1:6] for page in pages), [
+            ('News/item.wml', 'untranslated', 'untranslated-news', 10,
+             None),
+            ('index.wml', 'outdated', None, None, None)])
+        self.assertEqual([page[7:] for page in pages
+                          if page[2] == 'outdated'],
+                         [('1.1', '1.2',
+                           'cvs diff -u -r 1.1 -r 1.2 english/index.wml')])
+
+    def test_revisions_of_git_checkout(self):
+        old, new = 'abc1234', 'def5678' + '0' * 33
+        with open('russian/index.wml', 'w') as page:
+            page.write(HEADER % old)
+        self.metadata = _Metadata({'english/index.wml': new})
+        pages = self.scan(None)
+        self.assertEqual([page[7:] for page in pages
+                          if page[2] == 'outdated'],
+                         [(old, new, 'git diff abc1234..def5678 -- '
+                           'english/index.wml')])
+        self.assertEqual(
+            self.index.connection.execute(
+                'SELECT old, new FROM pages WHERE status = ?',
+                ('outdated',)).fetchall(), [(old, new)])
+
+    def test_sizes_asked_for_later_scan_again(self):
+        self.assertIsNotNone(self.scan(None))
+        self.assertIsNone(self.scan(None))
+        self.assertEqual(self.index.digests()['russian'][1], False)
+        sizer = _Sizer()
+        pages = self.scan(sizer)
+        self.assertEqual(len(sizer.commands), 1)
+        self.assertIn(('index.wml', 3, 30),
+                      [(page[1], page[5], page[6]) for page in pages])
+        self.assertEqual(self.index.digests()['russian'][1], True)
+        # Sizes are there now, with or without them asked for
+        self.assertIsNone(self.scan(_Sizer()))
+        self.assertIsNone(self.scan(None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazyscan -- tests of originals of translated pages
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lazyscan  # noqa: E402
+import lazyvcs  # noqa: E402
+
+HEADER = '#use wml::debian::translation-check translation="%s"\n'
+
+
+class OriginalPathTest(unittest.TestCase):
+    def setUp(self):
+        # Relative targets are taken from the current directory
+        self.top = os.getcwd()
+
+    def original(self, target, header=None):
+        return lazyscan.original_path(target, header or {}, self.top)
+
+    def test_relative_and_absolute_targets(self):
+        self.assertEqual(self.original('russian/News/2024/item.wml'),
+                         'english/News/2024/item.wml')
+        self.assertEqual(self.original(os.path.join(self.top, 'russian',
+                                                    'index.wml')),
+                         'english/index.wml')
+
+    def test_original_language_of_header(self):
+        self.assertEqual(self.original('russian/a.wml',
+                                       {'original': 'german'}),
+                         'german/a.wml')
+
+    def test_targets_outside_top_are_rejected(self):
+        for target in (os.path.join(os.path.dirname(self.top), 'x.wml'),
+                       os.path.join(self.top, 'index.wml'),
+                       '../russian/a.wml'):
+            self.assertRaises(ValueError, self.original, target)
+
+
+
+
+class HeaderTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='lazyscan-test-')
+        self.path = os.path.join(self.directory, 'page.wml')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, text, mode=0o644):
+        with open(self.path, 'wb') as page:
+            page.write(text)
+        os.chmod(self.path, mode)
+
+    def read(self):
+        with open(self.path, 'rb') as page:
+            return page.read()
+
+    def test_read_header(self):
+        self.write(b'#use wml::debian::template title="Page"\n'
+                   b'#use wml::debian::translation-check translation="1.5" '
+                   b'maintainer="Jos\xc3\xa9" original="german"\n\ntext\n')
+        self.assertEqual(lazyscan.read_header(self.path),
+                         {'translation': '1.5', 'maintainer': 'Jos\xe9',
+                          'original': 'german'})
+
+    def test_read_header_only_in_leading_lines(self):
+        self.write(b'#use wml::debian::template title="Page"\n\n' +
+                   (HEADER % '1.5').encode('ascii'))
+        self.assertIsNone(lazyscan.read_header(self.path))
+        self.write(b'')
+        self.assertIsNone(lazyscan.read_header(self.path))
+
+    def test_update_header(self):
+        body = b'\ntext\r\n\xff not UTF-8\n' + b'x' * 100000 + b'\nend'
+        self.write(b'#use wml::debian::template title="Page"\n'
+                   b'#use wml::debian::translation-check translation="abc" '
+                   b'maintainer="Someone"\n' + body, 0o640)
+        self.assertTrue(lazyscan.update_header(self.path, 'def1234'))
+        self.assertEqual(self.read(),
+                         b'#use wml::debian::template title="Page"\n'
+                         b'#use wml::debian::translation-check '
+                         b'translation="def1234" maintainer="Someone"\n' +
+                         body)
+        self.assertEqual(os.stat(self.path).st_mode & 0o7777, 0o640)
+        self.assertEqual(os.listdir(self.directory), ['page.wml'])
+
+    def test_page_without_header_is_left_alone(self):
+        for text in (b'#use wml::debian::template title="Page"\n\ntext\n'
+                     b'#use wml::debian::translation-check '
+                     b'translation="abc"\n',
+                     b'#use wml::debian::translation-check '
+                     b'maintainer="Someone"\n', b''):
+            self.write(text)
+            self.assertFalse(lazyscan.update_header(self.path, 'def1234'))
+            self.assertEqual(self.read(), text)
+            self.assertEqual(os.listdir(self.directory), ['page.wml'])
+
+    def test_missing_page_leaves_no_temporary_file(self):
+        self.assertRaises(OSError, lazyscan.update_header,
+                          os.path.join(self.directory, 'gone.wml'), 'abc')
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class GitAncestryTest(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.mkdtemp(prefix='lazyscan-test-')
+        os.chdir(self.directory)
+        os.mkdir('english')
+        os.mkdir('russian')
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.org')
+        self.git('config', 'user.name', 'Test')
+        self.first = self.commit(('english/kept.wml', 'english/changed.wml'))
+        self.later = self.commit(('english/other.wml',))
+        self.last = self.commit(('english/changed.wml',))
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.directory)
+
+    def git(self, *args):
+        return subprocess.run(['git'] + list(args), stdout=subprocess.PIPE,
+                              check=True).stdout.decode('utf-8').strip()
+
+    def commit(self, paths):
+        for path in paths:
+            with open(path, 'a') as page:
+                page.write('line\n')
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', 'pages')
+        return self.git('rev-parse', 'HEAD')
+
+    def translate(self, path, revision):
+        with open('russian/' + path, 'w') as page:
+            page.write(HEADER % revision)
+
+    def test_later_translation_revisions_are_up_to_date(self):
+        self.translate('kept.wml', self.later[:7])
+        self.translate('other.wml', self.last)
+        self.translate('changed.wml', self.later[:7])
+        self.translate('unknown.wml', 'deadbeef')
+        with open('english/unknown.wml', 'w') as page:
+            page.write('unknown\n')
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', 'unknown')
+        metadata = lazyvcs.GitMetadata()
+        self.assertEqual(
+            sorted(page[:3] for page in
+                   lazyscan.outdated_pages('russian', metadata)),
+            [('changed.wml', self.later[:7], self.last),
+             ('unknown.wml', 'deadbeef', self.git('rev-parse', 'HEAD'))])
+
+    def test_newer_originals(self):
+        pairs = [(self.last, self.first), (self.first, self.later[:7]),
+                 (self.first, self.first[:10]), (self.later, 'abcdef0'),
+                 ('1.10', '1.9'), ('1.9', '1.10')]
+        self.assertEqual(lazyscan.newer_originals(pairs),
+                         set([(self.last, self.first),
+                              (self.later, 'abcdef0'), ('1.10', '1.9')]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazystats -- tests of the streaming stats page parser
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import io
+import os
+import random
+import sys
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import lazystats  # noqa: E402
+import lazyup  # noqa: E402
+import synthetic  # noqa: E402
+
+PAGE = '''<h2><a name="untranslated">Untranslated</a></h2>
+<table>
+<tr><td><a title="a" href="/a">a</a></td><td align="right">120</td></tr>
+<tr><td><a title="b" href="/b">b</a></td><td align="right"></td></tr>
+<tr><td><a title="c" href="/c">c</a></td><td align="right">n/a</td></tr>
+<tr><td><a title="d" href="/d">d</a></td>
+<td align="right"><b>4</b>5</td></tr>
+<tr><td><a title="e" href="/e">e</a></td><td align="right"> 7
+</td></tr>
+</table>
+'''
+
+
+def parse(text, chunk_size=65536):
+    return list(lazystats.iter_rows(io.BytesIO(text.encode('utf-8')),
+                                    chunk_size=chunk_size))
+
+
+class StatsParserTest(unittest.TestCase):
+    def test_sizes_of_cells(self):
+        # Empty and non-numeric cells are skipped, sizes split by tags
+        # are joined
+        self.assertEqual(parse(PAGE), [
+            lazystats.Untranslated('a', 120, 'untranslated'),
+            lazystats.Untranslated('d', 45, 'untranslated'),
+            lazystats.Untranslated('e', 7, 'untranslated')])
+
+    def test_chunks_do_not_change_rows(self):
+        page = synthetic.stats_page(200)
+        whole = list(lazystats.iter_rows(io.BytesIO(page.encode('utf-8')),
+                                         outdated=True))
+        self.assertEqual(len([row for row in whole
+                              if isinstance(row, lazystats.Untranslated)]),
+                         200)
+        for chunk_size in (1, 7, 4096):
+            self.assertEqual(list(lazystats.iter_rows(
+                io.BytesIO(page.encode('utf-8')), outdated=True,
+                chunk_size=chunk_size)), whole)
+
+
+
+class SortRowsTest(unittest.TestCase):
+    # Entries of lazyup: path, lines, chars and command of the diff
+    ENTRIES = [('b.wml', 10, 300, 'diff b'), ('a.wml', 10, 300, 'diff a'),
+               ('c.wml', 2, 900, 'diff c'), ('d.wml', 10, 100, 'diff d')]
+
+    def paths(self, *args, **kwargs):
+        return [entry[0] for entry in lazystats.sort_rows(
+            iter(self.ENTRIES), *args, **kwargs)]
+
+    def test_sort_keys(self):
+        self.assertEqual(self.paths(lazyup.SORT_KEYS['lines']),
+                         ['c.wml', 'd.wml', 'a.wml', 'b.wml'])
+        self.assertEqual(self.paths(lazyup.SORT_KEYS['chars']),
+                         ['d.wml', 'a.wml', 'b.wml', 'c.wml'])
+        self.assertEqual(self.paths(lazyup.SORT_KEYS['lines'], True),
+                         ['b.wml', 'a.wml', 'd.wml', 'c.wml'])
+
+    def test_ties_keep_order(self):
+        lines = lambda entry: entry[1]  # noqa: E731
+        self.assertEqual(self.paths(lines),
+                         ['c.wml', 'b.wml', 'a.wml', 'd.wml'])
+        self.assertEqual(self.paths(lines, True),
+                         ['b.wml', 'a.wml', 'd.wml', 'c.wml'])
+        self.assertEqual(self.paths(lines, top=3),
+                         ['c.wml', 'b.wml', 'a.wml'])
+        self.assertEqual(self.paths(lines, True, 2), ['b.wml', 'a.wml'])
+
+    def test_top(self):
+        key = lazyup.SORT_KEYS['lines']
+        self.assertEqual(self.paths(key, top=1), ['c.wml'])
+        self.assertEqual(self.paths(key, True, 1), ['b.wml'])
+        for top in (4, 10):
+            self.assertEqual(self.paths(key, top=top), self.paths(key))
+            self.assertEqual(self.paths(key, True, top),
+                             self.paths(key, True))
+        for top in (0, -1):
+            self.assertEqual(self.paths(key, top=top), [])
+            self.assertEqual(self.paths(key, True, top), [])
+
+    def test_top_rows_match_sorted(self):
+        generator = random.Random(0)
+        key = lambda row: row[0]  # noqa: E731
+        for _ in range(200):
+            rows = [(generator.randint(0, 5), num)
+                    for num in range(generator.randint(0, 20))]
+            count = generator.randint(1, 25)
+            for reverse in (False, True):
+                self.assertEqual(
+                    lazystats.top_rows(iter(rows), count, key, reverse),
+                    sorted(rows, key=key, reverse=reverse)[:count])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazytiming -- tests of timings and profiles of runs
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.join(ROOT, 'benchmarks'))
+
+import synthetic  # noqa: E402
+
+
+class ProfileTest(unittest.TestCase):
+    def setUp(self):
+        self.server = synthetic.StatsServer({
+            'russian': synthetic.stats_page(20),
+            'german': synthetic.stats_page(20, seed=1)})
+        self.directory = tempfile.mkdtemp(prefix='lazytiming-test-')
+
+    def tearDown(self):
+        self.server.close()
+        shutil.rmtree(self.directory)
+
+    def test_profile_with_several_jobs(self):
+        # Languages and diffs run on pools of threads while profiled
+        profile = os.path.join(self.directory, 'profile')
+        result = subprocess.run(
+            [sys.executable, os.path.join(ROOT, 'lazyup.py'), '--no-daemon',
+             '--no-http-cache', '--base-url', self.server.base_url,
+             '--exec-diff', '-j', '2', '-w', '2', '--format', 'jsonl',
+             '--profile', profile, 'russian', 'german'],
+            cwd=self.directory, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE, universal_newlines=True)
+        self.assertNotIn('Traceback', result.stderr)
+        self.assertNotIn('profiling', result.stderr)
+        self.assertEqual(result.returncode, 0, result.stderr)
+        stats = pstats.Stats(profile)
+        self.assertTrue(any(function[2] == 'iter_rows'
+                            for function in stats.stats))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,127 @@
+#!/usr/bin/python3
+
+########################################################################
+#
+# test_lazyup -- tests of in-process sizes of git diffs
+#
+# Copyright (C) 2024  Lev Lamberov <dogsleg@debian.org>
+#
+# This program is licensed under the GNU General Public License (GPL).
+# you can redistribute it and/or modify it under the terms of the GNU
+# General Public License as published by the Free Software Foundation,
+# Inc., 59 Temple Place, Suite 330, Boston, MA 02111-1307 USA; either
+# version 3 of the License, or (at your option) any later version.
+# The GPL is available online at http://www.gnu.org/copyleft/gpl.html
+# or in /usr/share/common-licenses/GPL-3
+#
+########################################################################
+
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import lazydiff  # noqa: E402
+import lazyup  # noqa: E402
+
+PATHS = ('dir/changed.wml', 'mode.wml', 'dir/removed.wml', 'empty.wml',
+         'added.wml', 'dir/empty.wml')
+
+
+@unittest.skipIf(shutil.which('git') is None, 'git is not installed')
+class DiffSizerTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp(prefix='lazyup-test-')
+        self.git('init', '-q')
+        self.git('config', 'user.email', 'test@example.org')
+        self.git('config', 'user.name', 'Test')
+        self.write('dir/changed.wml', 'a\nb\nc\n')
+        self.write('mode.wml', 'same\n')
+        self.write('dir/removed.wml', 'gone\n')
+        self.write('empty.wml', '')
+        self.commit()
+        self.write('dir/changed.wml', 'a\nB\nc\nd\n', 0o755)
+        os.chmod(os.path.join(self.directory, 'mode.wml'), 0o755)
+        self.git('rm', '-q', 'dir/removed.wml', 'empty.wml')
+        self.write('added.wml', 'new\n')
+        self.write('dir/empty.wml', '')
+        self.commit()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def git(self, *args):
+        return subprocess.run(['git'] + list(args), cwd=self.directory,
+                              stdout=subprocess.PIPE,
+                              check=True).stdout.decode('utf-8')
+
+    def write(self, path, text, mode=0o644):
+        path = os.path.join(self.directory, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as page:
+            page.write(text)
+        os.chmod(path, mode)
+
+    def commit(self):
+        self.git('add', '-A')
+        self.git('commit', '-q', '-m', 'pages')
+
+    def test_diffs_match_git(self):
+        sizer = lazyup.DiffSizer(True, self.directory)
+        try:
+            for path in PATHS:
+                expected = self.git('diff', 'HEAD~1..HEAD', '--', path)
+                found = ''.join(lazydiff.git_diff_lines(
+                    path, sizer.blob('HEAD~1', path),
+                    sizer.blob('HEAD', path), sizer.abbrev, sizer.shorten))
+                self.assertEqual(found, expected, path)
+                self.assertEqual(
+                    sizer.size('git diff HEAD~1..HEAD -- ' + path),
+                    (expected.count('\n'), len(expected)))
+        finally:
+            sizer.close()
+
+    def test_abbreviations_are_unique(self):
+        self.git('config', 'core.abbrev', '4')
+        for num in range(300):
+            self.write('many/%d.wml' % num, 'page %d\n' % num)
+        self.commit()
+        sizer = lazyup.DiffSizer(True, self.directory)
+        try:
+            self.assertEqual(sizer.abbrev, 4)
+            names = self.git('rev-list', '--objects', '--all').split()
+            for name in names:
+                if len(name) == 40:
+                    self.assertEqual(sizer.shorten(name),
+                                     self.git('rev-parse', '--short',
+                                              name).strip())
+        finally:
+            sizer.close()
+
+    def test_configuration_does_not_change_sizes(self):
+        expected = {path: self.git('diff', 'HEAD~1..HEAD', '--', path)
+                    for path in PATHS}
+        for setting in ('diff.noprefix=true', 'diff.algorithm=patience',
+                        'diff.indentHeuristic=false', 'diff.context=1',
+                        'diff.mnemonicPrefix=true', 'color.diff=always'):
+            self.git('config', *setting.split('='))
+        sizer = lazyup.DiffSizer(True, self.directory)
+        try:
+            self.assertIsNotNone(sizer.cat_file)
+            for path in PATHS:
+                command = 'git diff HEAD~1..HEAD -- ' + path
+                size = (expected[path].count('\n'), len(expected[path]))
+                self.assertEqual(sizer.size(command), size, path)
+                self.assertEqual(lazyup.diff_size(command, self.directory),
+                                 size, path)
+        finally:
+            sizer.close()
+
+
+if __name__ == '__main__':
+    unittest.main()